@@ -28,6 +28,11 @@ def create_app():
     except ImportError:
         print("⚠️  Using default configuration (config.py not found)")
     
+    # Client address from the X-Forwarded-For entries our own proxies appended
+    if app.config.get('PROXY_FIX_X_FOR'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
     # ✅ CORS Configuration - More permissive for development
     CORS(app, 
          origins=["http://localhost:5173", "http://127.0.0.1:5173"], 
@@ -35,10 +40,21 @@ def create_app():
          allow_headers=["Content-Type", "Authorization"],
          methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"])
 
+    # A per-process dashboard cache cannot be invalidated across several workers
+    from utils.response_cache import check_config as check_dashboard_cache_config
+    check_dashboard_cache_config(app.config)
+
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+
+    # Reject revoked tokens on every protected endpoint
+    try:
+        from utils.token_store import register_jwt_callbacks
+        register_jwt_callbacks(jwt)
+    except Exception as e:
+        print(f"⚠️  Could not register token revocation check: {e}")
     
     # Import models (try different import paths)
     try:
@@ -86,6 +102,36 @@ def create_app():
         except Exception as e:
             print(f"❌ Error registering {module_name}: {e}")
     
+    # Register CLI command groups (flask <group> <command>)
+    cli_modules = [
+        ('utils.competition_scheduler', 'competitions_cli'),
+        ('utils.bulk_import', 'users_cli'),
+        ('utils.school_stats', 'schools_cli'),
+        ('utils.attendance_rollup', 'attendance_cli'),
+        ('utils.enrollment_trends', 'enrollment_cli'),
+    ]
+
+    for module_name, group_name in cli_modules:
+        try:
+            module = __import__(module_name, fromlist=[group_name])
+            app.cli.add_command(getattr(module, group_name))
+        except Exception as e:
+            print(f"⚠️  Could not register CLI group {group_name}: {e}")
+
+    # Keep ?jwt= tokens (leaderboard stream) out of request logs
+    try:
+        from utils.leaderboard_stream import install_log_redaction
+        install_log_redaction(app.config.get('JWT_QUERY_STRING_NAME', 'jwt'))
+    except Exception as e:
+        print(f"⚠️  Could not install log redaction: {e}")
+
+    # Background services
+    try:
+        from utils.competition_scheduler import init_scheduler
+        init_scheduler(app)
+    except Exception as e:
+        print(f"⚠️  Could not initialise competition scheduler: {e}")
+
     # Add error handlers
     @app.errorhandler(404)
     def not_found(error):
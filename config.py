@@ -13,9 +13,75 @@ class Config:
     # JWT configuration
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = False
+    # Only the leaderboard stream accepts ?jwt= (EventSource cannot send headers); such URLs are redacted from request logs
+    JWT_QUERY_STRING_NAME = 'jwt'
     
     # CORS settings
     CORS_ORIGINS = ['http://localhost:5173', 'http://127.0.0.1:5173']
     
+    # Competition deadline scheduler (see utils/competition_scheduler.py)
+    COMPETITION_SCHEDULER_IN_PROCESS = os.environ.get('COMPETITION_SCHEDULER_IN_PROCESS', 'false').lower() == 'true'
+    COMPETITION_SCHEDULER_REFRESH_SECONDS = int(os.environ.get('COMPETITION_SCHEDULER_REFRESH_SECONDS', 60))
+
+    # How long a process trusts its in-memory leaderboards before re-reading them
+    LEADERBOARD_CACHE_SECONDS = int(os.environ.get('LEADERBOARD_CACHE_SECONDS', 5))
+
+    # Live leaderboard streams: at most one broadcast per interval, re-read every heartbeat.
+    # Each viewer holds a worker thread for as long as it watches, so only enable this on a
+    # threaded or async gunicorn worker (render.yaml runs gthread), never the default sync worker
+    LEADERBOARD_STREAM_ENABLED = os.environ.get('LEADERBOARD_STREAM_ENABLED', 'true').lower() == 'true'
+    # Viewers per process; keep it well below gunicorn's --threads so API requests always get one
+    LEADERBOARD_STREAM_MAX_VIEWERS = int(os.environ.get('LEADERBOARD_STREAM_MAX_VIEWERS', 16))
+    LEADERBOARD_STREAM_MIN_INTERVAL = float(os.environ.get('LEADERBOARD_STREAM_MIN_INTERVAL', 0.5))
+    LEADERBOARD_STREAM_HEARTBEAT_SECONDS = int(os.environ.get('LEADERBOARD_STREAM_HEARTBEAT_SECONDS', 15))
+
+    # Token revocation mirror refresh, full re-read, and /api/auth/verify result cache (utils/token_store.py)
+    TOKEN_REVOCATION_REFRESH_SECONDS = int(os.environ.get('TOKEN_REVOCATION_REFRESH_SECONDS', 5))
+    TOKEN_REVOCATION_RELOAD_SECONDS = int(os.environ.get('TOKEN_REVOCATION_RELOAD_SECONDS', 600))
+    TOKEN_VERIFY_CACHE_SECONDS = int(os.environ.get('TOKEN_VERIFY_CACHE_SECONDS', 30))
+
+    # gunicorn worker processes (gunicorn reads the same variable when --workers is not given)
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+    # Reverse proxies in front of the app (render.yaml: 1). request.remote_addr then comes from
+    # the X-Forwarded-For entries those proxies appended, never from ones the client wrote itself
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+
+    # Login throttling (utils/throttle.py): memory:// per process, or redis://... shared.
+    # Limits count failed attempts only; the IP limit is sized for a school behind one NAT
+    LOGIN_THROTTLE_ENABLED = os.environ.get('LOGIN_THROTTLE_ENABLED', 'true').lower() == 'true'
+    LOGIN_THROTTLE_STORAGE_URL = os.environ.get('LOGIN_THROTTLE_STORAGE_URL', 'memory://')
+    LOGIN_THROTTLE_IP_LIMIT = int(os.environ.get('LOGIN_THROTTLE_IP_LIMIT', 100))
+    LOGIN_THROTTLE_IP_WINDOW = int(os.environ.get('LOGIN_THROTTLE_IP_WINDOW', 300))
+    LOGIN_THROTTLE_ACCOUNT_LIMIT = int(os.environ.get('LOGIN_THROTTLE_ACCOUNT_LIMIT', 5))
+    LOGIN_THROTTLE_ACCOUNT_WINDOW = int(os.environ.get('LOGIN_THROTTLE_ACCOUNT_WINDOW', 900))
+    # Unknown-identifier cache; only used with a shared (redis) LOGIN_THROTTLE_STORAGE_URL
+    LOGIN_NEGATIVE_CACHE_SECONDS = int(os.environ.get('LOGIN_NEGATIVE_CACHE_SECONDS', 60))
+
+    # Bulk user import (utils/bulk_import.py): rows per transaction, password hashing processes
+    # (default: available CPUs, at most 4), and rows one HTTP upload may create. Each row costs
+    # ~0.2s of hashing, so the cap keeps an upload inside gunicorn's --timeout; larger rosters
+    # go through `flask users import`
+    BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', 500))
+    BULK_IMPORT_HASH_WORKERS = int(os.environ['BULK_IMPORT_HASH_WORKERS']) if os.environ.get('BULK_IMPORT_HASH_WORKERS') else None
+    BULK_IMPORT_HTTP_MAX_ROWS = int(os.environ.get('BULK_IMPORT_HTTP_MAX_ROWS', 200))
+
+    # Current-month enrollment trend cache (utils/enrollment_trends.py); closed months are stored
+    ENROLLMENT_TRENDS_CACHE_SECONDS = int(os.environ.get('ENROLLMENT_TRENDS_CACHE_SECONDS', 300))
+
+    # Dashboard widgets (utils/dashboard_widgets.py): shared thread pool size, per-dashboard
+    # time budget, and browser cache lifetime of the single-widget endpoints
+    DASHBOARD_WIDGET_WORKERS = int(os.environ.get('DASHBOARD_WIDGET_WORKERS', 4))
+    DASHBOARD_WIDGET_TIMEOUT = float(os.environ.get('DASHBOARD_WIDGET_TIMEOUT', 10))
+    DASHBOARD_WIDGET_MAX_AGE = int(os.environ.get('DASHBOARD_WIDGET_MAX_AGE', 30))
+
+    # Dashboard payload cache (utils/response_cache.py): memory:// per process, or redis://... shared.
+    # Entries are fresh for TTL seconds, then served stale for up to STALE more while one refresh runs.
+    # memory:// is refused when WEB_CONCURRENCY > 1: invalidation would only reach one worker
+    DASHBOARD_CACHE_ENABLED = os.environ.get('DASHBOARD_CACHE_ENABLED', 'true').lower() == 'true'
+    DASHBOARD_CACHE_URL = os.environ.get('DASHBOARD_CACHE_URL', 'memory://')
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 60))
+    DASHBOARD_CACHE_STALE = int(os.environ.get('DASHBOARD_CACHE_STALE', 300))
+
     # File upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
\ No newline at end of file
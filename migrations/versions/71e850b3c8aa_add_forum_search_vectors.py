@@ -0,0 +1,50 @@
+"""Add full-text search vectors to forums and forum replies
+
+Revision ID: 71e850b3c8aa
+Revises: f0b7dd1df70c
+Create Date: 2026-10-17 09:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '71e850b3c8aa'
+down_revision = 'f0b7dd1df70c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('forums', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    with op.batch_alter_table('forum_replies', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    # Backfill existing rows; new writes are handled by utils/forum_search.py
+    op.execute("""
+        UPDATE forums SET search_vector =
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    """)
+    op.execute("""
+        UPDATE forum_replies SET search_vector =
+            setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    """)
+
+    op.create_index('ix_forums_search_vector', 'forums', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_forum_replies_search_vector', 'forum_replies', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_forum_replies_search_vector', table_name='forum_replies', postgresql_using='gin')
+    op.drop_index('ix_forums_search_vector', table_name='forums', postgresql_using='gin')
+
+    with op.batch_alter_table('forum_replies', schema=None) as batch_op:
+        batch_op.drop_column('search_vector')
+
+    with op.batch_alter_table('forums', schema=None) as batch_op:
+        batch_op.drop_column('search_vector')
@@ -3,6 +3,7 @@ from datetime import datetime, date
 from extensions import db
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import TSVECTOR
 import uuid
 import json
 
@@ -55,6 +56,13 @@ class User(db.Model):
             "(role != 'teacher') OR (tsc_number IS NOT NULL OR national_id IS NOT NULL)",
             name='teacher_requires_id'
         ),
+        # Login lookups: student_login filters (school_id, admission_number),
+        # teacher_login (school_id, upper(tsc_number)) plus role/is_active
+        db.Index('ix_users_school_admission', 'school_id', 'admission_number'),
+        db.Index('ix_users_school_upper_tsc', 'school_id', db.func.upper(tsc_number)),
+        db.Index('ix_users_school_role_active', 'school_id', 'role', 'is_active'),
+        # Directory pages: keyset order within a school
+        db.Index('ix_users_school_name', 'school_id', 'last_name', 'first_name', 'id'),
     )
 
     def set_password(self, password):
@@ -65,7 +73,10 @@ class User(db.Model):
             return False
         return check_password_hash(self.password_hash, password)
     
-    def to_dict(self):
+    def to_dict(self, subjects=None):
+        # `subjects` lets callers pass teacher subjects they already fetched
+        if self.role == 'teacher' and subjects is None:
+            subjects = [subject.to_dict() for subject in self.subjects]
         return {
             'id': self.id,
             'email': self.email,
@@ -78,7 +89,7 @@ class User(db.Model):
             'tsc_number': self.tsc_number,
             'national_id': self.national_id,
             'grade_level': self.grade_level,
-            'subjects': [subject.to_dict() for subject in self.subjects] if self.role == 'teacher' else None,
+            'subjects': subjects if self.role == 'teacher' else None,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
@@ -194,7 +205,11 @@ class Enrollment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'school_id', 'academic_year', name='unique_user_school_year'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'school_id', 'academic_year', name='unique_user_school_year'),
+        # Monthly enrollment trends (utils/enrollment_trends.py)
+        db.Index('ix_enrollments_school_date', 'school_id', 'enrollment_date'),
+    )
 
     def to_dict(self):
         return {
@@ -210,6 +225,22 @@ class Enrollment(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+
+class EnrollmentMonthly(db.Model):
+    """
+    Enrollment movements per school and closed calendar month, computed once
+    from enrollments by utils/enrollment_trends.py. A row exists (possibly
+    all zeros) for every month that has been computed.
+    """
+    __tablename__ = 'enrollment_monthly'
+
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    enrolled = db.Column(db.Integer, nullable=False, default=0)
+    transferred = db.Column(db.Integer, nullable=False, default=0)
+    graduated = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 # ------------------ RESOURCE ------------------
 
 class Resource(db.Model):
@@ -293,6 +324,35 @@ class Attendance(db.Model):
     student = db.relationship('User', foreign_keys=[student_id])
     teacher = db.relationship('User', foreign_keys=[recorded_by])
     school = db.relationship('School', backref='attendance_records')
+
+
+class AttendanceDaily(db.Model):
+    """
+    Attendance marks per (school, class, date) by status, kept in step with
+    attendance_records by utils/attendance_rollup.py. Trend and rate queries
+    read these rows instead of the raw records.
+    """
+    __tablename__ = 'attendance_daily'
+
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('school_classes.id'), primary_key=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    excused = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'school_id': self.school_id,
+            'class_id': self.class_id,
+            'date': self.date.isoformat(),
+            'present': self.present,
+            'absent': self.absent,
+            'late': self.late,
+            'excused': self.excused
+        }
 # ------------------ ASSESSMENT ------------------
 
 class Assessment(db.Model):
@@ -612,9 +672,43 @@ class LiveClass(db.Model):
 
     is_recurring = db.Column(db.Boolean, default=False)
     recurrence_pattern = db.Column(db.String(50))  # 'daily' | 'weekly' | etc.
+    recurrence_until = db.Column(db.DateTime)  # last possible occurrence start; NULL = open-ended
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    registrations = db.relationship('LiveClassRegistration', backref='live_class', lazy='dynamic', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_live_classes_teacher_start', 'teacher_id', 'start_time'),
+        db.Index('ix_live_classes_teacher_period', 'teacher_id', db.func.tsrange(start_time, end_time),
+                 postgresql_using='gist').ddl_if(dialect='postgresql'),
+    )
+
+
+class LiveClassRegistration(db.Model):
+    __tablename__ = 'live_class_registrations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    live_class_id = db.Column(db.Integer, db.ForeignKey('live_classes.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'))
+    registered_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User')
+
+    __table_args__ = (
+        db.UniqueConstraint('live_class_id', 'user_id', name='unique_live_class_registration'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'live_class_id': self.live_class_id,
+            'user_id': self.user_id,
+            'school_id': self.school_id,
+            'registered_at': self.registered_at.isoformat() if self.registered_at else None
+        }
+
 
 class Forum(db.Model):
      __tablename__ = 'forums'
@@ -629,13 +723,20 @@ class Forum(db.Model):
      is_active = db.Column(db.Boolean, default=True)
      created_at = db.Column(db.DateTime, default=datetime.utcnow)
      updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+     # Full-text search document (title + content), maintained by utils/forum_search.py
+     search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite')))
+
+     __table_args__ = (
+         db.Index('ix_forums_search_vector', 'search_vector', postgresql_using='gin'),
+     )
     
     # Relationships
      author = db.relationship('User', backref='forum_threads')
      school = db.relationship('School', backref='forum_threads')
      replies = db.relationship('ForumReply', backref='forum_thread', lazy='dynamic', cascade='all, delete-orphan')
     
-     def to_dict(self):
+     def to_summary_dict(self):
+        """Thread fields for list views - never touches the replies table"""
         return {
             'id': self.id,
             'title': self.title,
@@ -645,8 +746,16 @@ class Forum(db.Model):
             'school': self.school.name,
             'replies_count': self.replies_count,
             'created_at': self.created_at.isoformat(),
-            'replies': [reply.to_dict() for reply in self.replies.order_by(ForumReply.created_at.asc())]
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+
+     def to_dict(self, replies=None):
+        # Pass pre-loaded replies to avoid one query per thread
+        if replies is None:
+            replies = self.replies.order_by(ForumReply.created_at.asc()).all()
+        data = self.to_summary_dict()
+        data['replies'] = [reply.to_dict() for reply in replies]
+        return data
 class ForumReply(db.Model):
     __tablename__ = 'forum_replies'
     
@@ -658,6 +767,11 @@ class ForumReply(db.Model):
     parent_reply_id = db.Column(db.Integer, db.ForeignKey('forum_replies.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite')))
+
+    __table_args__ = (
+        db.Index('ix_forum_replies_search_vector', 'search_vector', postgresql_using='gin'),
+    )
     
     # Relationships
     author = db.relationship('User', backref='forum_replies')
@@ -697,6 +811,10 @@ class Competition(db.Model):
     proctoring_enabled = db.Column(db.Boolean, default=False)
     screen_sharing_required = db.Column(db.Boolean, default=False)
     show_individual_rankings = db.Column(db.Boolean, default=True)
+    # Bumped whenever a quiz question changes; invalidates compiled answer keys
+    answer_key_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Seats taken, maintained by utils/reservations.py
+    participant_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     host_school = db.relationship('School', backref='hosted_competitions')
@@ -704,30 +822,78 @@ class Competition(db.Model):
     participants = db.relationship('CompetitionParticipant', backref='competition', lazy='dynamic')
     quiz_questions = db.relationship('QuizQuestion', backref='competition', lazy='dynamic', 
                                    order_by='QuizQuestion.sequence')  # Note the relationship name
+
+    __table_args__ = (
+        db.Index('ix_competitions_status_deadline', 'status', 'deadline'),
+    )
+
+    @property
+    def effective_status(self):
+        # The deadline scheduler may lag by a moment; readers never see an overdue 'active'
+        if self.status == 'active' and self.deadline and self.deadline <= datetime.utcnow():
+            return 'completed'
+        return self.status
     
-    def to_dict(self, current_user_id=None):
+    def to_dict(self, current_user_id=None, is_participant=None, questions_count=None):
+     # List views pass is_participant/questions_count precomputed (see to_dict_list)
+     if questions_count is None:
+         questions_count = self.quiz_questions.count() if self.has_quiz else 0
      data = {
         "id": self.id,
         "title": self.title,
         "description": self.description,
         "deadline": self.deadline.isoformat(),
-        "status": self.status,
+        "status": self.effective_status,
         "host_school": self.host_school.name if self.host_school else None,
         "max_participants": self.max_participants,
+        "participant_count": self.participant_count or 0,
         "has_quiz": self.has_quiz,
-        "quiz_questions_count": len(self.quiz_questions) if self.has_quiz else 0,
+        "quiz_questions_count": questions_count if self.has_quiz else 0,
         "proctoring_enabled": self.proctoring_enabled,
         "screen_sharing_required": self.screen_sharing_required,
         "time_limit": self.time_limit,
         "subject": self.subject,
     }
-     if current_user_id:
+     if is_participant is not None:
+         data["is_participant"] = is_participant
+     elif current_user_id:
          user = User.query.get(current_user_id)
          data["is_participant"] = CompetitionParticipant.query.filter_by(
              competition_id=self.id,
              school_id=user.school_id
          ).first() is not None
-     return data    
+     return data
+
+    @classmethod
+    def to_dict_list(cls, competitions, school_id=None):
+     """
+     Serialize a page of competitions with two grouped queries in total:
+     one for the caller's school participation, one for question counts.
+     """
+     ids = [c.id for c in competitions]
+     if not ids:
+         return []
+
+     joined = None
+     if school_id is not None:
+         joined = {cid for (cid,) in db.session.query(
+             CompetitionParticipant.competition_id
+         ).filter(
+             CompetitionParticipant.competition_id.in_(ids),
+             CompetitionParticipant.school_id == school_id
+         ).distinct()}
+
+     quiz_ids = [c.id for c in competitions if c.has_quiz]
+     counts = dict(db.session.query(
+         QuizQuestion.competition_id, db.func.count(QuizQuestion.id)
+     ).filter(
+         QuizQuestion.competition_id.in_(quiz_ids)
+     ).group_by(QuizQuestion.competition_id).all()) if quiz_ids else {}
+
+     return [c.to_dict(
+         is_participant=(c.id in joined) if joined is not None else None,
+         questions_count=counts.get(c.id, 0)
+     ) for c in competitions]
 
 
 class QuizQuestion(db.Model):
@@ -772,6 +938,7 @@ class CompetitionParticipant(db.Model):
     # Relationships
     school = db.relationship('School')
     teacher = db.relationship('User')
+    answers = db.relationship('QuizAnswer', backref='participant', lazy='dynamic', cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -784,6 +951,57 @@ class CompetitionParticipant(db.Model):
             'submitted_at': self.submitted_at.isoformat() + 'Z' if self.submitted_at else None
         }
         
+class CompetitionSchoolScore(db.Model):
+    """Running per-school quiz totals, maintained by utils/leaderboard.py"""
+    __tablename__ = 'competition_school_scores'
+
+    competition_id = db.Column(db.Integer, db.ForeignKey('competitions.id'), primary_key=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), primary_key=True)
+    total_score = db.Column(db.Float, nullable=False, default=0)
+    participant_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    school = db.relationship('School')
+
+    def to_dict(self):
+        return {
+            'competition_id': self.competition_id,
+            'school_id': self.school_id,
+            'total_score': self.total_score,
+            'participant_count': self.participant_count
+        }
+
+class QuizAnswer(db.Model):
+    """One participant's answer to one quiz question, written on submission"""
+    __tablename__ = 'quiz_question_answers'
+
+    participant_id = db.Column(db.Integer, db.ForeignKey('competition_participants.id', ondelete='CASCADE'), primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('quiz_questions.id', ondelete='CASCADE'), primary_key=True)
+    # Denormalized so item analysis never has to touch competition_participants
+    competition_id = db.Column(db.Integer, db.ForeignKey('competitions.id'), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
+    answer = db.Column(db.Text)  # raw answer, NULL when skipped
+    normalized_answer = db.Column(db.Text)
+    is_correct = db.Column(db.Boolean, nullable=False, default=False)
+    points_awarded = db.Column(db.Float, nullable=False, default=0)
+    answered_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    question = db.relationship('QuizQuestion')
+
+    __table_args__ = (
+        db.Index('ix_quiz_question_answers_competition_question', 'competition_id', 'question_id'),
+        db.Index('ix_quiz_question_answers_competition_school', 'competition_id', 'school_id'),
+    )
+
+    def to_dict(self):
+        return {
+            'participant_id': self.participant_id,
+            'question_id': self.question_id,
+            'answer': self.answer,
+            'is_correct': self.is_correct,
+            'points_awarded': self.points_awarded
+        }
+
 class TutoringSession(db.Model):
     __tablename__ = 'tutoring_sessions'
     
@@ -794,7 +1012,11 @@ class TutoringSession(db.Model):
     school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
     time_slot = db.Column(db.DateTime, nullable=False)
     duration_minutes = db.Column(db.Integer, default=60)
+    # time_slot + duration_minutes, kept in sync by utils/timeslots.py
+    ends_at = db.Column(db.DateTime)
     max_students = db.Column(db.Integer, default=20)
+    # Seats taken, maintained by utils/reservations.py
+    enrollment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     meeting_link = db.Column(db.String(500), nullable=True)
     meeting_password = db.Column(db.String(50), nullable=True)
     status = db.Column(db.String(20), default='scheduled')  # scheduled, ongoing, completed, cancelled
@@ -806,10 +1028,16 @@ class TutoringSession(db.Model):
     tutor = db.relationship('User', backref='tutoring_sessions')
     school = db.relationship('School', backref='tutoring_sessions')
     enrollments = db.relationship('TutoringEnrollment', backref='session', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_tutoring_sessions_tutor_time', 'tutor_id', 'time_slot'),
+        db.Index('ix_tutoring_sessions_tutor_period', 'tutor_id', db.func.tsrange(time_slot, ends_at),
+                 postgresql_using='gist').ddl_if(dialect='postgresql'),
+    )
     
     @property
     def enrolled_count(self):
-        return len(self.enrollments)
+        return self.enrollment_count or 0
     
     @property
     def available_slots(self):
@@ -874,4 +1102,61 @@ class TutoringEnrollment(db.Model):
             'rating': self.rating,
             'feedback': self.feedback,
             'enrolled_at': self.enrolled_at.isoformat()
-        }
\ No newline at end of file
+        }
+# ------------------ REVOKED TOKENS ------------------
+
+class RevokedToken(db.Model):
+    """
+    A revoked JWT (jti set), or every token of a user issued up to
+    revoked_at (jti NULL). Read through utils/token_store.py.
+    """
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), nullable=True, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    token_type = db.Column(db.String(20), nullable=True)
+    reason = db.Column(db.String(100), nullable=True)
+    revoked_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'jti': self.jti,
+            'user_id': self.user_id,
+            'token_type': self.token_type,
+            'reason': self.reason,
+            'revoked_by': self.revoked_by,
+            'revoked_at': self.revoked_at.isoformat() if self.revoked_at else None
+        }
+
+# ------------------ SCHOOL STATS ------------------
+
+class SchoolStats(db.Model):
+    """
+    Headline dashboard numbers per school, kept current by the write paths
+    (utils/school_stats.py) and re-derived by `flask schools reconcile-stats`.
+    """
+    __tablename__ = 'school_stats'
+
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), primary_key=True)
+    students = db.Column(db.Integer, nullable=False, default=0)
+    teachers = db.Column(db.Integer, nullable=False, default=0)
+    classes = db.Column(db.Integer, nullable=False, default=0)
+    active_enrollments = db.Column(db.Integer, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    school = db.relationship('School', backref=db.backref('stats', uselist=False))
+
+    def to_dict(self):
+        return {
+            'school_id': self.school_id,
+            'students': self.students,
+            'teachers': self.teachers,
+            'classes': self.classes,
+            'active_enrollments': self.active_enrollments,
+            'reconciled_at': self.reconciled_at.isoformat() if self.reconciled_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -16,6 +16,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.exc import SQLAlchemyError
 from models import School, User
 from extensions import db
+from utils.throttle import account_key, login_misses, login_throttle, throttled_response
+from utils.token_store import revocations, verify_cache
+from utils.auth import student_login_query, teacher_login_query
 import traceback
 from sqlalchemy import or_
 
@@ -120,14 +123,21 @@ def student_login():
         admission_number = data['admission_number'].strip()
         password = data['password'].strip()
 
-        # Find student
-        student = User.query.filter_by(
-            school_id=school_id,
-            admission_number=admission_number,
-            role='student'
-        ).first()
+        # Throttle before any lookup or password hash
+        account = account_key('student', school_id, admission_number)
+        retry_after = login_throttle.check(account)
+        if retry_after:
+            return throttled_response(retry_after)
+
+        # Find student (skipped for identifiers that recently matched nobody)
+        miss_key = ('admission_number', school_id, admission_number)
+        student = None
+        if miss_key not in login_misses:
+            student = student_login_query(school_id, admission_number).first()
 
         if not student:
+            login_misses.add(miss_key)
+            login_throttle.failure(account)
             return jsonify({
                 'error': 'Invalid credentials',
                 'detail': 'No student found with these credentials'
@@ -137,6 +147,7 @@ def student_login():
         if student.must_change_password:
             # Verify against stored generated password (plain text in password_hash)
             if not check_password_hash(student.password_hash, password):
+                login_throttle.failure(account)
                 return jsonify({
                 'error': 'Invalid initial password',
                 'hint': 'Please use the system-generated password'
@@ -156,6 +167,7 @@ def student_login():
                 },
                 expires_delta=timedelta(minutes=15)
             )
+            login_throttle.success(account)
 
             return jsonify({
                 'access_token': access_token,
@@ -166,7 +178,9 @@ def student_login():
 
         # Normal login flow (after password change)
         if not student.check_password(password):
+            login_throttle.failure(account)
             return jsonify({'error': 'Invalid password'}), 401
+        login_throttle.success(account)
 
         if not student.is_active:
             return jsonify({'error': 'Account is inactive'}), 403
@@ -231,23 +245,22 @@ def teacher_login():
         if not identifier:
             return jsonify({'error': f'{identifier_type.replace("_", " ").title()} required'}), 400
 
-        # Find teacher - improved query to handle both TSC and National ID
-        teacher_query = User.query.filter(
-            User.school_id == school_id,
-            User.role == 'teacher',
-            User.is_active == True
-        )
+        # Throttle before any lookup or password hash
+        account = account_key('teacher', school_id, identifier)
+        retry_after = login_throttle.check(account)
+        if retry_after:
+            current_app.logger.warning(f"Throttled teacher login (school: {school_id}, {identifier_type}: {identifier})")
+            return throttled_response(retry_after)
 
-        if identifier_type == 'tsc_number':
-            teacher = teacher_query.filter(
-                db.func.upper(User.tsc_number) == identifier.upper()
-            ).first()
-        else:
-            teacher = teacher_query.filter(
-                User.national_id == identifier
-            ).first()
+        # Find teacher by TSC or National ID
+        miss_key = (identifier_type, school_id, identifier.upper() if identifier_type == 'tsc_number' else identifier)
+        teacher = None
+        if miss_key not in login_misses:
+            teacher = teacher_login_query(school_id, identifier_type, identifier).first()
 
         if not teacher:
+            login_misses.add(miss_key)
+            login_throttle.failure(account)
             current_app.logger.warning(f"Teacher not found (school: {school_id}, {identifier_type}: {identifier})")
             return jsonify({'error': 'Invalid credentials'}), 401
 
@@ -272,8 +285,10 @@ def teacher_login():
             current_app.logger.debug(f"Normal password check result: {password_valid}")
 
         if not password_valid:
+            login_throttle.failure(account)
             current_app.logger.warning(f"Invalid password for teacher {teacher.id}")
             return jsonify({'error': 'Invalid credentials'}), 401
+        login_throttle.success(account)
 
         # Create appropriate token
         additional_claims = {
@@ -385,8 +400,16 @@ def handle_force_change_password():
                 'message': 'Password must be at least 8 characters'
             }), 422
 
-        # Get user from token
+        # Every change costs a hash, so each one counts against the account limit
+        # (but not the IP's: a whole class changes its first passwords together)
         user_id = get_jwt_identity()
+        account = f'password-change:{user_id}'
+        retry_after = login_throttle.check(account)
+        if retry_after:
+            return throttled_response(retry_after)
+        login_throttle.failure(account, per_ip=False)
+
+        # Get user from token
         user = User.query.get(user_id)
         if not user:
             return jsonify({
@@ -399,6 +422,7 @@ def handle_force_change_password():
         user.must_change_password = False
         user.updated_at = datetime.utcnow()
         db.session.commit()
+        verify_cache.discard_user(user.id)
 
         # Generate new token without password change flag
         new_token = create_access_token(
@@ -426,6 +450,74 @@ def handle_force_change_password():
             'message': 'Password change failed'
         }), 500
 
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    """Revoke the token used for this request (access or refresh)"""
+    try:
+        revocations.revoke_token(get_jwt(), revoked_by=int(get_jwt_identity()), reason='logout')
+        return jsonify({'message': 'Token revoked'}), 200
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Logout error: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+
+
+@auth_bp.route('/revoke', methods=['POST'])
+@jwt_required()
+def revoke_tokens():
+    """
+    Kill a leaked token. School admins may revoke tokens of users in their
+    school; everyone may revoke their own. Body: {"user_id": ...} revokes
+    every token issued to that user so far; {"token": "<jwt>"} revokes one.
+    """
+    try:
+        data = request.get_json() or {}
+        claims = get_jwt()
+        actor_id = int(get_jwt_identity())
+
+        if data.get('token'):
+            try:
+                payload = decode_token(data['token'], allow_expired=True)
+            except Exception as e:
+                return jsonify({'error': 'Invalid token', 'details': str(e)}), 400
+            target_id = int(payload['sub'])
+        elif data.get('user_id') is not None:
+            payload = None
+            try:
+                target_id = int(data['user_id'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid user_id'}), 400
+        else:
+            return jsonify({'error': 'Provide a token or user_id to revoke'}), 400
+
+        if target_id != actor_id:
+            target = User.query.get(target_id)
+            if not target:
+                return jsonify({'error': 'User not found'}), 404
+            if claims.get('role') not in ['school_admin', 'system_owner'] or (
+                claims.get('role') == 'school_admin' and target.school_id != claims.get('school_id')
+            ):
+                return jsonify({'error': 'Unauthorized'}), 403
+
+        reason = (data.get('reason') or '').strip()[:100] or None
+        if payload is not None:
+            revocation = revocations.revoke_token(payload, revoked_by=actor_id, reason=reason)
+        else:
+            revocation = revocations.revoke_user(target_id, revoked_by=actor_id, reason=reason)
+
+        current_app.logger.info(f"User {actor_id} revoked tokens of user {target_id}")
+        return jsonify({
+            'message': 'Token revoked' if payload is not None else 'All tokens for user revoked',
+            'revocation': revocation.to_dict() if revocation else None
+        }), 200
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Token revocation error: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+
+
 @auth_bp.route('/verify', methods=['POST'])
 def verify_token():
     """
@@ -460,48 +552,62 @@ def verify_token():
                 'details': str(e)
             }), 401
 
-        # =====================================================================
-        # 3. Get User from Database
-        # =====================================================================
-        user_id = str(decoded['sub'])  # Convert to string for safety
-        user = User.query.get(user_id)
-        
-        if not user:
-            current_app.logger.error(f"User not found: ID={user_id}")
+        if revocations.is_revoked(decoded):
+            current_app.logger.warning(f"Revoked token presented: jti={decoded.get('jti')}")
             return jsonify({
                 'valid': False,
-                'error': 'User not found'
+                'error': 'Token has been revoked'
             }), 401
 
         # =====================================================================
-        # 4. Role-Specific Validation
+        # 3. Get User (cached per token for a few seconds)
         # =====================================================================
-        if decoded.get('role') == 'teacher':
-            if not user.is_active:
+        user_id = str(decoded['sub'])  # Convert to string for safety
+        summary = verify_cache.get(decoded.get('jti'))
+
+        if summary is None:
+            user = User.query.get(user_id)
+
+            if not user:
+                current_app.logger.error(f"User not found: ID={user_id}")
+                return jsonify({
+                    'valid': False,
+                    'error': 'User not found'
+                }), 401
+
+            # =================================================================
+            # 4. Role-Specific Validation
+            # =================================================================
+            if decoded.get('role') == 'teacher' and not user.is_active:
                 current_app.logger.warning(f"Inactive teacher: ID={user_id}")
                 return jsonify({
                     'valid': False,
                     'error': 'Teacher account inactive'
                 }), 403
 
+            summary = {
+                'id': user.id,
+                'email': user.email,
+                'role': user.role,
+                'school_id': user.school_id,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'is_active': user.is_active,
+                'must_change_password': user.must_change_password
+            }
+            verify_cache.put(decoded.get('jti'), summary)
+
+        if decoded.get('role') == 'teacher':
             # Update claims with current password change status
-            decoded['password_change_required'] = user.must_change_password
+            decoded['password_change_required'] = summary['must_change_password']
 
         # =====================================================================
         # 5. Successful Verification
         # =====================================================================
-        current_app.logger.info(f"Successful verification for {user.role} ID={user_id}")
+        current_app.logger.debug(f"Successful verification for {summary['role']} ID={user_id}")
         return jsonify({
             'valid': True,
-            'user': {
-                'id': user.id,
-                'email': user.email,
-                'role': user.role,
-                'school_id': user.school_id,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'is_active': user.is_active
-            },
+            'user': {k: v for k, v in summary.items() if k != 'must_change_password'},
             'claims': decoded
         }), 200
 
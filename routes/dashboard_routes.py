@@ -1,8 +1,11 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 from models import School, User, Attendance, SchoolAnnouncement, Activity, SchoolClass
 from extensions import db
+from utils import attendance_rollup, dashboard_widgets, enrollment_trends, school_stats
+from utils.auth import current_role, current_user_id, require_role, same_school
+from utils.response_cache import dashboard_cache
 from collections import defaultdict
 import calendar
 
@@ -32,19 +35,31 @@ def get_dashboard_data(school_id):
             return jsonify({'error': 'Unauthorized'}), 403
         
         school = School.query.get_or_404(school_id)
-        
-        # Get all dashboard data
-        return jsonify({
+        user_id = current_user.get('id') if isinstance(current_user, dict) else user.id
+
+        # Compute only the widgets this user and school have switched on, side by side
+        modules, widgets = dashboard_widgets.dashboard_config(school_id, user_id)
+        enabled = [name for name, (preference, module, _) in WIDGETS.items()
+                   if dashboard_widgets.is_enabled(preference, module, modules, widgets)]
+        tasks = {name: (WIDGETS[name][2], (school_id,)) for name in enabled}
+        # A widget that failed or timed out comes back as None; serve that
+        # dashboard but do not cache it, so the next request retries the widget
+        results = dashboard_cache.get_or_compute(
+            'dashboard', school_id, user_role,
+            lambda: dashboard_widgets.run_widgets(tasks),
+            variant=','.join(enabled),
+            cacheable=lambda results: None not in results.values()
+        )
+
+        data = {
             'school': {
                 'id': school.id,
                 'name': school.name,
                 'logo_url': getattr(school, 'logo_url', None),
                 'contact_info': getattr(school, 'contact_info', {})
             },
-            'stats': get_school_stats(school_id),
-            'analytics': get_school_analytics(school_id),
-            'activities': get_recent_activities(school_id),
-            'announcements': get_announcements(school_id),
+            'analytics': {name: results[name] for name in ANALYTICS_WIDGETS if name in results},
+            'widgets': enabled,
             'config': {
                 'school_branding': {
                     'primary_color': getattr(school, 'primary_color', "#3B82F6"),
@@ -52,59 +67,30 @@ def get_dashboard_data(school_id):
                     'logo_url': getattr(school, 'logo_url', None),
                     'school_name_display': True
                 },
-                'enabled_modules': {
-                    'attendance': True,
-                    'fees': True,
-                    'grades': True,
-                    'events': True,
-                    'announcements': True
-                },
-                'enabled_widgets': {
-                    'stats_overview': True,
-                    'enrollment_chart': True,
-                    'attendance_overview': True,
-                    'activity_feed': True,
-                    'quick_actions': True,
-                    'fee_status': True,
-                    'announcements': True,
-                    'custom_links': False
-                }
+                'enabled_modules': modules,
+                'enabled_widgets': widgets
             }
-        })
+        }
+        for name in ('stats', 'activities', 'announcements'):
+            if name in results:
+                data[name] = results[name]
+        return jsonify(data)
 
     except Exception as e:
         print(f"Dashboard error: {str(e)}")  # For debugging
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
 def get_school_stats(school_id):
-    """Get key statistics for dashboard"""
+    """Get key statistics for dashboard from the school's school_stats row"""
     try:
-        today = datetime.today()
+        today = datetime.today().date()
         start_of_week = today - timedelta(days=today.weekday())
-        
-        # Get student count
-        students_count = User.query.filter_by(
-            school_id=school_id, 
-            role='student'
-        ).filter(
-            User.is_active.is_(True) if hasattr(User, 'is_active') else True
-        ).count()
-        
-        # Get teacher count
-        teachers_count = User.query.filter_by(
-            school_id=school_id,
-            role='teacher'
-        ).filter(
-            User.is_active.is_(True) if hasattr(User, 'is_active') else True
-        ).count()
-        
-        # Get Class count
-        classes_count = SchoolClass.query.filter_by(school_id=school_id).count()
-        
+        stats = school_stats.get_stats(school_id)
+
         return {
-            'students': students_count,
-            'teachers': teachers_count,
-            'classes': classes_count,
+            'students': stats.students,
+            'teachers': stats.teachers,
+            'classes': stats.classes,
             'attendance': {
                 'daily': get_daily_attendance_rate(school_id, today),
                 'weekly': get_weekly_attendance_rate(school_id, start_of_week)
@@ -125,24 +111,6 @@ def get_school_stats(school_id):
             'fees': {'paid': 0, 'pending': 0, 'overdue': 0}
         }
 
-def get_school_analytics(school_id):
-    """Get analytics data for dashboard"""
-    try:
-        return {
-            'enrollment': get_enrollment_trends(school_id),
-            'attendance': get_attendance_trends(school_id),
-            'performance': get_performance_metrics(school_id),
-            'fees': get_fee_distribution(school_id)
-        }
-    except Exception as e:
-        print(f"Error in get_school_analytics: {str(e)}")
-        return {
-            'enrollment': {'labels': [], 'data': []},
-            'attendance': {'labels': [], 'data': []},
-            'performance': {'average_grade': 0, 'top_subjects': []},
-            'fees': []
-        }
-
 def get_recent_activities(school_id, limit=10):
     """Get recent activities for the activity feed from Activity model"""
     try:
@@ -185,52 +153,15 @@ def get_announcements(school_id, limit=5):
 
 def get_daily_attendance_rate(school_id, date):
     try:
-        total_students = User.query.filter_by(
-            school_id=school_id,
-            role='student',
-            is_active=True
-        ).count()
-
-        if total_students == 0:
-            return 0
-
-        present_count = Attendance.query.filter(
-            Attendance.school_id == school_id,
-            Attendance.date == date,
-            Attendance.status == 'present'
-        ).count()
-
-        return round((present_count / total_students) * 100, 1)
+        return attendance_rollup.totals(school_id, date, date)['rate']
     except Exception as e:
         print(f"Error in get_daily_attendance_rate: {str(e)}")
         return 0
 
 def get_weekly_attendance_rate(school_id, start_date):
+    """Rate over the days of the week that have marks (no fixed five-day week)"""
     try:
-        end_date = start_date + timedelta(days=6)
-
-        total_students = User.query.filter_by(
-            school_id=school_id,
-            role='student',
-            is_active=True
-        ).count()
-
-        if total_students == 0:
-            return 0
-
-        present_count = Attendance.query.filter(
-            Attendance.school_id == school_id,
-            Attendance.date >= start_date,
-            Attendance.date <= end_date,
-            Attendance.status == 'present'
-        ).count()
-
-        possible_attendances = total_students * 5  # Assuming 5 school days
-
-        if possible_attendances == 0:
-            return 0
-
-        return round((present_count / possible_attendances) * 100, 1)
+        return attendance_rollup.totals(school_id, start_date, start_date + timedelta(days=6))['rate']
     except Exception as e:
         print(f"Error in get_weekly_attendance_rate: {str(e)}")
         return 0
@@ -263,42 +194,30 @@ def get_fee_distribution(school_id):
 def get_enrollment_trends(school_id, months=6):
     """Get enrollment trends for the last N months"""
     try:
-        end_date = datetime.today()
-        start_date = end_date - timedelta(days=30*months)
-        
-        # Generate month labels
-        labels = []
-        current_date = start_date.replace(day=1)
-        while current_date <= end_date:
-            labels.append(current_date.strftime('%b %Y'))
-            if current_date.month == 12:
-                current_date = current_date.replace(year=current_date.year+1, month=1)
-            else:
-                current_date = current_date.replace(month=current_date.month+1)
-        
-        # Mock data for now - you can implement actual database queries later
-        data = [12, 18, 25, 30, 28, 35][:len(labels)]
-        while len(data) < len(labels):
-            data.append(data[-1] + 2)  # Simple growth pattern
-        
+        last = datetime.today().date()
+        first = enrollment_trends.add_months(enrollment_trends.month_start(last), -(months - 1))
+        series = enrollment_trends.school_trends(school_id, first, last)
+
         return {
-            'labels': labels,
-            'data': data
+            'labels': [datetime.strptime(m['month'], '%Y-%m').strftime('%b %Y') for m in series],
+            'data': [m['enrolled'] for m in series],
+            'transferred': [m['transferred'] for m in series],
+            'graduated': [m['graduated'] for m in series]
         }
     except Exception as e:
         print(f"Error in get_enrollment_trends: {str(e)}")
         return {'labels': [], 'data': []}
 
-def get_attendance_trends(school_id, weeks=4):
-    """Get weekly attendance trends"""
+def get_attendance_trends(school_id, days=7):
+    """Attendance rate for the last `days` school days with marks"""
     try:
-        # Mock data for 7 days
-        labels = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-        data = [85, 87, 82, 90, 88, 75, 70]  # Mock attendance percentages
-        
+        today = datetime.today().date()
+        recorded = attendance_rollup.daily(school_id, today - timedelta(days=days * 4), today)[-days:]
+
         return {
-            'labels': labels,
-            'data': data
+            'labels': [datetime.strptime(d['date'], '%Y-%m-%d').strftime('%a') for d in recorded],
+            'dates': [d['date'] for d in recorded],
+            'data': [d['rate'] for d in recorded]
         }
     except Exception as e:
         print(f"Error in get_attendance_trends: {str(e)}")
@@ -318,4 +237,171 @@ def get_performance_metrics(school_id):
         }
     except Exception as e:
         print(f"Error in get_performance_metrics: {str(e)}")
-        return {'average_grade': 0, 'top_subjects': []}
\ No newline at end of file
+        return {'average_grade': 0, 'top_subjects': []}
+# Widget name -> (user enabled_widgets key, school enabled_modules key, function(school_id))
+WIDGETS = {
+    'stats': ('stats_overview', None, get_school_stats),
+    'enrollment': ('enrollment_chart', None, get_enrollment_trends),
+    'attendance': ('attendance_overview', 'attendance', get_attendance_trends),
+    'performance': (None, 'grades', get_performance_metrics),
+    'fees': ('fee_status', 'fees', get_fee_distribution),
+    'activities': ('activity_feed', None, get_recent_activities),
+    'announcements': ('announcements', 'announcements', get_announcements),
+}
+
+# Returned under 'analytics' by the composite dashboard
+ANALYTICS_WIDGETS = ('enrollment', 'attendance', 'performance', 'fees')
+
+@dashboard_bp.route('/<int:school_id>/dashboard/widgets/<name>', methods=['GET'])
+@jwt_required()
+@same_school(bypass_roles=('system_owner',))
+def get_dashboard_widget(school_id, name):
+    """One dashboard widget on its own, so clients can load and cache widgets separately"""
+    if name not in WIDGETS:
+        return jsonify({'error': f'Unknown widget: {name}', 'widgets': list(WIDGETS)}), 404
+
+    preference, module, widget = WIDGETS[name]
+    modules, widgets = dashboard_widgets.dashboard_config(school_id, current_user_id())
+    if not dashboard_widgets.is_enabled(preference, module, modules, widgets):
+        return jsonify({'error': f'Widget {name} is not enabled for this dashboard'}), 404
+
+    try:
+        School.query.get_or_404(school_id)
+        data = dashboard_cache.get_or_compute(f'dashboard-widget:{name}', school_id, current_role(), lambda: widget(school_id))
+        response = jsonify({'widget': name, 'data': data})
+        response.headers['Cache-Control'] = f"private, max-age={current_app.config.get('DASHBOARD_WIDGET_MAX_AGE', 30)}"
+        return response
+    except Exception as e:
+        current_app.logger.error(f"Error computing dashboard widget {name}: {str(e)}")
+        return jsonify({'error': 'Failed to load widget'}), 500
+
+def _date_arg(name, default):
+    value = request.args.get(name)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else default
+
+@dashboard_bp.route('/<int:school_id>/attendance/trends', methods=['GET'])
+@require_role('school_admin', 'teacher', 'system_owner')
+@same_school(bypass_roles=('system_owner',))
+def get_attendance_trend(school_id):
+    """Daily counts and rates, ?days= back from ?end= (default the last 30 days)"""
+    try:
+        days = min(max(request.args.get('days', 30, type=int), 1), 366)
+        end = _date_arg('end', datetime.today().date())
+        start = end - timedelta(days=days - 1)
+        class_id = request.args.get('class_id', type=int)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    try:
+        return jsonify({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'class_id': class_id,
+            'days': attendance_rollup.daily(school_id, start, end, class_id)
+        }), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching attendance trend: {str(e)}")
+        return jsonify({'error': 'Failed to fetch attendance trend'}), 500
+
+@dashboard_bp.route('/<int:school_id>/attendance/weekly', methods=['GET'])
+@require_role('school_admin', 'teacher', 'system_owner')
+@same_school(bypass_roles=('system_owner',))
+def get_attendance_weekly(school_id):
+    """Per-week counts and rates for the last ?weeks= weeks (default 4)"""
+    try:
+        weeks = min(max(request.args.get('weeks', 4, type=int), 1), 53)
+        end = _date_arg('end', datetime.today().date())
+        start = attendance_rollup.week_start(end) - timedelta(weeks=weeks - 1)
+        class_id = request.args.get('class_id', type=int)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    try:
+        return jsonify({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'class_id': class_id,
+            'weeks': attendance_rollup.weekly(school_id, start, end, class_id)
+        }), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching weekly attendance: {str(e)}")
+        return jsonify({'error': 'Failed to fetch weekly attendance'}), 500
+
+@dashboard_bp.route('/<int:school_id>/attendance/term', methods=['GET'])
+@require_role('school_admin', 'teacher', 'system_owner')
+@same_school(bypass_roles=('system_owner',))
+def get_attendance_term(school_id):
+    """Totals, weekly series and per-class rates between ?start= and ?end= (default the last 13 weeks)"""
+    try:
+        end = _date_arg('end', datetime.today().date())
+        start = _date_arg('start', end - timedelta(weeks=13))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
+    if (end - start).days > 366:
+        return jsonify({'error': 'Range is limited to one year'}), 400
+
+    try:
+        return jsonify({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'totals': attendance_rollup.totals(school_id, start, end),
+            'weeks': attendance_rollup.weekly(school_id, start, end),
+            'classes': attendance_rollup.by_class(school_id, start, end)
+        }), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching term attendance: {str(e)}")
+        return jsonify({'error': 'Failed to fetch term attendance'}), 500
+
+def _month_range_args(default_months, max_months):
+    """(first, last) month from ?start=/?end= (YYYY-MM) or ?months=; ValueError when invalid"""
+    today = datetime.today().date()
+    start, end = request.args.get('start'), request.args.get('end')
+    try:
+        last = datetime.strptime(end, '%Y-%m').date() if end else enrollment_trends.month_start(today)
+        first = datetime.strptime(start, '%Y-%m').date() if start else None
+    except ValueError:
+        raise ValueError('Months must be YYYY-MM')
+    if first is None:
+        months = min(max(request.args.get('months', default_months, type=int), 1), max_months)
+        first = enrollment_trends.add_months(last, -(months - 1))
+    if first > last:
+        raise ValueError('start must not be after end')
+    if len(enrollment_trends.month_range(first, last)) > max_months:
+        raise ValueError(f'Range is limited to {max_months} months')
+    return first, last
+
+@dashboard_bp.route('/<int:school_id>/enrollment/trends', methods=['GET'])
+@require_role('school_admin', 'system_owner')
+@same_school(bypass_roles=('system_owner',))
+def get_enrollment_trend(school_id):
+    """Monthly enrolled / transferred / graduated counts (default the last 12 months)"""
+    try:
+        first, last = _month_range_args(12, 60)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return jsonify({
+            'school_id': school_id,
+            'months': enrollment_trends.school_trends(school_id, first, last)
+        }), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching enrollment trends: {str(e)}")
+        return jsonify({'error': 'Failed to fetch enrollment trends'}), 500
+
+@dashboard_bp.route('/enrollment/trends', methods=['GET'])
+@require_role('system_owner')
+def get_all_enrollment_trends():
+    """Monthly counts summed over all schools, from the precomputed buckets (default the last 36 months)"""
+    try:
+        first, last = _month_range_args(36, 240)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return jsonify({'months': enrollment_trends.all_school_trends(first, last)}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching enrollment trends: {str(e)}")
+        return jsonify({'error': 'Failed to fetch enrollment trends'}), 500
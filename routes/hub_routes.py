@@ -1,10 +1,24 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta, timezone
 from extensions import db
-from models import User, GeneralResource, Banner, LiveClass, Forum, ForumReply , Competition , CompetitionParticipant , TutoringSession , TutoringEnrollment, School, QuizQuestion
+from models import User, GeneralResource, Banner, LiveClass, LiveClassRegistration, Forum, ForumReply , Competition , CompetitionParticipant , TutoringSession , TutoringEnrollment, School, QuizQuestion
 from sqlalchemy import or_, and_, desc
-from sqlalchemy.orm import configure_mappers
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import configure_mappers, joinedload
+from collections import defaultdict
+from utils.forum_search import search_forums, KIND_FORUM
+from utils.pagination import encode_cursor, decode_cursor
+from utils.competition_scheduler import notify_competition_scheduled
+from utils.leaderboard import leaderboards, SCHOOL_BOARD, INDIVIDUAL_BOARD, ranked_individual_page, individual_rank_of
+from utils.grading import answer_keys, regrade_competition, store_answers
+from utils.leaderboard_stream import leaderboard_stream, format_sse
+from utils.reservations import reserve_seat, release_seat, CapacityError
+from utils.timeslots import find_conflicts, find_series_conflicts, free_slots, lock_calendar, session_end, as_utc_naive
+from utils.recurrence import PATTERNS as RECURRENCE_PATTERNS, classes_in_window, expand_classes, occurrences
+from utils.auth import load_current_user, current_user_id, current_role, current_school_id, require_role
+from utils.quiz_analytics import question_difficulty, common_wrong_answers, county_accuracy
+import itertools
 import json
 from sqlalchemy import func
 
@@ -21,12 +35,10 @@ hub_bp = Blueprint("hub", __name__, url_prefix="/api/hub")
 # -----------------------------------------------------------
 
 def current_user() -> User | None:
-    uid = get_jwt_identity()
-    return User.query.get(uid)
+    return load_current_user()
 
 def is_teacher() -> bool:
-    u = current_user()
-    return bool(u and u.role == "teacher")
+    return current_role() == "teacher"
 
 def serialize_resource(r: GeneralResource) -> dict:
     uploader = r.uploader
@@ -59,34 +71,64 @@ def serialize_class(c: LiveClass) -> dict:
         "registered": c.registered_count,
         "teacher": f"{t.first_name} {t.last_name}" if t else "Unknown",
         "school": t.school.name if t and t.school else "Unknown",
+        "is_recurring": bool(c.is_recurring),
+        "recurrence_pattern": c.recurrence_pattern,
+        "recurrence_until": c.recurrence_until.isoformat() if c.recurrence_until else None,
     }
 
-def simplify_math_expression(expr):
+def serialize_occurrence(o) -> dict:
+    """One (possibly recurring) class occurrence; id stays the class id"""
+    data = serialize_class(o.live_class)
+    data.update({
+        "start_time": o.start.isoformat(),
+        "end_time": o.end.isoformat(),
+        "occurrence": o.index,
+    })
+    return data
+
+def capacity_dict(reservation) -> dict:
+    return {
+        "taken": reservation.taken,
+        "capacity": reservation.capacity,
+        "remaining": reservation.remaining,
+    }
+
+def load_forum_replies(forum_ids) -> dict:
     """
-    Basic math expression normalization for comparison.
-    For production use, consider using a proper math library like SymPy.
+    Fetch the replies of many threads in a single query, with authors and
+    schools eager-loaded. Returns {forum_id: [ForumReply, ...]} ordered by
+    creation time.
     """
-    if not expr:
-        return ""
-    
-    # Basic normalization
-    expr = expr.replace(" ", "").lower()
-    
-    # Replace common math operators
-    replacements = {
-        "\\times": "*",
-        "\\div": "/",
-        "\\cdot": "*",
-        "\\left": "",
-        "\\right": "",
-        "(": "",
-        ")": ""
-    }
-    
-    for old, new in replacements.items():
-        expr = expr.replace(old, new)
-    
-    return expr
+    grouped = defaultdict(list)
+    if not forum_ids:
+        return grouped
+
+    replies = ForumReply.query.options(
+        joinedload(ForumReply.author),
+        joinedload(ForumReply.school)
+    ).filter(
+        ForumReply.forum_id.in_(forum_ids)
+    ).order_by(
+        ForumReply.created_at.asc(), ForumReply.id.asc()
+    ).all()
+
+    for reply in replies:
+        grouped[reply.forum_id].append(reply)
+    return grouped
+
+def build_reply_tree(replies) -> list:
+    """Nest a flat, time-ordered reply list using parent_reply_id"""
+    nodes = {r.id: {**r.to_dict(), 'replies': []} for r in replies}
+    roots = []
+    for r in replies:
+        parent = nodes.get(r.parent_reply_id)
+        # Replies whose parent is missing (or in another thread) stay top-level
+        if parent is not None and r.parent_reply_id != r.id:
+            parent['replies'].append(nodes[r.id])
+        else:
+            roots.append(nodes[r.id])
+    return roots
+
 # -----------------------------------------------------------
 # Routes
 # -----------------------------------------------------------
@@ -128,22 +170,49 @@ def handle_resources():
 @hub_bp.route("/live-classes", methods=["GET"])
 @jwt_required()
 def list_live_classes():
-    classes = LiveClass.query.order_by(LiveClass.start_time.desc()).all()
-    return jsonify([serialize_class(c) for c in classes]), 200
+    """
+    Class occurrences between from and to (ISO datetimes; default the next
+    30 days) in start-time order, with recurring classes expanded on the fly.
+    """
+    try:
+        window_start = datetime.fromisoformat(request.args["from"]) if request.args.get("from") else datetime.utcnow()
+        window_end = datetime.fromisoformat(request.args["to"]) if request.args.get("to") else window_start + timedelta(days=30)
+    except ValueError:
+        return jsonify({"error": "Invalid from/to datetime"}), 400
+    window_start, window_end = as_utc_naive(window_start), as_utc_naive(window_end)
+    if window_end <= window_start:
+        return jsonify({"error": "to must be after from"}), 400
+    if window_end - window_start > timedelta(days=366):
+        return jsonify({"error": "Range is limited to one year"}), 400
+
+    limit = min(max(request.args.get("limit", 200, type=int), 1), 1000)
+    classes = classes_in_window(
+        window_start, window_end,
+        teacher_id=request.args.get("teacher_id", type=int),
+        subject=request.args.get("subject")
+    )
+    upcoming = itertools.islice(expand_classes(classes, window_start, window_end), limit)
+    return jsonify([serialize_occurrence(o) for o in upcoming]), 200
 
 @hub_bp.route("/live-classes", methods=["POST"])
-@jwt_required()
+@require_role("teacher")
 def schedule_class():
-    if not is_teacher():
-        return jsonify({"error": "Only teachers can schedule classes"}), 403
-
     data = request.get_json(force=True)
     missing = [f for f in ["title", "subject", "start_time", "meeting_link"] if not data.get(f)]
     if missing:
         return jsonify({"error": f"Missing fields: {', '.join(missing)}"}), 422
 
-    start_dt = datetime.fromisoformat(data["start_time"])
-    end_dt = datetime.fromisoformat(data.get("end_time")) if data.get("end_time") else start_dt.replace(hour=start_dt.hour + 1)
+    # Stored and compared as naive UTC, whatever offset the client sent
+    try:
+        start_dt = as_utc_naive(datetime.fromisoformat(data["start_time"]))
+        end_dt = as_utc_naive(datetime.fromisoformat(data["end_time"])) if data.get("end_time") else start_dt + timedelta(hours=1)
+        until = as_utc_naive(datetime.fromisoformat(data["recurrence_until"])) if data.get("recurrence_until") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "start_time, end_time and recurrence_until must be ISO 8601 datetimes"}), 400
+
+    pattern = (data.get("recurrence_pattern") or "").lower() or None
+    if data.get("is_recurring") and pattern not in RECURRENCE_PATTERNS:
+        return jsonify({"error": f"recurrence_pattern must be one of {', '.join(sorted(RECURRENCE_PATTERNS))}"}), 422
 
     new_cls = LiveClass(
         title=data["title"].strip(),
@@ -153,12 +222,81 @@ def schedule_class():
         end_time=end_dt,
         meeting_link=data["meeting_link"].strip(),
         max_participants=data.get("max_participants"),
-        teacher_id=current_user().id,
+        is_recurring=bool(data.get("is_recurring")),
+        recurrence_pattern=pattern if data.get("is_recurring") else None,
+        recurrence_until=until,
+        teacher_id=current_user_id(),
     )
+
+    # Check the whole series (open-ended ones up to a year ahead)
+    horizon = until or start_dt + timedelta(days=365)
+    series = [(o.start, o.end) for o in occurrences(new_cls, start_dt, max(horizon, end_dt))]
+    lock_calendar(current_user_id())
+    conflicts = find_series_conflicts(current_user_id(), series)
+    if conflicts:
+        return jsonify({"error": "You already have a class or session at this time", "conflicts": conflicts}), 409
+
     db.session.add(new_cls)
     db.session.commit()
     return jsonify({"message": "Class scheduled", "class": serialize_class(new_cls)}), 201
 
+@hub_bp.route("/live-classes/<int:class_id>/register", methods=["POST"])
+@jwt_required()
+def register_live_class(class_id):
+    try:
+        user = current_user()
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        live_class = LiveClass.query.get(class_id)
+        if not live_class:
+            return jsonify({"error": "Class not found"}), 404
+        now = datetime.utcnow()
+        if live_class.is_recurring:
+            if live_class.recurrence_until and live_class.recurrence_until <= now:
+                return jsonify({"error": "Class series has already ended"}), 400
+        elif live_class.end_time <= now:
+            return jsonify({"error": "Class has already ended"}), 400
+        if LiveClassRegistration.query.filter_by(live_class_id=class_id, user_id=user.id).first():
+            return jsonify({"error": "You are already registered for this class"}), 400
+
+        try:
+            reservation = reserve_seat(LiveClass, class_id)
+        except CapacityError as e:
+            return jsonify({"error": "Class is full", "capacity": capacity_dict(e.reservation)}), 400
+
+        registration = LiveClassRegistration(live_class_id=class_id, user_id=user.id, school_id=user.school_id)
+        db.session.add(registration)
+        db.session.commit()
+        return jsonify({**registration.to_dict(), "capacity": capacity_dict(reservation)}), 201
+
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "You are already registered for this class"}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error registering for class: {e}")
+        return jsonify({"error": "Failed to register for class"}), 500
+
+@hub_bp.route("/live-classes/<int:class_id>/register", methods=["DELETE"])
+@jwt_required()
+def unregister_live_class(class_id):
+    try:
+        registration = LiveClassRegistration.query.filter_by(
+            live_class_id=class_id, user_id=current_user_id()
+        ).first()
+        if not registration:
+            return jsonify({"error": "You are not registered for this class"}), 404
+
+        db.session.delete(registration)
+        reservation = release_seat(LiveClass, class_id)
+        db.session.commit()
+        return jsonify({"message": "Registration cancelled", "capacity": capacity_dict(reservation)}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error cancelling class registration: {e}")
+        return jsonify({"error": "Failed to cancel registration"}), 500
+
 # ========================================
 # FORUM ROUTES
 # ========================================
@@ -166,13 +304,20 @@ def schedule_class():
 @hub_bp.route('/forums', methods=['GET'])
 @jwt_required()
 def get_forums():
-    """Get all forum threads with replies"""
+    """
+    Get forum threads. Pass view=summary to skip replies entirely; otherwise
+    the replies for the whole page are fetched in one batched query.
+    """
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         subject_filter = request.args.get('subject', '')
+        view = request.args.get('view', 'full').lower()
         
-        query = Forum.query.filter_by(is_active=True)
+        query = Forum.query.options(
+            joinedload(Forum.author),
+            joinedload(Forum.school)
+        ).filter_by(is_active=True)
         
         if subject_filter:
             query = query.filter(Forum.subject.ilike(f'%{subject_filter}%'))
@@ -180,13 +325,79 @@ def get_forums():
         forums = query.order_by(desc(Forum.updated_at)).paginate(
             page=page, per_page=per_page, error_out=False
         )
-        
-        return jsonify([forum.to_dict() for forum in forums.items]), 200
+
+        if view == 'summary':
+            return jsonify([forum.to_summary_dict() for forum in forums.items]), 200
+
+        replies_by_forum = load_forum_replies([forum.id for forum in forums.items])
+        return jsonify([
+            forum.to_dict(replies=replies_by_forum.get(forum.id, []))
+            for forum in forums.items
+        ]), 200
         
     except Exception as e:
         current_app.logger.error(f"Error fetching forums: {str(e)}")
         return jsonify({'error': 'Failed to fetch forums'}), 500
 
+@hub_bp.route('/forums/search', methods=['GET'])
+@jwt_required()
+def search_forum_posts():
+    """
+    Full-text search across thread titles, thread bodies and replies.
+    Results are ranked, highlighted and paginated with an opaque cursor.
+    """
+    try:
+        query_text = (request.args.get('q') or '').strip()
+        if not query_text:
+            return jsonify({'error': 'q is required'}), 400
+
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+        try:
+            after = decode_cursor(request.args.get('cursor'), 3)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+        hits, next_key = search_forums(query_text, limit=limit, after=after)
+
+        # Two batched lookups for display fields, regardless of page size
+        forum_ids = {h['forum_id'] for h in hits}
+        reply_ids = [h['doc_id'] for h in hits if h['kind'] != KIND_FORUM]
+        forums = {f.id: f for f in Forum.query.options(
+            joinedload(Forum.author), joinedload(Forum.school)
+        ).filter(Forum.id.in_(forum_ids)).all()} if forum_ids else {}
+        replies = {r.id: r for r in ForumReply.query.options(
+            joinedload(ForumReply.author), joinedload(ForumReply.school)
+        ).filter(ForumReply.id.in_(reply_ids)).all()} if reply_ids else {}
+
+        results = []
+        for hit in hits:
+            forum = forums.get(hit['forum_id'])
+            doc = forum if hit['kind'] == KIND_FORUM else replies.get(hit['doc_id'])
+            if not forum or not doc:
+                continue
+            results.append({
+                'type': 'forum' if hit['kind'] == KIND_FORUM else 'reply',
+                'forum_id': forum.id,
+                'reply_id': None if hit['kind'] == KIND_FORUM else doc.id,
+                'title': forum.title,
+                'subject': forum.subject,
+                'snippet': hit['snippet'],
+                'rank': hit['rank'],
+                'author': f"{doc.author.first_name} {doc.author.last_name}",
+                'school': doc.school.name,
+                'created_at': doc.created_at.isoformat()
+            })
+
+        return jsonify({
+            'query': query_text,
+            'results': results,
+            'next_cursor': encode_cursor(next_key) if next_key else None
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error searching forums: {str(e)}")
+        return jsonify({'error': 'Failed to search forums'}), 500
+
 @hub_bp.route('/forums', methods=['POST'])
 @jwt_required()
 def create_forum():
@@ -196,8 +407,7 @@ def create_forum():
             return jsonify({'error': 'No data provided'}), 400
         
         # Get current user properly
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = load_current_user()
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
@@ -219,13 +429,42 @@ def create_forum():
         db.session.add(new_post)
         db.session.commit()
         
-        return jsonify(new_post.to_dict()), 201
+        return jsonify(new_post.to_dict(replies=[])), 201
         
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error creating forum: {str(e)}")
         return jsonify({'error': 'Failed to create forum post'}), 500
     
+@hub_bp.route('/forums/<int:forum_id>/replies', methods=['GET'])
+@jwt_required()
+def get_forum_replies(forum_id):
+    """
+    Return the whole reply tree of a thread. Pass flat=true to get the
+    replies as a time-ordered list instead of nested.
+    """
+    try:
+        thread = Forum.query.get(forum_id)
+        if not thread:
+            return jsonify({'error': 'Forum not found'}), 404
+
+        replies = load_forum_replies([thread.id]).get(thread.id, [])
+
+        if request.args.get('flat', 'false').lower() == 'true':
+            tree = [reply.to_dict() for reply in replies]
+        else:
+            tree = build_reply_tree(replies)
+
+        return jsonify({
+            'forum_id': thread.id,
+            'count': len(replies),
+            'replies': tree
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching replies: {e}")
+        return jsonify({'error': 'Failed to fetch replies'}), 500
+
 @hub_bp.route('/forums/<int:forum_id>/replies', methods=['POST'])
 @jwt_required()
 def create_forum_reply(forum_id):           # ← accept the parameter
@@ -234,8 +473,9 @@ def create_forum_reply(forum_id):           # ← accept the parameter
     Returns the new reply JSON.
     """
     try:
-        user_id = int(get_jwt_identity())   # already an int/str, not a dict
-        user    = User.query.get_or_404(user_id)
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         thread  = Forum.query.get_or_404(forum_id)
 
         data    = request.get_json(force=True)
@@ -278,42 +518,37 @@ def get_competitions():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
 
-        user_id = int(get_jwt_identity())
-        user = User.query.get_or_404(user_id)
-        school_id = user.school_id
+        school_id = current_school_id()
 
-        # Base query
+        # Base query. Read-only: the competition scheduler owns status
+        # transitions, so overdue 'active' rows are treated as completed here.
         query = Competition.query
+        now = datetime.utcnow()
 
-        if status_filter in ('active', 'completed'):
-            query = query.filter_by(status=status_filter)
-
-        # Update expired competitions
-        expired = query.filter(
-            and_(
-                Competition.deadline < datetime.utcnow(),
-                Competition.status == 'active'
+        if status_filter == 'active':
+            query = query.filter(
+                Competition.status == 'active',
+                Competition.deadline > now
             )
-        ).all()
-
-        for comp in expired:
-            comp.status = 'completed'
-
-        if expired:
-            db.session.commit()
+        elif status_filter == 'completed':
+            query = query.filter(or_(
+                Competition.status == 'completed',
+                and_(Competition.status == 'active', Competition.deadline <= now)
+            ))
 
         # Paginate
-        competitions = query.order_by(desc(Competition.deadline)).paginate(
+        competitions = query.options(
+            joinedload(Competition.host_school)
+        ).order_by(desc(Competition.deadline)).paginate(
             page=page, per_page=per_page, error_out=False
         )
 
-        # Build response
+        # Build response - participation and question counts are batched per page
         competition_dicts = []
-        for comp in competitions.items:
-            comp_data = comp.to_dict(current_user_id=user_id)
-
+        page_data = Competition.to_dict_list(competitions.items, school_id=school_id)
+        for comp, comp_data in zip(competitions.items, page_data):
             # Add leaderboard if completed
-            if comp.status == 'completed':
+            if comp_data['status'] == 'completed':
                 comp_data['leaderboard'] = get_competition_leaderboard(comp.id)
                 if getattr(comp, 'show_individual_rankings', False):
                     comp_data['individual_leaderboard'] = get_individual_leaderboard(comp.id)
@@ -330,8 +565,9 @@ def get_competitions():
 @jwt_required()
 def create_competition():
     try:
-        current_user = get_jwt_identity()
-        user = User.query.get(int(current_user))  # FIXED HERE
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
         data = request.get_json()
 
@@ -364,6 +600,7 @@ def create_competition():
 
         db.session.add(competition)
         db.session.commit()
+        notify_competition_scheduled(competition)
 
         return jsonify(competition.to_dict()), 201
 
@@ -376,8 +613,9 @@ def create_competition():
 @jwt_required()
 def join_competition(competition_id):          # ← accept it here
     try:
-        user_id = int(get_jwt_identity())
-        user    = User.query.get_or_404(user_id)
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
 
         competition = Competition.query.get_or_404(competition_id)
 
@@ -387,14 +625,15 @@ def join_competition(competition_id):          # ← accept it here
         if competition.deadline <= datetime.utcnow():
             return jsonify({'error': 'Competition deadline has passed'}), 400
 
-        # 2. duplicate / capacity checks
+        # 2. duplicate check, then take a place atomically
         if CompetitionParticipant.query.filter_by(
                 competition_id=competition.id,
                 school_id=user.school_id).first():
             return jsonify({'error': 'Your school is already participating'}), 400
-        if competition.max_participants and \
-           len(competition.participants) >= competition.max_participants:
-            return jsonify({'error': 'Competition is full'}), 400
+        try:
+            reservation = reserve_seat(Competition, competition.id)
+        except CapacityError as e:
+            return jsonify({'error': 'Competition is full', 'capacity': capacity_dict(e.reservation)}), 400
 
         # 3. create participation
         participant = CompetitionParticipant(
@@ -405,7 +644,7 @@ def join_competition(competition_id):          # ← accept it here
         db.session.add(participant)
         db.session.commit()
 
-        return jsonify(participant.to_dict()), 201
+        return jsonify({**participant.to_dict(), 'capacity': capacity_dict(reservation)}), 201
 
     except Exception as e:
         db.session.rollback()
@@ -420,8 +659,9 @@ def join_competition(competition_id):          # ← accept it here
 @jwt_required()
 def submit_competition_entry(competition_id):   # ← parameter here too
     try:
-        user_id = int(get_jwt_identity())
-        user    = User.query.get_or_404(user_id)
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
 
         data = request.get_json(force=True)
 
@@ -446,13 +686,12 @@ def submit_competition_entry(competition_id):   # ← parameter here too
 @jwt_required()
 def get_competition_quiz(competition_id):
     try:
-        user_id = int(get_jwt_identity())
         competition = Competition.query.get_or_404(competition_id)
         
         # Check if user's school is participating
         participant = CompetitionParticipant.query.filter_by(
             competition_id=competition_id,
-            school_id=User.query.get(user_id).school_id
+            school_id=current_school_id()
         ).first_or_404()
         
         if not competition.has_quiz:
@@ -472,15 +711,18 @@ def get_competition_quiz(competition_id):
 @jwt_required()
 def submit_competition_quiz(competition_id):
     try:
-        user_id = int(get_jwt_identity())
-        user = User.query.get_or_404(user_id)
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         competition = Competition.query.get_or_404(competition_id)
         
-        # Check if user's school is participating
+        # Check if user's school is participating. The row stays locked until
+        # commit, so a concurrent resubmission (double click, retry) waits and
+        # then sees this one's quiz_score as its old score
         participant = CompetitionParticipant.query.filter_by(
             competition_id=competition_id,
             school_id=user.school_id
-        ).first_or_404()
+        ).with_for_update().first_or_404()
         
         if not competition.has_quiz:
             return jsonify({'error': 'This competition does not have a quiz'}), 400
@@ -488,34 +730,24 @@ def submit_competition_quiz(competition_id):
         data = request.get_json()
         answers = data.get('answers', {})
         
-        # Calculate score
-        questions = competition.quiz_questions.all()
-        total_score = 0
-        
-        for question in questions:
-            if str(question.id) in answers:
-                user_answer = answers[str(question.id)]
-                if question.question_type == 'multiple_choice':
-                    if user_answer == question.correct_answer:
-                        total_score += question.points
-                elif question.question_type == 'math_expression':
-                    # This would need a proper math expression comparison library
-                    if simplify_math_expression(user_answer) == simplify_math_expression(question.correct_answer):
-                        total_score += question.points
-                else:  # short answer
-                    if user_answer.lower().strip() == question.correct_answer.lower().strip():
-                        total_score += question.points
-        
-        # Update participant record
+        # Score against the compiled answer key (cached until the questions change)
+        key = answer_keys.get(competition)
+        total_score = store_answers(participant, key, answers)
+        
+        # Update participant record and the running school total together
+        leaderboards.record_score(participant, participant.quiz_score, total_score)
         participant.quiz_score = total_score
         participant.quiz_submitted_at = datetime.utcnow()
         participant.quiz_answers = json.dumps(answers)
         db.session.commit()
+        leaderboards.refresh(participant)
+        leaderboard_stream.notify(competition_id)
         
         # Return updated leaderboard
         return jsonify({
             'score': total_score,
-            'total_possible': sum(q.points for q in questions),
+            'total_possible': key.total_possible,
+            'position': leaderboards.board(competition_id).position(participant.school_id),
             'leaderboard': get_competition_leaderboard(competition_id),
             'individual_leaderboard': get_individual_leaderboard(competition_id) if competition.show_individual_rankings else None
         }), 200
@@ -525,73 +757,334 @@ def submit_competition_quiz(competition_id):
         current_app.logger.error(f"Error submitting quiz: {str(e)}")
         return jsonify({'error': 'Failed to submit quiz'}), 500
 
-def get_competition_leaderboard(competition_id):
-    competition = Competition.query.get_or_404(competition_id)
-    
-    # School rankings
-    school_rankings = db.session.query(
-        School.id.label('school_id'),
-        School.name.label('school_name'),
-        func.sum(CompetitionParticipant.quiz_score).label('total_score'),
-        func.count(CompetitionParticipant.id).label('participant_count')
-    ).join(
-        CompetitionParticipant.school
-    ).filter(
-        CompetitionParticipant.competition_id == competition_id,
-        CompetitionParticipant.quiz_score.isnot(None)
-    ).group_by(
-        School.id
-    ).order_by(
-        func.sum(CompetitionParticipant.quiz_score).desc()
-    ).all()
-    
+def can_manage_competition(user, competition):
+    return bool(user) and (
+        user.id == competition.created_by_id or
+        (user.role in ['school_admin', 'admin', 'system_owner'] and user.school_id == competition.host_school_id)
+    )
+
+@hub_bp.route('/competitions/<int:competition_id>/questions/<int:question_id>', methods=['PUT'])
+@jwt_required()
+def update_quiz_question(competition_id, question_id):
+    """Correct a question (typically its answer key) and rescore every submission"""
+    try:
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        competition = Competition.query.get(competition_id)
+        if not competition:
+            return jsonify({'error': 'Competition not found'}), 404
+        if not can_manage_competition(user, competition):
+            return jsonify({'error': 'Not allowed to edit this competition'}), 403
+
+        question = QuizQuestion.query.filter_by(id=question_id, competition_id=competition_id).first()
+        if not question:
+            return jsonify({'error': 'Question not found'}), 404
+
+        data = request.get_json() or {}
+        for field in ['question_text', 'question_type', 'options', 'correct_answer', 'points', 'sequence']:
+            if field in data:
+                setattr(question, field, data[field])
+        db.session.commit()
+
+        result = None
+        if str(request.args.get('regrade', 'true')).lower() != 'false':
+            result = regrade_competition(competition)
+
+        return jsonify({'question': question.to_dict(), 'regrade': result}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error updating quiz question: {str(e)}")
+        return jsonify({'error': 'Failed to update question'}), 500
+
+@hub_bp.route('/competitions/<int:competition_id>/regrade', methods=['POST'])
+@jwt_required()
+def regrade_competition_quiz(competition_id):
+    """Rescore all stored submissions against the current answer key"""
+    try:
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        competition = Competition.query.get(competition_id)
+        if not competition:
+            return jsonify({'error': 'Competition not found'}), 404
+        if not can_manage_competition(user, competition):
+            return jsonify({'error': 'Not allowed to regrade this competition'}), 403
+        if not competition.has_quiz:
+            return jsonify({'error': 'This competition does not have a quiz'}), 400
+
+        return jsonify(regrade_competition(competition)), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error regrading competition: {str(e)}")
+        return jsonify({'error': 'Failed to regrade competition'}), 500
+
+@hub_bp.route('/competitions/<int:competition_id>/leaderboard/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_competition_leaderboard(competition_id):
+    """
+    Server-Sent Events feed of the standings. The first event is a full
+    'snapshot'; after that 'delta' events carry only rows that changed.
+    EventSource cannot set headers, so the token may be passed as ?jwt=.
+    Needs a threaded/async server: each viewer keeps a worker thread busy,
+    so above LEADERBOARD_STREAM_MAX_VIEWERS per process it answers 503.
+    """
+    if not current_app.config.get('LEADERBOARD_STREAM_ENABLED', True):
+        return jsonify({'error': 'Live leaderboard streaming is disabled; poll /leaderboard instead'}), 503
+
+    competition = Competition.query.get(competition_id)
+    if not competition:
+        return jsonify({'error': 'Competition not found'}), 404
+
+    subscription = leaderboard_stream.subscribe(
+        current_app._get_current_object(), competition_id,
+        include_individual=bool(competition.show_individual_rankings),
+        max_viewers=current_app.config.get('LEADERBOARD_STREAM_MAX_VIEWERS', 16)
+    )
+    if subscription is None:
+        response = jsonify({'error': 'Too many live viewers right now; poll /leaderboard instead'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    keepalive = current_app.config.get('LEADERBOARD_STREAM_HEARTBEAT_SECONDS', 15)
+
+    def events():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                item = subscription.get(timeout=keepalive)
+                if item is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                event, data, event_id = item
+                yield format_sse(event, data, event_id)
+        finally:
+            leaderboard_stream.unsubscribe(subscription)
+
+    response = Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Also covers clients that leave before the generator starts (its finally never runs)
+    response.call_on_close(lambda: leaderboard_stream.unsubscribe(subscription))
+    return response
+
+def _analytics_competition(competition_id):
+    """Load a competition for item analysis, or return an error response"""
+    user = load_current_user()
+    if not user:
+        return None, (jsonify({'error': 'User not found'}), 404)
+    competition = Competition.query.get(competition_id)
+    if not competition:
+        return None, (jsonify({'error': 'Competition not found'}), 404)
+    if not can_manage_competition(user, competition):
+        return None, (jsonify({'error': 'Not allowed to view analytics for this competition'}), 403)
+    return competition, None
+
+@hub_bp.route('/competitions/<int:competition_id>/analytics/questions', methods=['GET'])
+@jwt_required()
+def get_question_analytics(competition_id):
+    """Per-question difficulty, optionally with the most common wrong answers"""
+    try:
+        competition, error = _analytics_competition(competition_id)
+        if error:
+            return error
+
+        questions = question_difficulty(competition_id)
+        if request.args.get('include_wrong_answers', 'false').lower() == 'true':
+            limit = min(max(request.args.get('limit', 3, type=int), 1), 20)
+            wrong = common_wrong_answers(competition_id, limit=limit)
+            for q in questions:
+                q['common_wrong_answers'] = wrong.get(q['question_id'], [])
+
+        return jsonify({'competition_id': competition_id, 'questions': questions}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching question analytics: {str(e)}")
+        return jsonify({'error': 'Failed to fetch question analytics'}), 500
+
+@hub_bp.route('/competitions/<int:competition_id>/analytics/questions/<int:question_id>/wrong-answers', methods=['GET'])
+@jwt_required()
+def get_common_wrong_answers(competition_id, question_id):
+    try:
+        competition, error = _analytics_competition(competition_id)
+        if error:
+            return error
+
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        wrong = common_wrong_answers(competition_id, question_id=question_id, limit=limit)
+        return jsonify({
+            'question_id': question_id,
+            'wrong_answers': wrong.get(question_id, [])
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching wrong answers: {str(e)}")
+        return jsonify({'error': 'Failed to fetch wrong answers'}), 500
+
+@hub_bp.route('/competitions/<int:competition_id>/analytics/counties', methods=['GET'])
+@jwt_required()
+def get_county_analytics(competition_id):
+    """Accuracy per county, across the whole quiz or for one question_id"""
+    try:
+        competition, error = _analytics_competition(competition_id)
+        if error:
+            return error
+
+        question_id = request.args.get('question_id', type=int)
+        return jsonify({
+            'competition_id': competition_id,
+            'question_id': question_id,
+            'counties': county_accuracy(competition_id, question_id)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching county analytics: {str(e)}")
+        return jsonify({'error': 'Failed to fetch county analytics'}), 500
+
+def get_competition_leaderboard(competition_id, limit=None):
+    """School rankings, served from the incrementally maintained board"""
     return [{
-        'school_id': r.school_id,
-        'school_name': r.school_name,
-        'score': float(r.total_score) if r.total_score else 0,
-        'participant_count': r.participant_count
-    } for r in school_rankings]
-
-def get_individual_leaderboard(competition_id):
-    # Individual rankings
-    individual_rankings = db.session.query(
-        User.id.label('user_id'),
-        User.first_name,
-        User.last_name,
-        School.id.label('school_id'),
-        School.name.label('school_name'),
-        CompetitionParticipant.quiz_score.label('score')
-    ).join(
-        CompetitionParticipant.user
-    ).join(
-        User.school
-    ).filter(
-        CompetitionParticipant.competition_id == competition_id,
-        CompetitionParticipant.quiz_score.isnot(None)
-    ).order_by(
-        CompetitionParticipant.quiz_score.desc()
-    ).all()
-    
+        'rank': r['rank'],
+        'school_id': r['school_id'],
+        'school_name': r['school_name'],
+        'score': r['score'],
+        'participant_count': r['participant_count']
+    } for r in leaderboards.board(competition_id, SCHOOL_BOARD).top(limit)]
+
+def get_individual_leaderboard(competition_id, limit=None):
+    """Individual rankings, served from the incrementally maintained board"""
     return [{
-        'user_id': r.user_id,
-        'user_name': f"{r.first_name} {r.last_name}",
-        'school_id': r.school_id,
-        'school_name': r.school_name,
-        'score': float(r.score) if r.score else 0
-    } for r in individual_rankings]
+        'rank': r['rank'],
+        'user_id': r['user_id'],
+        'user_name': r['user_name'],
+        'school_id': r['school_id'],
+        'school_name': r['school_name'],
+        'score': r['score']
+    } for r in leaderboards.board(competition_id, INDIVIDUAL_BOARD).top(limit)]
+
+@hub_bp.route('/competitions/<int:competition_id>/leaderboard', methods=['GET'])
+@jwt_required()
+def get_competition_standings(competition_id):
+    """
+    Top-K standings plus the caller's own position.
+    board=school (default) ranks schools, board=individual ranks users.
+    """
+    try:
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+
+        competition = Competition.query.get(competition_id)
+        if not competition:
+            return jsonify({'error': 'Competition not found'}), 404
+
+        kind = request.args.get('board', SCHOOL_BOARD)
+        if kind not in (SCHOOL_BOARD, INDIVIDUAL_BOARD):
+            return jsonify({'error': 'board must be school or individual'}), 400
+        if kind == INDIVIDUAL_BOARD and not competition.show_individual_rankings:
+            return jsonify({'error': 'Individual rankings are hidden for this competition'}), 403
+
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+
+        board = leaderboards.board(competition_id, kind)
+        me = user.school_id if kind == SCHOOL_BOARD else user.id
+
+        return jsonify({
+            'competition_id': competition_id,
+            'board': kind,
+            'total': len(board),
+            'top': board.top(limit, offset),
+            'my_position': board.position(me)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching leaderboard: {str(e)}")
+        return jsonify({'error': 'Failed to fetch leaderboard'}), 500
+
+def _individual_ranking_competition(competition_id):
+    competition = Competition.query.get(competition_id)
+    if not competition:
+        return None, (jsonify({'error': 'Competition not found'}), 404)
+    if not competition.show_individual_rankings:
+        return None, (jsonify({'error': 'Individual rankings are hidden for this competition'}), 403)
+    return competition, None
+
+@hub_bp.route('/competitions/<int:competition_id>/leaderboard/individual', methods=['GET'])
+@jwt_required()
+def get_individual_ranking(competition_id):
+    """
+    Paginated individual ranking with RANK()/DENSE_RANK().
+    Optional school_id or county narrow the ranking; overall ranks are kept.
+    """
+    try:
+        competition, error = _individual_ranking_competition(competition_id)
+        if error:
+            return error
+
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        school_id = request.args.get('school_id', type=int)
+        county = request.args.get('county')
+        try:
+            after = decode_cursor(request.args.get('cursor'), 2)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        rows, next_key, total = ranked_individual_page(
+            competition_id, limit=limit, after=after, school_id=school_id, county=county
+        )
+        return jsonify({
+            'competition_id': competition_id,
+            'total': total,
+            'results': rows,
+            'next_cursor': encode_cursor(next_key) if next_key else None
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching individual ranking: {str(e)}")
+        return jsonify({'error': 'Failed to fetch individual ranking'}), 500
+
+@hub_bp.route('/competitions/<int:competition_id>/leaderboard/individual/rank', methods=['GET'])
+@hub_bp.route('/competitions/<int:competition_id>/leaderboard/individual/rank/<int:user_id>', methods=['GET'])
+@jwt_required()
+def get_individual_rank(competition_id, user_id=None):
+    """Where one participant (default: the caller) stands, optionally within a school or county"""
+    try:
+        competition, error = _individual_ranking_competition(competition_id)
+        if error:
+            return error
+
+        user_id = user_id or current_user_id()
+        entry = individual_rank_of(
+            competition_id, user_id,
+            school_id=request.args.get('school_id', type=int),
+            county=request.args.get('county')
+        )
+        if not entry:
+            return jsonify({'error': 'Participant has no ranked score'}), 404
+        return jsonify(entry), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching individual rank: {str(e)}")
+        return jsonify({'error': 'Failed to fetch individual rank'}), 500
 
 @hub_bp.route('/competitions/<int:competition_id>', methods=['GET'])
 @jwt_required()
 def get_competition(competition_id):
     """Get a single competition with full details"""
     try:
-        user_id = int(get_jwt_identity())
         competition = Competition.query.get_or_404(competition_id)
         
-        response_data = competition.to_dict(current_user_id=user_id)
+        is_participant = CompetitionParticipant.query.filter_by(
+            competition_id=competition_id,
+            school_id=current_school_id()
+        ).first() is not None
+        response_data = competition.to_dict(is_participant=is_participant)
         
         # Add leaderboard data if competition is completed
-        if competition.status == 'completed':
+        if response_data['status'] == 'completed':
             response_data['leaderboard'] = get_competition_leaderboard(competition_id)
             if competition.show_individual_rankings:
                 response_data['individual_leaderboard'] = get_individual_leaderboard(competition_id)
@@ -616,7 +1109,10 @@ def get_tutoring_sessions():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         
-        query = TutoringSession.query.filter(
+        query = TutoringSession.query.options(
+            joinedload(TutoringSession.tutor),
+            joinedload(TutoringSession.school)
+        ).filter(
             TutoringSession.time_slot > datetime.utcnow()
         )
         
@@ -641,7 +1137,9 @@ def get_tutoring_sessions():
 def create_tutoring_session():
     """Create a new tutoring session."""
     try:
-        user = User.query.get(int(get_jwt_identity()))
+        user = load_current_user()
+        if not user:
+            return jsonify(error="User not found"), 404
         data = request.get_json()
 
         # ---------- validate ----------
@@ -664,6 +1162,19 @@ def create_tutoring_session():
 
         if time_slot <= datetime.now(timezone.utc):
            return jsonify({'error': 'Time slot must be in the future'}), 400
+
+        try:
+            duration = int(data.get("duration_minutes") or 60)
+        except (TypeError, ValueError):
+            return jsonify(error="duration_minutes must be a whole number of minutes"), 400
+        if duration <= 0:
+            return jsonify(error="duration_minutes must be positive"), 400
+
+        time_slot = as_utc_naive(time_slot)
+        lock_calendar(user.id)
+        conflicts = find_conflicts(user.id, time_slot, session_end(time_slot, duration))
+        if conflicts:
+            return jsonify(error="You already have a class or session at this time", conflicts=conflicts), 409
         # ---------- create ----------
         session = TutoringSession(
             subject=data["subject"].strip(),
@@ -671,7 +1182,7 @@ def create_tutoring_session():
             tutor_id=user.id,
             school_id=user.school_id,
             time_slot=time_slot,
-            duration_minutes=data.get("duration_minutes", 60),
+            duration_minutes=duration,
             max_students=data.get("max_students", 20),
             meeting_link=(data.get("meeting_link") or "").strip() or None,
             meeting_password=(data.get("meeting_password") or "").strip() or None,
@@ -686,15 +1197,54 @@ def create_tutoring_session():
         current_app.logger.error("Error creating tutoring session: %s", e, exc_info=True)
         return jsonify(error="Failed to create tutoring session"), 500
 
+@hub_bp.route('/tutors/<int:tutor_id>/free-slots', methods=['GET'])
+@jwt_required()
+def get_tutor_free_slots(tutor_id):
+    """
+    Free time in a tutor's week. week_start (YYYY-MM-DD) defaults to this
+    week's Monday; day_start/day_end (HH:MM) bound the working day.
+    """
+    try:
+        tutor = User.query.get(tutor_id)
+        if not tutor:
+            return jsonify({'error': 'Tutor not found'}), 404
+
+        try:
+            if request.args.get('week_start'):
+                first_day = datetime.strptime(request.args['week_start'], '%Y-%m-%d').date()
+            else:
+                today = datetime.utcnow().date()
+                first_day = today - timedelta(days=today.weekday())
+            day_start = datetime.strptime(request.args.get('day_start', '08:00'), '%H:%M').time()
+            day_end = datetime.strptime(request.args.get('day_end', '17:00'), '%H:%M').time()
+        except ValueError:
+            return jsonify({'error': 'Invalid date or time format'}), 400
+        if day_end <= day_start:
+            return jsonify({'error': 'day_end must be after day_start'}), 400
+
+        days = min(max(request.args.get('days', 7, type=int), 1), 31)
+        min_minutes = max(request.args.get('min_minutes', 30, type=int), 1)
+
+        return jsonify({
+            'tutor_id': tutor_id,
+            'week_start': first_day.isoformat(),
+            'days': free_slots(tutor_id, first_day, days=days, day_start=day_start,
+                               day_end=day_end, min_minutes=min_minutes)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching free slots: {str(e)}")
+        return jsonify({'error': 'Failed to fetch free slots'}), 500
+
 @hub_bp.route('/tutoring-sessions/<int:session_id>/join', methods=['POST'])
 @jwt_required()
-def join_tutoring_session():
+def join_tutoring_session(session_id):
     """Join a tutoring session"""
     try:
-        current_user = get_jwt_identity()
-        user = User.query.get(int(current_user))
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
-        session_id = request.view_args['session_id']
         session = TutoringSession.query.get_or_404(session_id)
         
         # Check if session is still available
@@ -704,9 +1254,6 @@ def join_tutoring_session():
         if session.time_slot <= datetime.utcnow():
             return jsonify({'error': 'Session has already started or ended'}), 400
         
-        if session.available_slots <= 0:
-            return jsonify({'error': 'Session is full'}), 400
-        
         # Check if user already enrolled
         existing_enrollment = TutoringEnrollment.query.filter(
             and_(
@@ -721,6 +1268,12 @@ def join_tutoring_session():
         if existing_enrollment:
             return jsonify({'error': 'You are already enrolled in this session'}), 400
         
+        # Take a seat atomically; the unique constraints catch a racing duplicate
+        try:
+            reservation = reserve_seat(TutoringSession, session.id)
+        except CapacityError as e:
+            return jsonify({'error': 'Session is full', 'capacity': capacity_dict(e.reservation)}), 400
+        
         # Determine enrollment type based on user role
         enrollment_type = 'teacher' if user.role == 'teacher' else 'student'
         
@@ -736,20 +1289,51 @@ def join_tutoring_session():
         db.session.add(enrollment)
         db.session.commit()
         
-        return jsonify(enrollment.to_dict()), 201
+        return jsonify({**enrollment.to_dict(), 'capacity': capacity_dict(reservation)}), 201
         
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'You are already enrolled in this session'}), 400
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error joining session: {str(e)}")
         return jsonify({'error': 'Failed to join session'}), 500
 
+@hub_bp.route('/tutoring-sessions/<int:session_id>/join', methods=['DELETE'])
+@jwt_required()
+def leave_tutoring_session(session_id):
+    """Cancel an enrollment and give the seat back"""
+    try:
+        user_id = current_user_id()
+        enrollment = TutoringEnrollment.query.filter(
+            TutoringEnrollment.session_id == session_id,
+            or_(
+                TutoringEnrollment.student_id == user_id,
+                TutoringEnrollment.teacher_id == user_id
+            )
+        ).first()
+        if not enrollment:
+            return jsonify({'error': 'You are not enrolled in this session'}), 404
+
+        db.session.delete(enrollment)
+        reservation = release_seat(TutoringSession, session_id)
+        db.session.commit()
+
+        return jsonify({'message': 'Enrollment cancelled', 'capacity': capacity_dict(reservation)}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error leaving session: {str(e)}")
+        return jsonify({'error': 'Failed to leave session'}), 500
+
 @hub_bp.route('/tutoring-sessions/<int:session_id>/feedback', methods=['POST'])
 @jwt_required()
 def submit_session_feedback():
     """Submit feedback for a tutoring session"""
     try:
-        current_user = get_jwt_identity()
-        user = User.query.get(int(current_user))
+        user = load_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
         session_id = request.view_args['session_id']
         data = request.get_json()
@@ -1,10 +1,14 @@
 import random
 import string
 from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from models import School, User, Subject, SchoolClass, SchoolAnnouncement
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from extensions import db
+from utils.auth import require_role, same_school
+from utils.roster_export import FORMATS as ROSTER_FORMATS, ROSTERS, stream_roster
+from utils import school_stats
+from utils.response_cache import dashboard_cache
 import traceback
 
 def generate_school_code():
@@ -110,6 +114,7 @@ def create_school():
 
         # Set school owner
         new_school.owner_id = admin_user.id
+        school_stats.ensure(new_school.id)
         db.session.commit()
 
         return jsonify({
@@ -164,16 +169,9 @@ def get_school(school_id):
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
 @school_bp.route('/<int:school_id>/subjects', methods=['POST'])
-@jwt_required()
+@require_role('school_admin', 'system_owner')
 def add_school_subject(school_id):
     try:
-        # Authentication and authorization
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        if not current_user or current_user.role not in ['school_admin', 'system_owner']:
-            return jsonify({'error': 'Unauthorized'}), 403
-
         # Validate school exists
         school = School.query.get(school_id)
         if not school:
@@ -238,15 +236,9 @@ def add_school_subject(school_id):
         return jsonify({'error': str(e)}), 500
 
 @school_bp.route('/<int:school_id>/subjects', methods=['GET'])
-@jwt_required()
+@require_role('school_admin', 'teacher', 'system_owner')
 def get_all_subjects_for_school(school_id):
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-
-        if not current_user or current_user.role not in ['school_admin', 'teacher', 'system_owner']:
-            return jsonify({'error': 'Unauthorized'}), 403
-
         school = School.query.get(school_id)
         if not school:
             return jsonify({'error': 'School not found'}), 404
@@ -268,14 +260,8 @@ def get_all_subjects_for_school(school_id):
 
 
 @school_bp.route('/<int:school_id>/dashboard-settings', methods=['PUT'])
-@jwt_required()
+@require_role('school_admin', 'system_owner')
 def update_school_dashboard_settings(school_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-
-    if not user or user.role not in ['school_admin', 'system_owner']:
-        return jsonify({'error': 'Unauthorized'}), 403
-
     school = School.query.get(school_id)
     if not school:
         return jsonify({'error': 'School not found'}), 404
@@ -296,23 +282,14 @@ def update_school_dashboard_settings(school_id):
         return jsonify({'error': 'Failed to update settings', 'details': str(e)}), 500
 
 @school_bp.route('/<int:school_id>/teachers', methods=['GET'])
-@jwt_required()
+@require_role('school_admin', 'admin', 'system_owner')
+@same_school
 def get_school_teachers(school_id):
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
         school = School.query.get(school_id)
         if not school:
             return jsonify({'error': 'School not found'}), 404
 
-        # Check permissions
-        if not ((user.role in ['school_admin', 'admin', 'system_owner']) and user.school_id == school_id):
-            return jsonify({'error': 'Insufficient permissions to view teachers'}), 403
-
         teachers = User.query.filter_by(school_id=school_id, role='teacher', is_active=True).all()
 
         return jsonify({'teachers': [t.to_dict() for t in teachers]}), 200
@@ -321,22 +298,14 @@ def get_school_teachers(school_id):
         return jsonify({'error': 'Failed to fetch teachers', 'details': str(e)}), 500
 
 @school_bp.route('/<int:school_id>/students', methods=['GET'])
-@jwt_required()
+@require_role('school_admin', 'admin', 'system_owner')
+@same_school
 def get_school_students(school_id):
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
         school = School.query.get(school_id)
         if not school:
             return jsonify({'error': 'School not found'}), 404
 
-        if not ((user.role in ['school_admin', 'admin', 'system_owner']) and user.school_id == school_id):
-            return jsonify({'error': 'Insufficient permissions to view students'}), 403
-
         students = User.query.filter_by(school_id=school_id, role='student', is_active=True).all()
 
         return jsonify({'students': [s.to_dict() for s in students]}), 200
@@ -367,7 +336,10 @@ def add_class(school_id):
         )
 
         db.session.add(new_class)
+        db.session.flush()
+        school_stats.record_class(school.id)
         db.session.commit()
+        dashboard_cache.invalidate(school.id)
 
         return jsonify({
             'message': 'Class created',
@@ -403,6 +375,7 @@ def create_announcement(school_id):
     )
     db.session.add(announcement)
     db.session.commit()
+    dashboard_cache.invalidate(school_id)
     return jsonify(announcement.to_dict()), 201
 
 @school_bp.route('/<int:school_id>/announcements', methods=['GET'])
@@ -513,6 +486,7 @@ def update_school(school_id):
         school.level = 'high school'
         school.updated_at = datetime.utcnow()
         db.session.commit()
+        dashboard_cache.invalidate(school_id)
 
         return jsonify({'message': 'School updated successfully', 'school': school.to_dict()}), 200
 
@@ -542,6 +516,7 @@ def delete_school(school_id):
         school.is_active = False
         school.updated_at = datetime.utcnow()
         db.session.commit()
+        dashboard_cache.invalidate(school_id)
 
         return jsonify({'message': 'School deleted successfully'}), 200
 
@@ -606,6 +581,7 @@ def update_school_class(school_id, class_id):
 
         school_class.updated_at = datetime.utcnow()
         db.session.commit()
+        dashboard_cache.invalidate(school_id)
 
         return jsonify({'message': 'Class updated successfully', 'class': school_class.to_dict()}), 200
 
@@ -639,9 +615,40 @@ def delete_school_class(school_id, class_id):
         school_class.is_active = False
         school_class.updated_at = datetime.utcnow()
         db.session.commit()
+        dashboard_cache.invalidate(school_id)
 
         return jsonify({'message': 'Class deleted successfully'}), 200
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': 'Failed to delete class', 'details': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to delete class', 'details': str(e)}), 500
+
+
+@school_bp.route('/<int:school_id>/export/<kind>', methods=['GET'])
+@require_role('school_admin', 'system_owner')
+@same_school(bypass_roles=('system_owner',))
+def export_roster(school_id, kind):
+    """
+    Stream a school's students, teachers or enrollments as CSV (default)
+    or NDJSON (?format=ndjson), for ministry returns and timetabling tools.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if kind not in ROSTERS:
+        return jsonify({'error': f"Unknown export '{kind}'", 'available': sorted(ROSTERS)}), 404
+    if fmt not in ROSTER_FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    school = School.query.get(school_id)
+    if not school:
+        return jsonify({'error': 'School not found'}), 404
+
+    current_app.logger.info(f"Exporting {kind} for school {school_id} as {fmt}")
+    return Response(
+        stream_with_context(stream_roster(kind, school_id, fmt)),
+        mimetype=ROSTER_FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename={school.school_code}_{kind}.{fmt}',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
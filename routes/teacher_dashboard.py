@@ -1,9 +1,11 @@
-from flask import Blueprint, jsonify, current_app
+from flask import Blueprint, jsonify, current_app, request
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
 from werkzeug.security import check_password_hash
 from datetime import datetime, timedelta
-from models import School, User, SchoolClass, Enrollment
+from models import School, User, SchoolClass, Enrollment, Attendance
 from extensions import db
+from utils import attendance_rollup
+from utils.response_cache import dashboard_cache
 
 teacher_bp = Blueprint('teacher_dashboard', __name__, url_prefix='/api/schools')
 
@@ -28,56 +30,20 @@ def teacher_dashboard(school_id):
                 'details': 'You are not registered as a teacher at this school'
             }), 404
 
-        # Get the school directly
-        school = School.query.get(school_id)
-        if not school:
+        # Shared by every request of this teacher until it goes stale or the school changes
+        teacher_id = teacher.id
+        response_data = dashboard_cache.get_or_compute(
+            'teacher_dashboard', school_id, 'teacher',
+            lambda: build_teacher_dashboard(school_id, teacher_id),
+            variant=teacher_id
+        )
+        if response_data is None:
             current_app.logger.error(f"School not found: {school_id}")
             return jsonify({
                 'error': 'School not found',
                 'details': 'The specified school does not exist'
             }), 404
 
-        # Get classes with proper error handling
-        classes = []
-        try:
-            classes = SchoolClass.query.filter_by(
-                teacher_id=teacher.id,
-                school_id=school.id
-            ).all()
-        except Exception as e:
-            current_app.logger.error(f"Error loading classes: {str(e)}")
-            classes = []
-
-        # Prepare response data
-        response_data = {
-            'teacher': {
-                'id': teacher.id,
-                'full_name': f"{teacher.first_name} {teacher.last_name}",
-                'tsc_number': teacher.tsc_number,  # TSC number
-                'national_id': teacher.national_id,  # National ID
-                'identification': teacher.tsc_number or teacher.national_id or 'Not provided'
-            },
-            'school': {
-                'id': school.id,
-                'name': school.name
-            },
-            'subjects': [subject.name for subject in teacher.subjects] if teacher.subjects else [],
-            'classes': [{
-                'id': cls.id,
-                'name': cls.name,
-                'subject': getattr(cls, 'subject', 'General'),
-                'student_count': getattr(cls, 'current_enrollment', 0),
-                'average_grade': 0  # You'll need to implement this
-            } for cls in classes],
-            'students': {
-                'total': 0,  # Implement student count logic
-                'list': []   # Implement student list logic
-            },
-            'assignments': {
-                'upcoming': []  # Implement assignments logic
-            }
-        }
-
         return jsonify(response_data)
 
     except Exception as e:
@@ -87,6 +53,56 @@ def teacher_dashboard(school_id):
             'details': str(e)
         }), 500
 
+def build_teacher_dashboard(school_id, teacher_id):
+    """The teacher dashboard payload (None if the school does not exist); safe to run off-request"""
+    teacher = db.session.get(User, teacher_id)
+
+    # Get the school directly
+    school = School.query.get(school_id)
+    if not school:
+        return None
+
+    # Get classes with proper error handling
+    classes = []
+    try:
+        classes = SchoolClass.query.filter_by(
+            teacher_id=teacher.id,
+            school_id=school.id
+        ).all()
+    except Exception as e:
+        current_app.logger.error(f"Error loading classes: {str(e)}")
+        classes = []
+
+    # Prepare response data
+    return {
+        'teacher': {
+            'id': teacher.id,
+            'full_name': f"{teacher.first_name} {teacher.last_name}",
+            'tsc_number': teacher.tsc_number,  # TSC number
+            'national_id': teacher.national_id,  # National ID
+            'identification': teacher.tsc_number or teacher.national_id or 'Not provided'
+        },
+        'school': {
+            'id': school.id,
+            'name': school.name
+        },
+        'subjects': [subject.name for subject in teacher.subjects] if teacher.subjects else [],
+        'classes': [{
+            'id': cls.id,
+            'name': cls.name,
+            'subject': getattr(cls, 'subject', 'General'),
+            'student_count': getattr(cls, 'current_enrollment', 0),
+            'average_grade': 0  # You'll need to implement this
+        } for cls in classes],
+        'students': {
+            'total': 0,  # Implement student count logic
+            'list': []   # Implement student list logic
+        },
+        'assignments': {
+            'upcoming': []  # Implement assignments logic
+        }
+    }
+
 @teacher_bp.route('/<int:school_id>/teacher/attendance', methods=['POST'])
 @jwt_required()
 def record_attendance(school_id):
@@ -115,10 +131,14 @@ def record_attendance(school_id):
             )
             db.session.add(attendance)
 
+        attendance_rollup.record(school_id, class_id, date_obj, [record['status'] for record in records])
+
         db.session.commit()
+        dashboard_cache.invalidate(school_id)
         return jsonify({'message': 'Attendance recorded successfully'}), 201
 
     except Exception as e:
+        db.session.rollback()
         print(f"Attendance error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -1,13 +1,23 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from werkzeug.security import generate_password_hash
 from models import User, School, Subject, teacher_subject, SchoolClass, Enrollment
 from sqlalchemy.exc import IntegrityError
 from extensions import db
 from datetime import datetime
+from utils.auth import current_role, current_school_id, current_user_id, require_role, same_school
+from utils.bulk_import import (
+    ImportFormatError, ImportTooLargeError, ROLES as IMPORT_ROLES, created_dict, credentials_csv, import_users,
+    iter_records, read_rows
+)
+from utils.pagination import encode_cursor, decode_cursor
+from utils.response_cache import dashboard_cache
+from utils import enrollment_trends, school_stats
+from utils.security import generate_secure_password
+from utils.throttle import login_misses
+from utils.token_store import verify_cache
+from utils.user_directory import directory_page, parse_fields, subjects_by_teacher
 import traceback
-import string
-import secrets
 import re
 
 user_bp = Blueprint('users', __name__, url_prefix='/api/users')
@@ -59,17 +69,6 @@ def create_user(school_id):
             }), 400
 
         # ===== PASSWORD GENERATION =====
-        def generate_secure_password():
-            alphabet = string.ascii_letters + string.digits
-            while True:
-                password = ''.join(secrets.choice(alphabet) for _ in range(10))
-                if (
-                    any(c.islower() for c in password)
-                    and any(c.isupper() for c in password)
-                    and any(c.isdigit() for c in password)
-                ):    
-                    return password
-
         try:
             default_password = generate_secure_password()
             password_hash = generate_password_hash(default_password)
@@ -219,8 +218,15 @@ def create_user(school_id):
             # For teachers, add subjects through the association table
             if role == 'teacher' and valid_subjects:
                 new_user.subjects = valid_subjects
+
+            if role == 'teacher':
+                school_stats.record_users(school_id, teachers=1)
+            elif role == 'student':
+                school_stats.record_users(school_id, students=1)
             
             db.session.commit()
+            login_misses.discard_user(new_user)
+            dashboard_cache.invalidate(school_id)
 
             # For students, create enrollment record
             if role == 'student':
@@ -241,8 +247,11 @@ def create_user(school_id):
                 
                 # Update class enrollment count
                 school_class.current_enrollment += 1
+                school_stats.record_users(school_id, active_enrollments=1)
                 
                 db.session.commit()
+                enrollment_trends.invalidate(school_id)
+                dashboard_cache.invalidate(school_id)
 
             response_data = {
                 'message': f"{role.title()} created successfully",
@@ -276,46 +285,109 @@ def create_user(school_id):
             'details': str(e)
         }), 500
 
+@user_bp.route('/<int:school_id>/import', methods=['POST'])
+@require_role('school_admin', 'system_owner')
+@same_school(bypass_roles=('system_owner',))
+def bulk_import_users(school_id):
+    """
+    Create many students (or teachers) at once from a CSV/JSON file upload
+    (multipart field `file`) or a JSON body. Valid rows are imported, the
+    rest come back in `errors` with their line number. ?format=csv returns
+    the credentials sheet as a download instead of JSON; ?dry_run=true only
+    validates. Uploads with more than BULK_IMPORT_HTTP_MAX_ROWS valid rows
+    are refused with 413; those go through `flask users import`.
+    """
+    try:
+        if School.query.get(school_id) is None:
+            return jsonify({'error': 'School not found'}), 404
+
+        options = request.args if request.is_json else (request.form or request.args)
+        default_role = options.get('role', 'student')
+        if default_role not in IMPORT_ROLES:
+            return jsonify({'error': 'Invalid role specified'}), 400
+        dry_run = options.get('dry_run', 'false').lower() == 'true'
+        as_csv = options.get('format', 'json').lower() == 'csv'
+
+        upload = request.files.get('file')
+        if upload is not None:
+            rows = read_rows(upload.stream, filename=upload.filename, content_type=upload.mimetype)
+        elif request.is_json:
+            rows = iter_records(request.get_json())
+        else:
+            return jsonify({'error': 'Upload a CSV/JSON file as "file" or send a JSON list'}), 400
+
+        try:
+            result = import_users(
+                school_id, rows,
+                default_role=default_role,
+                batch_size=current_app.config.get('BULK_IMPORT_BATCH_SIZE', 500),
+                workers=current_app.config.get('BULK_IMPORT_HASH_WORKERS'),
+                dry_run=dry_run,
+                max_rows=current_app.config.get('BULK_IMPORT_HTTP_MAX_ROWS', 200)
+            )
+        except ImportTooLargeError as e:
+            return jsonify({'error': str(e)}), 413
+        except ImportFormatError as e:
+            return jsonify({'error': str(e)}), 400
+
+        summary = result['summary']
+        current_app.logger.info(
+            f"Bulk import for school {school_id}: {summary['created']} created, "
+            f"{summary['failed']} rejected in {summary['duration_ms']}ms"
+        )
+
+        if as_csv:
+            return Response(
+                credentials_csv(result),
+                mimetype='text/csv',
+                headers={
+                    'Content-Disposition': f'attachment; filename=credentials_school_{school_id}.csv',
+                    'X-Import-Created': str(summary['created']),
+                    'X-Import-Failed': str(summary['failed'])
+                }
+            )
+
+        status = 200 if dry_run or not summary['created'] else 201
+        return jsonify({
+            'summary': summary,
+            'dry_run': dry_run,
+            'created': [created_dict(r) for r in result['created']],
+            'errors': result['errors']
+        }), status
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error importing users for school {school_id}: {str(e)}")
+        return jsonify({'error': 'Import failed', 'details': str(e)}), 500
+
 @user_bp.route('', methods=['GET'])
-@jwt_required()
+@require_role('school_admin', 'system_owner')
 def get_users():
-    """Get users for the current school with enhanced teacher subject data"""
+    """
+    Users of the current school, a page at a time (ordered by name).
+    ?role= / ?active= filter, ?fields=id,first_name,last_name picks the
+    returned fields, ?limit= (max 200) and ?cursor= page through.
+    """
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        if not current_user or current_user.role not in ['school_admin', 'system_owner']:
-            return jsonify({'error': 'Unauthorized'}), 403
-            
-        # Get query parameters
         role_filter = request.args.get('role')
         active_only = request.args.get('active', 'true').lower() == 'true'
-        
-        # Base query
-        query = User.query.filter_by(school_id=current_user.school_id)
-        
-        # Apply filters
-        if role_filter:
-            query = query.filter_by(role=role_filter)
-        if active_only:
-            query = query.filter_by(is_active=True)
-            
-        users = query.all()
-        
-        # Enhanced user data with subjects for teachers
-        users_data = []
-        for user in users:
-            user_dict = user.to_dict()
-            if user.role == 'teacher':
-                user_dict['subjects'] = [{
-                    'id': sub.id,
-                    'name': sub.name
-                } for sub in user.subjects]
-            users_data.append(user_dict)
-        
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        try:
+            fields = parse_fields(request.args.get('fields'))
+            after = decode_cursor(request.args.get('cursor'), 3)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        users_data, next_key, total = directory_page(
+            current_school_id(), role=role_filter, active_only=active_only,
+            limit=limit, after=after, fields=fields
+        )
+
         return jsonify({
             'users': users_data,
-            'count': len(users_data)
+            'count': len(users_data),
+            'total': total,
+            'next_cursor': encode_cursor(next_key) if next_key else None
         }), 200
         
     except Exception as e:
@@ -327,25 +399,17 @@ def get_users():
 def get_user(user_id):
     """Get specific user details with enhanced information"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
         # Authorization - admins or the user themselves
-        if not current_user or (current_user.id != user_id and current_user.role not in ['school_admin', 'system_owner']):
+        if current_user_id() != user_id and current_role() not in ['school_admin', 'system_owner']:
             return jsonify({'error': 'Unauthorized'}), 403
             
         user = User.query.get(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        user_data = user.to_dict()
-        
-        # Add subjects for teachers
-        if user.role == 'teacher':
-            user_data['subjects'] = [{
-                'id': sub.id,
-                'name': sub.name
-            } for sub in user.subjects]
+        # Teachers' subjects in one query, as {'id', 'name'} pairs
+        subjects = subjects_by_teacher([user.id]) if user.role == 'teacher' else {}
+        user_data = user.to_dict(subjects=subjects.get(user.id))
             
         return jsonify(user_data), 200
         
@@ -379,7 +443,9 @@ def update_user(user_id):
         if 'phone' in data:
             user.phone = data['phone'].strip()
         if 'is_active' in data and current_user.role in ['school_admin', 'system_owner']:
+            was_active = user.is_active
             user.is_active = bool(data['is_active'])
+            school_stats.record_user_activation(user, was_active)
             
         # Role-specific updates
         if user.role == 'student' and 'grade_level' in data:
@@ -425,6 +491,9 @@ def update_user(user_id):
             
         user.updated_at = datetime.utcnow()
         db.session.commit()
+        login_misses.discard_user(user)
+        verify_cache.discard_user(user.id)
+        dashboard_cache.invalidate(user.school_id)
         
         return jsonify({
             'message': 'User updated successfully',
@@ -0,0 +1,163 @@
+"""
+Benchmark the student/teacher login lookups as the users table grows.
+
+Fills a scratch database with synthetic schools and users in steps and,
+after each step, times the exact queries student_login and teacher_login
+run (utils/auth.py) and prints the plan the database chose. With the login
+indexes in place the cost per lookup stays flat from thousands to millions
+of rows; --without-indexes drops them to show the scans they replace.
+
+    python scripts/benchmark_login_lookup.py
+    python scripts/benchmark_login_lookup.py --sizes 100000,1000000,3000000 \\
+        --database-url postgresql://localhost/shulehub_bench
+
+Never point it at a real database: it refuses to run unless `users` is empty.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert, text
+
+from extensions import db
+from models import School, User
+from utils.auth import student_login_query, teacher_login_query
+
+LOGIN_INDEXES = ['ix_users_school_admission', 'ix_users_school_upper_tsc', 'ix_users_school_role_active']
+BATCH = 50_000
+
+
+def make_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed_schools(count):
+    db.session.execute(insert(School), [{
+        'name': f'Bench School {i}',
+        'address': 'Bench',
+        'phone': '0700000000',
+        'email': f'bench{i}@example.com',
+        'school_type': 'public',
+        'county': 'Nairobi',
+        'registration_number': f'BENCH{i:06d}',
+        'school_code': f'B{i:07d}',
+    } for i in range(count)])
+    db.session.commit()
+    return [row[0] for row in db.session.query(School.id).order_by(School.id)]
+
+
+def user_row(n, school_ids):
+    school_id = school_ids[n % len(school_ids)]
+    if n % 10:
+        return {'first_name': 'S', 'last_name': str(n), 'role': 'student', 'school_id': school_id,
+                'admission_number': f'ADM{n:09d}', 'is_active': True}
+    # Teachers: half by TSC number (stored lower case, as some legacy rows are), half by national id
+    if n % 20:
+        return {'first_name': 'T', 'last_name': str(n), 'role': 'teacher', 'school_id': school_id,
+                'tsc_number': f'tsc{n:09d}', 'is_active': True}
+    return {'first_name': 'T', 'last_name': str(n), 'role': 'teacher', 'school_id': school_id,
+            'national_id': f'{n:09d}', 'is_active': True}
+
+
+def grow(start, stop, school_ids):
+    for lo in range(start, stop, BATCH):
+        hi = min(lo + BATCH, stop)
+        db.session.execute(insert(User), [user_row(n, school_ids) for n in range(lo, hi)])
+        db.session.commit()
+
+
+def lookups(size, school_ids, count, rng):
+    """(kind, query) pairs for random existing users, plus a few misses"""
+    queries = []
+    for _ in range(count):
+        n = rng.randrange(size)
+        row = user_row(n, school_ids)
+        if row['role'] == 'student':
+            queries.append(('student', student_login_query(row['school_id'], row['admission_number'])))
+        elif row.get('tsc_number'):
+            queries.append(('teacher_tsc', teacher_login_query(row['school_id'], 'tsc_number', row['tsc_number'].upper())))
+        else:
+            queries.append(('teacher_national_id', teacher_login_query(row['school_id'], 'national_id', row['national_id'])))
+    queries.append(('student', student_login_query(school_ids[0], 'NO-SUCH-ADM')))
+    return queries
+
+
+def plan(query):
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + str(statement))).all()
+    return ' | '.join(str(row[-1]) for row in rows)
+
+
+def measure(size, school_ids, count, rng):
+    timings = {}
+    samples = {}
+    for kind, query in lookups(size, school_ids, count, rng):
+        started = time.perf_counter()
+        query.first()
+        timings.setdefault(kind, []).append(time.perf_counter() - started)
+        samples.setdefault(kind, query)
+    db.session.rollback()
+    return timings, {kind: plan(query) for kind, query in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=None, help='Scratch database (default: a temporary SQLite file)')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated users table sizes')
+    parser.add_argument('--schools', type=int, default=2000)
+    parser.add_argument('--lookups', type=int, default=2000, help='Lookups timed at each size')
+    parser.add_argument('--without-indexes', action='store_true', help='Drop the login indexes first')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'login_bench.db')
+    sizes = sorted(int(s) for s in args.sizes.split(','))
+    rng = random.Random(args.seed)
+
+    app = make_app(url)
+    with app.app_context():
+        db.create_all()
+        if db.session.query(User.id).first() is not None:
+            sys.exit('users is not empty - run this against a scratch database only')
+        if args.without_indexes:
+            for name in LOGIN_INDEXES:
+                db.session.execute(text(f'DROP INDEX IF EXISTS {name}'))
+            db.session.commit()
+
+        print(f"database: {db.engine.url.render_as_string(hide_password=True)}")
+        print(f"login indexes: {'dropped' if args.without_indexes else 'present'}\n")
+        school_ids = seed_schools(args.schools)
+
+        current = 0
+        plans = {}
+        print(f"{'users':>10}  {'kind':<20} {'mean ms':>9} {'p95 ms':>9}")
+        for size in sizes:
+            grow(current, size, school_ids)
+            current = size
+            db.session.execute(text('ANALYZE users'))
+            db.session.commit()
+            timings, plans = measure(size, school_ids, args.lookups, rng)
+            for kind, samples in sorted(timings.items()):
+                samples.sort()
+                mean = sum(samples) / len(samples) * 1000
+                p95 = samples[int(len(samples) * 0.95) - 1 if len(samples) > 1 else 0] * 1000
+                print(f"{size:>10}  {kind:<20} {mean:>9.3f} {p95:>9.3f}")
+
+        print('\nplans at the largest size:')
+        for kind, chosen in sorted(plans.items()):
+            print(f"  {kind:<20} {chosen}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Daily attendance rollup (attendance_daily).
+
+One row per (school, date, class) holds the number of present / absent /
+late / excused marks. record_attendance adds to it in the same transaction
+as the attendance_records it inserts, so trends, weekly and term figures
+are sums over a few rows per day rather than counts over every mark:
+
+    rates over a term    ~90 rows per class, read through the primary key
+                         (school_id, date, class_id)
+
+A mark counts as attended when it is present or late; excused marks are
+left out of the rate altogether. Weekly rates are taken over the days that
+actually have marks, so short weeks and holidays do not drag them down.
+
+Rows can be rebuilt from attendance_records with
+
+    flask attendance rebuild [--school-id N] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Attendance, AttendanceDaily, School
+
+STATUSES = ('present', 'absent', 'late', 'excused')
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def record(school_id, class_id, day, statuses):
+    """Count a batch of marks (their status strings) for one class and day"""
+    counts = Counter(status for status in statuses if status in STATUSES)
+    if not counts:
+        return
+    now = datetime.utcnow()
+    key = (
+        (AttendanceDaily.school_id == school_id) &
+        (AttendanceDaily.class_id == class_id) &
+        (AttendanceDaily.date == day)
+    )
+    values = {status: getattr(AttendanceDaily, status) + n for status, n in counts.items()}
+    values['updated_at'] = now
+
+    if db.session.execute(update(AttendanceDaily).where(key).values(**values)).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(AttendanceDaily(
+                school_id=school_id, class_id=class_id, date=day, updated_at=now,
+                **{status: counts.get(status, 0) for status in STATUSES}
+            ))
+    except IntegrityError:
+        # First mark of the day raced with another request; add to its row
+        db.session.execute(update(AttendanceDaily).where(key).values(**values))
+
+# -----------------------------------------------------------
+# Reads
+# -----------------------------------------------------------
+
+def _sums():
+    return [func.coalesce(func.sum(getattr(AttendanceDaily, status)), 0).label(status) for status in STATUSES]
+
+
+def _filtered(query, school_id, start, end, class_id=None):
+    query = query.filter(
+        AttendanceDaily.school_id == school_id,
+        AttendanceDaily.date >= start,
+        AttendanceDaily.date <= end
+    )
+    if class_id is not None:
+        query = query.filter(AttendanceDaily.class_id == class_id)
+    return query
+
+
+def rate(counts):
+    """Attended (present + late) as a percentage of non-excused marks"""
+    marked = counts['present'] + counts['absent'] + counts['late']
+    if not marked:
+        return 0
+    return round((counts['present'] + counts['late']) / marked * 100, 1)
+
+
+def _entry(counts, **extra):
+    counts = {status: int(counts[status]) for status in STATUSES}
+    return {**extra, **counts, 'rate': rate(counts)}
+
+
+def totals(school_id, start, end, class_id=None):
+    """Summed counts and rate for a date range"""
+    row = _filtered(db.session.query(*_sums()), school_id, start, end, class_id).one()
+    return _entry(row._mapping)
+
+
+def daily(school_id, start, end, class_id=None):
+    """Counts and rate for each day in the range that has marks"""
+    rows = _filtered(
+        db.session.query(AttendanceDaily.date, *_sums()), school_id, start, end, class_id
+    ).group_by(AttendanceDaily.date).order_by(AttendanceDaily.date).all()
+    return [_entry(row._mapping, date=row.date.isoformat()) for row in rows]
+
+
+def weekly(school_id, start, end, class_id=None):
+    """Days folded into Monday-based weeks; `days` is how many had marks"""
+    weeks = {}
+    for day in daily(school_id, start, end, class_id):
+        monday = week_start(datetime.strptime(day['date'], '%Y-%m-%d').date()).isoformat()
+        week = weeks.setdefault(monday, {'days': 0, **{status: 0 for status in STATUSES}})
+        week['days'] += 1
+        for status in STATUSES:
+            week[status] += day[status]
+    return [_entry(counts, week_start=monday, days=counts['days']) for monday, counts in sorted(weeks.items())]
+
+
+def by_class(school_id, start, end):
+    """Counts and rate per class over the range"""
+    rows = _filtered(
+        db.session.query(AttendanceDaily.class_id, *_sums()), school_id, start, end
+    ).group_by(AttendanceDaily.class_id).order_by(AttendanceDaily.class_id).all()
+    return [_entry(row._mapping, class_id=row.class_id) for row in rows]
+
+# -----------------------------------------------------------
+# Rebuild
+# -----------------------------------------------------------
+
+def rebuild(school_id=None, start=None, end=None):
+    """Replace rollup rows with counts from attendance_records; returns rows written"""
+    conditions = []
+    if school_id is not None:
+        conditions.append((AttendanceDaily.school_id == school_id, Attendance.school_id == school_id))
+    if start is not None:
+        conditions.append((AttendanceDaily.date >= start, Attendance.date >= start))
+    if end is not None:
+        conditions.append((AttendanceDaily.date <= end, Attendance.date <= end))
+
+    db.session.execute(delete(AttendanceDaily).where(*[rollup for rollup, _ in conditions]))
+    counts = [func.count(case((Attendance.status == status, Attendance.id))) for status in STATUSES]
+    source = select(
+        Attendance.school_id, Attendance.date, Attendance.class_id, *counts, func.now()
+    ).where(
+        *[records for _, records in conditions]
+    ).group_by(Attendance.school_id, Attendance.date, Attendance.class_id)
+    result = db.session.execute(insert(AttendanceDaily).from_select(
+        ['school_id', 'date', 'class_id', *STATUSES, 'updated_at'], source
+    ))
+    return result.rowcount
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+
+attendance_cli = AppGroup('attendance', help='Attendance maintenance commands')
+
+
+@attendance_cli.command('rebuild')
+@click.option('--school-id', type=int, default=None, help='Only rebuild this school.')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='First date (inclusive).')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Last date (inclusive).')
+def rebuild_command(school_id, start, end):
+    """Recompute attendance_daily from attendance_records."""
+    if school_id is not None and db.session.get(School, school_id) is None:
+        raise click.ClickException(f'School {school_id} not found')
+    written = rebuild(school_id, start.date() if start else None, end.date() if end else None)
+    db.session.commit()
+    click.echo(f"Rebuilt {written} attendance_daily row(s)")
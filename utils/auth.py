@@ -0,0 +1,109 @@
+"""
+Request-scoped identity and claims-based authorization.
+
+Access tokens issued by auth_routes carry `role` and `school_id` claims, so
+most permission checks can be answered from the verified token alone. The
+full User row is only fetched when a view actually needs it, and then at
+most once per request (cached on flask.g). Tokens minted before a claim
+existed fall back to that same cached row.
+
+    @hub_bp.route('/live-classes', methods=['POST'])
+    @require_role('teacher')
+    def schedule_class(): ...
+
+    @school_bp.route('/<int:school_id>/students')
+    @require_role('school_admin', 'admin', 'system_owner')
+    @same_school
+    def get_school_students(school_id): ...
+"""
+from functools import wraps
+
+from flask import g, jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+
+from extensions import db
+from models import User
+
+_MISSING = object()
+
+
+def current_user_id():
+    identity = get_jwt_identity()
+    return int(identity) if identity is not None else None
+
+
+def load_current_user():
+    """The authenticated User, loaded at most once per request (None if it no longer exists)"""
+    user = g.get('_auth_user', _MISSING)
+    if user is _MISSING:
+        user_id = current_user_id()
+        user = db.session.get(User, user_id) if user_id is not None else None
+        g._auth_user = user
+    return user
+
+
+def _claim(name):
+    claims = get_jwt()
+    if name in claims:
+        return claims[name]
+    user = load_current_user()
+    return getattr(user, name, None) if user else None
+
+
+def current_role():
+    return _claim('role')
+
+
+def current_school_id():
+    return _claim('school_id')
+
+
+def require_role(*roles):
+    """Reject the request with 403 unless the token's role is one of `roles`"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            if current_role() not in roles:
+                return jsonify({'error': 'Unauthorized'}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def same_school(fn=None, *, param='school_id', bypass_roles=()):
+    """
+    Reject the request with 403 unless the `param` URL argument matches the
+    token's school_id. Roles in `bypass_roles` may act on any school.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            if current_role() not in bypass_roles and kwargs.get(param) != current_school_id():
+                return jsonify({'error': 'Unauthorized'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+
+    return decorator(fn) if fn is not None else decorator
+
+
+def student_login_query(school_id, admission_number):
+    """Served by ix_users_school_admission"""
+    return User.query.filter_by(
+        school_id=school_id,
+        admission_number=admission_number,
+        role='student'
+    )
+
+
+def teacher_login_query(school_id, identifier_type, identifier):
+    """Served by ix_users_school_upper_tsc, or the unique index on national_id"""
+    query = User.query.filter(
+        User.school_id == school_id,
+        User.role == 'teacher',
+        User.is_active == True
+    )
+    if identifier_type == 'tsc_number':
+        return query.filter(db.func.upper(User.tsc_number) == identifier.upper())
+    return query.filter(User.national_id == identifier)
@@ -0,0 +1,232 @@
+"""
+Moves competitions from 'active' to 'completed' when their deadline passes.
+
+Deadlines sit in a min-heap; the scheduler sleeps until the earliest one,
+completes everything that is due with a single UPDATE and goes back to
+sleep. It runs either as a daemon thread inside the web app
+(COMPETITION_SCHEDULER_IN_PROCESS=true) or as a separate process:
+
+    flask competitions worker
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from extensions import db
+from models import Competition
+from utils.leaderboard import leaderboards
+from utils.grading import backfill_answers, regrade_competition
+
+EXTENSION_KEY = 'competition_scheduler'
+RETRY_SECONDS = 5
+
+
+def _as_utc_naive(value):
+    # Deadlines are stored as naive UTC, but create_competition may hand us an aware one
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class CompetitionScheduler:
+    def __init__(self, app, refresh_seconds=60):
+        self.app = app
+        # Competitions created by other processes are picked up on the next refresh
+        self.refresh_seconds = refresh_seconds
+        self._heap = []
+        self._deadlines = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    # ---------------- queue management ----------------
+
+    def schedule(self, competition_id, deadline):
+        """Queue (or re-queue with a new deadline) a competition"""
+        deadline = _as_utc_naive(deadline)
+        with self._cond:
+            self._deadlines[competition_id] = deadline
+            heapq.heappush(self._heap, (deadline, competition_id))
+            self._cond.notify()
+
+    def reload(self):
+        """Rebuild the heap from every active competition in the database"""
+        rows = db.session.query(Competition.id, Competition.deadline).filter(
+            Competition.status == 'active'
+        ).all()
+        db.session.rollback()
+        with self._cond:
+            self._deadlines = {cid: _as_utc_naive(deadline) for cid, deadline in rows}
+            self._heap = [(deadline, cid) for cid, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        return len(rows)
+
+    def next_deadline(self):
+        with self._cond:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        # Entries superseded by a later schedule() call are skipped lazily
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        due = []
+        with self._cond:
+            self._drop_stale()
+            while self._heap and self._heap[0][0] <= now:
+                _, cid = heapq.heappop(self._heap)
+                self._deadlines.pop(cid, None)
+                due.append(cid)
+                self._drop_stale()
+        return due
+
+    # ---------------- transitions ----------------
+
+    def complete_due(self, now=None):
+        """Mark every competition whose deadline has passed as completed"""
+        now = now or datetime.utcnow()
+        due = self._pop_due(now)
+        if not due:
+            return []
+
+        try:
+            # The deadline guard makes this safe if a deadline was extended meanwhile
+            updated = Competition.query.filter(
+                Competition.id.in_(due),
+                Competition.status == 'active',
+                Competition.deadline <= now
+            ).update({'status': 'completed', 'updated_at': now}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Put them back so a later pass retries
+            for cid in due:
+                self.schedule(cid, now + timedelta(seconds=RETRY_SECONDS))
+            raise
+
+        current_app.logger.info(f"Completed {updated} competition(s): {due}")
+        return due
+
+    def run(self):
+        """Block, completing competitions as their deadlines pass, until stop()"""
+        with self.app.app_context():
+            last_refresh = None
+
+            while not self._stopped:
+                now = datetime.utcnow()
+                try:
+                    if last_refresh is None or (now - last_refresh).total_seconds() >= self.refresh_seconds:
+                        self.reload()
+                        last_refresh = now
+                    self.complete_due()
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"Competition scheduler error: {e}")
+                    last_refresh = last_refresh or now
+
+                # Compute the sleep under the lock so a concurrent schedule() can't be missed
+                with self._cond:
+                    now = datetime.utcnow()
+                    timeout = self.refresh_seconds - (now - last_refresh).total_seconds()
+                    upcoming = self.next_deadline()
+                    if upcoming is not None:
+                        timeout = min(timeout, (upcoming - now).total_seconds())
+                    if not self._stopped and timeout > 0:
+                        self._cond.wait(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='competition-scheduler', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+
+def init_scheduler(app):
+    """Attach a scheduler to the app; start it when configured to run in-process"""
+    scheduler = CompetitionScheduler(
+        app, refresh_seconds=app.config.get('COMPETITION_SCHEDULER_REFRESH_SECONDS', 60)
+    )
+    app.extensions[EXTENSION_KEY] = scheduler
+    if app.config.get('COMPETITION_SCHEDULER_IN_PROCESS'):
+        scheduler.start()
+    return scheduler
+
+
+def notify_competition_scheduled(competition):
+    """Tell an in-process scheduler about a new or changed deadline"""
+    scheduler = current_app.extensions.get(EXTENSION_KEY)
+    if scheduler and scheduler.running and competition.status == 'active':
+        scheduler.schedule(competition.id, competition.deadline)
+
+
+competitions_cli = AppGroup('competitions', help='Competition maintenance commands')
+
+
+@competitions_cli.command('worker')
+@click.option('--refresh', default=60, show_default=True,
+              help='Seconds between re-reading active competitions from the database.')
+def worker_command(refresh):
+    """Run the deadline scheduler in the foreground."""
+    scheduler = CompetitionScheduler(current_app._get_current_object(), refresh_seconds=refresh)
+    click.echo(f"Competition scheduler running (refresh every {refresh}s)")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+@competitions_cli.command('complete-expired')
+def complete_expired_command():
+    """Complete every overdue competition once and exit."""
+    scheduler = CompetitionScheduler(current_app._get_current_object())
+    scheduler.reload()
+    completed = scheduler.complete_due()
+    click.echo(f"Completed {len(completed)} competition(s)")
+
+
+@competitions_cli.command('rebuild-leaderboards')
+@click.option('--competition-id', type=int, default=None, help='Only rebuild this competition.')
+def rebuild_leaderboards_command(competition_id):
+    """Recompute per-school leaderboard totals from participant scores."""
+    rows = leaderboards.rebuild(competition_id)
+    click.echo(f"Rebuilt {rows} leaderboard row(s)")
+
+
+@competitions_cli.command('regrade')
+@click.argument('competition_id', type=int)
+def regrade_command(competition_id):
+    """Rescore every quiz submission of a competition against its current answer key."""
+    competition = Competition.query.get(competition_id)
+    if competition is None:
+        raise click.ClickException(f"Competition {competition_id} not found")
+    result = regrade_competition(competition)
+    click.echo(f"Regraded {result['regraded']} submission(s), {result['changed']} score(s) changed "
+               f"in {result['duration_ms']}ms")
+
+
+@competitions_cli.command('backfill-answers')
+@click.option('--competition-id', type=int, default=None, help='Only backfill this competition.')
+def backfill_answers_command(competition_id):
+    """Split stored quiz_answers blobs into per-question answer rows."""
+    query = Competition.query.filter(Competition.has_quiz.is_(True))
+    if competition_id is not None:
+        query = query.filter(Competition.id == competition_id)
+    total = 0
+    for competition in query.all():
+        total += backfill_answers(competition)
+    click.echo(f"Backfilled answers for {total} submission(s)")
@@ -0,0 +1,116 @@
+"""
+Dashboard widget selection and parallel evaluation.
+
+A school's dashboard is a set of independent widgets (stats, charts, feeds).
+Which of them are shown comes from the user's enabled_widgets
+(UserDashboardPreferences) and the school's enabled_modules
+(SchoolDashboardSettings), falling back to the defaults below when either
+row does not exist. Only the enabled widgets are computed, and they run
+side by side on one bounded, process-wide thread pool
+(DASHBOARD_WIDGET_WORKERS), so a dashboard takes as long as its slowest
+widget rather than the sum of all of them.
+
+Each widget runs in its own app context and therefore its own database
+session, which is removed when the widget finishes; widgets must not share
+ORM objects with the request that started them.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+
+from extensions import db
+from models import SchoolDashboardSettings, UserDashboardPreferences
+
+DEFAULT_MODULES = {
+    'attendance': True,
+    'fees': True,
+    'grades': True,
+    'events': True,
+    'announcements': True
+}
+
+DEFAULT_WIDGETS = {
+    'stats_overview': True,
+    'enrollment_chart': True,
+    'attendance_overview': True,
+    'activity_feed': True,
+    'quick_actions': True,
+    'fee_status': True,
+    'announcements': True,
+    'custom_links': False
+}
+
+
+def dashboard_config(school_id, user_id):
+    """(enabled_modules, enabled_widgets) for a user's view of a school's dashboard"""
+    settings = SchoolDashboardSettings.query.filter_by(school_id=school_id).first()
+    preferences = UserDashboardPreferences.query.filter_by(user_id=user_id).first() if user_id else None
+    modules = {**DEFAULT_MODULES, **((settings.enabled_modules or {}) if settings else {})}
+    widgets = {**DEFAULT_WIDGETS, **((preferences.enabled_widgets or {}) if preferences else {})}
+    return modules, widgets
+
+
+def is_enabled(preference, module, modules, widgets):
+    """Whether a widget gated by user `preference` and school `module` (either may be None) is on"""
+    if preference is not None and not widgets.get(preference, False):
+        return False
+    return module is None or bool(modules.get(module, False))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool(workers):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dashboard-widget')
+    return _executor
+
+
+def _run_in_context(app, fn, args):
+    with app.app_context():
+        try:
+            return fn(*args)
+        finally:
+            db.session.remove()
+
+
+def run_widgets(tasks, default=None):
+    """
+    Evaluate {name: (fn, args)} concurrently and return {name: result}. A
+    widget that raises or outlives DASHBOARD_WIDGET_TIMEOUT yields `default`.
+    """
+    app = current_app._get_current_object()
+    workers = app.config.get('DASHBOARD_WIDGET_WORKERS', 4)
+    timeout = app.config.get('DASHBOARD_WIDGET_TIMEOUT', 10)
+
+    if workers <= 1 or len(tasks) <= 1:
+        results = {}
+        for name, (fn, args) in tasks.items():
+            try:
+                results[name] = fn(*args)
+            except Exception as e:
+                current_app.logger.error(f"Dashboard widget {name} failed: {str(e)}")
+                results[name] = default
+        return results
+
+    pool = _pool(workers)
+    futures = {name: pool.submit(_run_in_context, app, fn, args) for name, (fn, args) in tasks.items()}
+    wait(futures.values(), timeout=timeout)
+    results = {}
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            current_app.logger.error(f"Dashboard widget {name} timed out after {timeout}s")
+            results[name] = default
+            continue
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            current_app.logger.error(f"Dashboard widget {name} failed: {str(e)}")
+            results[name] = default
+    return results
@@ -0,0 +1,263 @@
+"""
+Monthly enrollment trends: students enrolled, transferred out and graduated.
+
+Counts come from enrollments in one GROUP BY over date_trunc('month', ...):
+enrolments by enrollment_date, transfers and graduations by updated_at (the
+model keeps no status history, so the last update is taken as the month of
+the move).
+
+A closed month can no longer change - every write path stamps enrollments
+with today's date - so its counts are computed once and kept in
+enrollment_monthly, one row per (school, month) including all-zero ones.
+Only the current month is counted live, and that result is cached per
+school for ENROLLMENT_TRENDS_CACHE_SECONDS; enrolling students drops it
+(invalidate) so the chart moves straight away in this process. System-owner
+ranges across all schools sum the stored buckets instead of rescanning
+every enrolment.
+
+    flask enrollment precompute --months 36   # fill buckets ahead of time
+"""
+import threading
+import time
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, literal, select, union_all
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Enrollment, EnrollmentMonthly, School
+
+KINDS = ('enrolled', 'transferred', 'graduated')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(first, last):
+    months = []
+    month = month_start(first)
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _as_month(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _zero():
+    return {kind: 0 for kind in KINDS}
+
+
+def count_months(start, end, school_id=None):
+    """
+    {(school_id, month): {kind: n}} for enrollments between `start`
+    (inclusive) and `end` (exclusive), both first days of a month.
+    """
+    enrolled = select(
+        Enrollment.school_id.label('school_id'),
+        func.date_trunc('month', Enrollment.enrollment_date).label('month'),
+        literal('enrolled').label('kind')
+    ).where(
+        Enrollment.enrollment_date >= start,
+        Enrollment.enrollment_date < end
+    )
+    moved = select(
+        Enrollment.school_id,
+        func.date_trunc('month', Enrollment.updated_at),
+        Enrollment.status
+    ).where(
+        Enrollment.status.in_(['transferred', 'graduated']),
+        Enrollment.updated_at >= start,
+        Enrollment.updated_at < end
+    )
+    if school_id is not None:
+        enrolled = enrolled.where(Enrollment.school_id == school_id)
+        moved = moved.where(Enrollment.school_id == school_id)
+
+    movements = union_all(enrolled, moved).subquery()
+    rows = db.session.execute(
+        select(
+            movements.c.school_id, movements.c.month, movements.c.kind, func.count()
+        ).group_by(movements.c.school_id, movements.c.month, movements.c.kind)
+    )
+    counts = {}
+    for sid, month, kind, n in rows:
+        counts.setdefault((sid, _as_month(month)), _zero())[kind] = n
+    return counts
+
+
+def fill_buckets(months, school_id=None):
+    """Store counts for closed `months` that have no bucket yet (all schools when school_id is None)"""
+    if not months:
+        return 0
+    if school_id is not None:
+        school_ids = [school_id]
+    else:
+        school_ids = [row[0] for row in db.session.query(School.id)]
+    existing = db.session.query(EnrollmentMonthly.school_id, EnrollmentMonthly.month).filter(
+        EnrollmentMonthly.month.in_(months)
+    )
+    if school_id is not None:
+        existing = existing.filter(EnrollmentMonthly.school_id == school_id)
+    existing = set(existing)
+
+    counts = count_months(min(months), add_months(max(months), 1), school_id)
+    now = datetime.utcnow()
+    rows = [
+        {'school_id': sid, 'month': month, 'computed_at': now, **counts.get((sid, month), _zero())}
+        for sid in school_ids for month in months if (sid, month) not in existing
+    ]
+    if rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(EnrollmentMonthly), rows)
+        except IntegrityError:
+            # Filled concurrently by another request; theirs are the same numbers
+            pass
+        db.session.commit()
+    return len(rows)
+
+
+class CurrentMonthCache:
+    """school_id (None for all schools) -> (expires, month, counts) for the month in progress"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _ttl(self):
+        return current_app.config.get('ENROLLMENT_TRENDS_CACHE_SECONDS', 300)
+
+    def get(self, school_id, month):
+        entry = self._entries.get(school_id)
+        if entry is None:
+            return None
+        expires, cached_month, counts = entry
+        if cached_month != month or expires <= time.monotonic():
+            return None
+        return counts
+
+    def put(self, school_id, month, counts):
+        with self._lock:
+            self._entries[school_id] = (time.monotonic() + self._ttl(), month, counts)
+
+    def invalidate(self, school_id):
+        with self._lock:
+            self._entries.pop(school_id, None)
+            self._entries.pop(None, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+current_month_cache = CurrentMonthCache()
+
+
+def invalidate(school_id):
+    """Call after enrolling students (or changing enrollment status) in a school"""
+    current_month_cache.invalidate(school_id)
+
+
+def _current(school_id, month):
+    counts = current_month_cache.get(school_id, month)
+    if counts is None:
+        counts = _zero()
+        for values in count_months(month, add_months(month, 1), school_id).values():
+            for kind in KINDS:
+                counts[kind] += values[kind]
+        current_month_cache.put(school_id, month, counts)
+    return counts
+
+
+def _series(months, stored, current_month, current):
+    series = []
+    for month in months:
+        if month == current_month:
+            counts = current
+        elif month > current_month:
+            counts = _zero()
+        else:
+            counts = stored.get(month, _zero())
+        series.append({'month': month.strftime('%Y-%m'), **counts})
+    return series
+
+
+def school_trends(school_id, first, last):
+    """Monthly series for one school, months `first`..`last` inclusive"""
+    months = month_range(first, last)
+    current_month = month_start(date.today())
+    closed = [m for m in months if m < current_month]
+
+    def read():
+        rows = EnrollmentMonthly.query.filter(
+            EnrollmentMonthly.school_id == school_id,
+            EnrollmentMonthly.month >= months[0],
+            EnrollmentMonthly.month <= months[-1]
+        )
+        return {row.month: {kind: getattr(row, kind) for kind in KINDS} for row in rows}
+
+    stored = read()
+    if any(m not in stored for m in closed):
+        fill_buckets([m for m in closed if m not in stored], school_id)
+        stored = read()
+
+    current = _current(school_id, current_month) if current_month in months else None
+    return _series(months, stored, current_month, current)
+
+
+def all_school_trends(first, last):
+    """Monthly series summed over every school, from the stored buckets"""
+    months = month_range(first, last)
+    current_month = month_start(date.today())
+    closed = [m for m in months if m < current_month]
+
+    if closed:
+        schools = db.session.query(func.count(School.id)).scalar()
+        coverage = dict(db.session.query(EnrollmentMonthly.month, func.count()).filter(
+            EnrollmentMonthly.month >= closed[0],
+            EnrollmentMonthly.month <= closed[-1]
+        ).group_by(EnrollmentMonthly.month).all())
+        fill_buckets([m for m in closed if coverage.get(m, 0) < schools])
+
+    sums = db.session.query(
+        EnrollmentMonthly.month,
+        *[func.sum(getattr(EnrollmentMonthly, kind)) for kind in KINDS]
+    ).filter(
+        EnrollmentMonthly.month >= months[0],
+        EnrollmentMonthly.month <= months[-1]
+    ).group_by(EnrollmentMonthly.month)
+    stored = {_as_month(row[0]): dict(zip(KINDS, (int(v or 0) for v in row[1:]))) for row in sums}
+
+    current = _current(None, current_month) if current_month in months else None
+    return _series(months, stored, current_month, current)
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+
+enrollment_cli = AppGroup('enrollment', help='Enrollment analytics commands')
+
+
+@enrollment_cli.command('precompute')
+@click.option('--months', type=int, default=24, show_default=True, help='Closed months to fill, counting back from last month.')
+def precompute_command(months):
+    """Store monthly enrollment buckets for every school."""
+    last = add_months(month_start(date.today()), -1)
+    written = fill_buckets(month_range(add_months(last, -(months - 1)), last))
+    click.echo(f"Stored {written} enrollment_monthly row(s)")
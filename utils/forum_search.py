@@ -0,0 +1,271 @@
+"""
+Full-text search over forum threads and replies.
+
+On Postgres every thread and reply carries a weighted tsvector
+(search_vector, GIN indexed) that the mapper events below rewrite whenever
+the searchable text changes. SQLite has no tsvector, so there the same
+events maintain a shadow FTS5 table, forum_search, keyed by
+rowid = doc_id * 2 + kind.
+
+Snippets are safe to render as HTML. Both backends delimit matches with
+private-use characters rather than tags; the snippet is then HTML-escaped
+and only the delimiters become <mark> ... </mark>, so markup written in a
+post is shown as text. Thread snippets come from the title and the body on
+both backends.
+"""
+import html
+import re
+
+from sqlalchemy import DDL, Double, and_, case, cast, event, func, literal, literal_column, or_, select, text, union_all
+from sqlalchemy import inspect as sa_inspect
+
+from extensions import db
+from models import Forum, ForumReply
+
+TS_CONFIG = 'english'
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+MATCH_START = '\ue000'
+MATCH_STOP = '\ue001'
+HEADLINE_OPTIONS = f'StartSel={MATCH_START}, StopSel={MATCH_STOP}, MaxWords=35, MinWords=15'
+
+KIND_FORUM = 0
+KIND_REPLY = 1
+
+# -----------------------------------------------------------
+# Index maintenance
+# -----------------------------------------------------------
+
+event.listen(
+    Forum.__table__, 'after_create',
+    DDL(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS forum_search '
+        'USING fts5(forum_id UNINDEXED, title, body)'
+    ).execute_if(dialect='sqlite')
+)
+event.listen(
+    Forum.__table__, 'before_drop',
+    DDL('DROP TABLE IF EXISTS forum_search').execute_if(dialect='sqlite')
+)
+
+
+def _changed(target, *fields):
+    state = sa_inspect(target)
+    return any(state.attrs[f].history.has_changes() for f in fields)
+
+
+def _weighted(value, weight):
+    # setweight() takes a "char", which a bound varchar will not cast to
+    return func.setweight(func.to_tsvector(TS_CONFIG, value or ''), literal_column(f"'{weight}'"))
+
+
+def _forum_vector(title, content):
+    # Title hits outrank body hits
+    return _weighted(title, 'A').op('||')(_weighted(content, 'B'))
+
+
+def _reply_vector(content):
+    return _weighted(content, 'B')
+
+
+def _fts_rowid(kind, doc_id):
+    return doc_id * 2 + kind
+
+
+def _fts_write(connection, kind, doc_id, forum_id, title, body):
+    rowid = _fts_rowid(kind, doc_id)
+    connection.execute(text('DELETE FROM forum_search WHERE rowid = :rowid'), {'rowid': rowid})
+    connection.execute(
+        text('INSERT INTO forum_search (rowid, forum_id, title, body) VALUES (:rowid, :forum_id, :title, :body)'),
+        {'rowid': rowid, 'forum_id': forum_id, 'title': title or '', 'body': body or ''}
+    )
+
+
+def _fts_delete(connection, kind, doc_id):
+    connection.execute(
+        text('DELETE FROM forum_search WHERE rowid = :rowid'),
+        {'rowid': _fts_rowid(kind, doc_id)}
+    )
+
+
+@event.listens_for(Forum, 'before_insert')
+@event.listens_for(Forum, 'before_update')
+def _forum_before_write(mapper, connection, target):
+    if connection.dialect.name == 'postgresql' and _changed(target, 'title', 'content'):
+        target.search_vector = _forum_vector(target.title, target.content)
+
+
+@event.listens_for(ForumReply, 'before_insert')
+@event.listens_for(ForumReply, 'before_update')
+def _reply_before_write(mapper, connection, target):
+    if connection.dialect.name == 'postgresql' and _changed(target, 'content'):
+        target.search_vector = _reply_vector(target.content)
+
+
+@event.listens_for(Forum, 'after_insert')
+@event.listens_for(Forum, 'after_update')
+def _forum_after_write(mapper, connection, target):
+    if connection.dialect.name == 'sqlite' and _changed(target, 'id', 'title', 'content'):
+        _fts_write(connection, KIND_FORUM, target.id, target.id, target.title, target.content)
+
+
+@event.listens_for(ForumReply, 'after_insert')
+@event.listens_for(ForumReply, 'after_update')
+def _reply_after_write(mapper, connection, target):
+    if connection.dialect.name == 'sqlite' and _changed(target, 'id', 'forum_id', 'content'):
+        _fts_write(connection, KIND_REPLY, target.id, target.forum_id, '', target.content)
+
+
+@event.listens_for(Forum, 'after_delete')
+def _forum_after_delete(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        _fts_delete(connection, KIND_FORUM, target.id)
+
+
+@event.listens_for(ForumReply, 'after_delete')
+def _reply_after_delete(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        _fts_delete(connection, KIND_REPLY, target.id)
+
+# -----------------------------------------------------------
+# Querying
+# -----------------------------------------------------------
+
+def search_forums(query_text, limit=20, after=None):
+    """
+    Ranked search over active threads and their replies.
+
+    `after` is the (rank, kind, doc_id) key of the last hit on the previous
+    page. Returns (hits, next_key) where each hit is a dict with kind,
+    doc_id, forum_id, rank and a highlighted snippet.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        rows = _search_postgres(query_text, limit + 1, after)
+    else:
+        rows = _search_sqlite(query_text, limit + 1, after)
+
+    hits = [{
+        'kind': r.kind,
+        'doc_id': r.doc_id,
+        'forum_id': r.forum_id,
+        'rank': float(r.rank),
+        'snippet': render_snippet(r.snippet)
+    } for r in rows]
+
+    next_key = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        last = hits[-1]
+        next_key = (last['rank'], last['kind'], last['doc_id'])
+    return hits, next_key
+
+
+def _rank(vector, tsq):
+    # ts_rank returns real; as float8 the rank survives the round trip
+    # through the JSON cursor exactly, so keyset comparisons match
+    return cast(func.ts_rank(vector, tsq), Double)
+
+
+def render_snippet(raw):
+    """HTML-escape a snippet, then turn its match delimiters into <mark> tags"""
+    escaped = html.escape(raw or '')
+    return escaped.replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_STOP, HIGHLIGHT_STOP)
+
+
+def _search_postgres(query_text, limit, after):
+    tsq = func.websearch_to_tsquery(TS_CONFIG, query_text)
+
+    forum_hits = select(
+        literal(KIND_FORUM).label('kind'),
+        Forum.id.label('doc_id'),
+        Forum.id.label('forum_id'),
+        _rank(Forum.search_vector, tsq).label('rank')
+    ).where(
+        Forum.is_active.is_(True),
+        Forum.search_vector.bool_op('@@')(tsq)
+    )
+    reply_hits = select(
+        literal(KIND_REPLY).label('kind'),
+        ForumReply.id.label('doc_id'),
+        ForumReply.forum_id.label('forum_id'),
+        _rank(ForumReply.search_vector, tsq).label('rank')
+    ).join(
+        Forum, Forum.id == ForumReply.forum_id
+    ).where(
+        Forum.is_active.is_(True),
+        ForumReply.search_vector.bool_op('@@')(tsq)
+    )
+    hits = union_all(forum_hits, reply_hits).subquery('hits')
+
+    page = select(hits)
+    if after:
+        rank, kind, doc_id = after
+        rank = literal(rank, Double)
+        page = page.where(or_(
+            hits.c.rank < rank,
+            and_(hits.c.rank == rank, or_(
+                hits.c.doc_id > doc_id,
+                and_(hits.c.doc_id == doc_id, hits.c.kind > kind)
+            ))
+        ))
+    page = page.order_by(hits.c.rank.desc(), hits.c.doc_id, hits.c.kind).limit(limit).subquery('page')
+
+    # Headlines are expensive, so only build them for the rows on this page
+    forum_doc = Forum.__table__.alias('forum_doc')
+    reply_doc = ForumReply.__table__.alias('reply_doc')
+    stmt = select(
+        page.c.kind,
+        page.c.doc_id,
+        page.c.forum_id,
+        page.c.rank,
+        func.ts_headline(
+            TS_CONFIG,
+            case(
+                (page.c.kind == KIND_FORUM, func.concat_ws(' ', forum_doc.c.title, forum_doc.c.content)),
+                else_=reply_doc.c.content
+            ),
+            tsq,
+            HEADLINE_OPTIONS
+        ).label('snippet')
+    ).select_from(
+        page.outerjoin(forum_doc, and_(page.c.kind == KIND_FORUM, forum_doc.c.id == page.c.doc_id))
+            .outerjoin(reply_doc, and_(page.c.kind == KIND_REPLY, reply_doc.c.id == page.c.doc_id))
+    ).order_by(page.c.rank.desc(), page.c.doc_id, page.c.kind)
+
+    return db.session.execute(stmt).all()
+
+
+def _fts5_match(query_text):
+    # Quote every term so user input can never be parsed as FTS5 syntax
+    terms = re.findall(r'\w+', query_text)
+    return ' '.join(f'"{t}"' for t in terms)
+
+
+def _search_sqlite(query_text, limit, after):
+    match = _fts5_match(query_text)
+    if not match:
+        return []
+
+    score = '-bm25(forum_search, 0.0, 10.0, 1.0)'
+    params = {'match': match, 'limit': limit, 'start': MATCH_START, 'stop': MATCH_STOP}
+    keyset = ''
+    if after:
+        rank, kind, doc_id = after
+        keyset = f'AND ({score} < :rank OR ({score} = :rank AND forum_search.rowid > :rowid))'
+        params.update(rank=rank, rowid=_fts_rowid(kind, doc_id))
+
+    sql = text(f'''
+        SELECT forum_search.rowid % 2 AS kind,
+               forum_search.rowid / 2 AS doc_id,
+               forum_search.forum_id AS forum_id,
+               {score} AS rank,
+               snippet(forum_search, -1, :start, :stop, '…', 24) AS snippet
+        FROM forum_search
+        JOIN forums ON forums.id = forum_search.forum_id
+        WHERE forum_search MATCH :match
+          AND forums.is_active = 1
+          {keyset}
+        ORDER BY {score} DESC, forum_search.rowid
+        LIMIT :limit
+    ''')
+    return db.session.execute(sql, params).all()
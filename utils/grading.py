@@ -0,0 +1,267 @@
+"""
+Compiled answer keys for competition quizzes.
+
+A competition's questions are compiled once into an AnswerKey (normalized
+correct answers, points and question types) and cached per process. The
+cache is keyed on Competition.answer_key_version, which the QuizQuestion
+mapper events below bump on every insert/update/delete, so an edited key
+is picked up by every worker on its next submission without an extra query.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import case, delete, event, insert, update
+
+from extensions import db
+from models import Competition, CompetitionParticipant, QuizAnswer, QuizQuestion
+from utils.leaderboard import leaderboards
+from utils.leaderboard_stream import leaderboard_stream
+
+
+def simplify_math_expression(expr):
+    """
+    Basic math expression normalization for comparison.
+    For production use, consider using a proper math library like SymPy.
+    """
+    if not expr:
+        return ""
+
+    # Basic normalization
+    expr = expr.replace(" ", "").lower()
+
+    # Replace common math operators
+    replacements = {
+        "\\times": "*",
+        "\\div": "/",
+        "\\cdot": "*",
+        "\\left": "",
+        "\\right": "",
+        "(": "",
+        ")": ""
+    }
+
+    for old, new in replacements.items():
+        expr = expr.replace(old, new)
+
+    return expr
+
+
+def normalize_answer(question_type, value):
+    """Normalize an answer the same way for keys and submissions"""
+    if value is None:
+        return None
+    value = str(value)
+    if question_type == 'multiple_choice':
+        return value
+    if question_type == 'math_expression':
+        return simplify_math_expression(value)
+    return value.lower().strip()  # short answer
+
+
+class AnswerKey:
+    def __init__(self, competition_id, version, questions):
+        self.competition_id = competition_id
+        self.version = version
+        self.question_ids = [q.id for q in questions]
+        self.index = {str(q.id): i for i, q in enumerate(questions)}
+        self.types = [q.question_type for q in questions]
+        self.answers = np.array(
+            [normalize_answer(q.question_type, q.correct_answer) for q in questions], dtype=object
+        )
+        self.points = np.array([q.points or 0 for q in questions], dtype=float)
+        self.total_possible = float(self.points.sum())
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def normalize_row(self, answers):
+        """Submission dict -> normalized answers aligned with the key (None = unanswered)"""
+        row = [None] * len(self)
+        for qid, value in (answers or {}).items():
+            i = self.index.get(str(qid))
+            if i is not None:
+                row[i] = normalize_answer(self.types[i], value)
+        return row
+
+    def correct_mask(self, answers):
+        return np.array(self.normalize_row(answers), dtype=object) == self.answers
+
+    def grade(self, answers):
+        if not len(self):
+            return 0.0
+        return float(self.correct_mask(answers) @ self.points)
+
+    def answer_rows(self, answers):
+        """Per-question (question_id, raw, normalized, is_correct, points) for one submission"""
+        raw = {str(qid): value for qid, value in (answers or {}).items()}
+        normalized = self.normalize_row(answers)
+        rows = []
+        for i, qid in enumerate(self.question_ids):
+            value = raw.get(str(qid))
+            correct = normalized[i] is not None and normalized[i] == self.answers[i]
+            rows.append((qid, None if value is None else str(value), normalized[i],
+                         bool(correct), float(self.points[i]) if correct else 0.0))
+        return rows
+
+    def grade_many(self, answer_dicts):
+        """Score many submissions at once: (participants x questions) match matrix . points"""
+        if not answer_dicts or not len(self):
+            return np.zeros(len(answer_dicts))
+        matrix = np.array([self.normalize_row(a) for a in answer_dicts], dtype=object)
+        matrix = matrix.reshape(len(answer_dicts), len(self))
+        return (matrix == self.answers).astype(float) @ self.points
+
+
+class AnswerKeyCache:
+    def __init__(self):
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, competition):
+        version = competition.answer_key_version or 0
+        with self._lock:
+            key = self._keys.get(competition.id)
+        if key is not None and key.version == version:
+            return key
+
+        questions = QuizQuestion.query.filter_by(
+            competition_id=competition.id
+        ).order_by(QuizQuestion.sequence, QuizQuestion.id).all()
+        key = AnswerKey(competition.id, version, questions)
+        with self._lock:
+            self._keys[competition.id] = key
+        return key
+
+    def invalidate(self, competition_id):
+        with self._lock:
+            self._keys.pop(competition_id, None)
+
+
+answer_keys = AnswerKeyCache()
+
+
+@event.listens_for(QuizQuestion, 'after_insert')
+@event.listens_for(QuizQuestion, 'after_update')
+@event.listens_for(QuizQuestion, 'after_delete')
+def _bump_answer_key_version(mapper, connection, target):
+    connection.execute(
+        update(Competition.__table__).where(
+            Competition.__table__.c.id == target.competition_id
+        ).values(
+            answer_key_version=db.func.coalesce(Competition.__table__.c.answer_key_version, 0) + 1
+        )
+    )
+    answer_keys.invalidate(target.competition_id)
+
+
+def store_answers(participant, key, answers):
+    """
+    Replace a participant's per-question answer rows inside the caller's
+    transaction. Returns the score, so grading and storage always agree.
+    """
+    rows = key.answer_rows(answers)
+    db.session.execute(delete(QuizAnswer).where(QuizAnswer.participant_id == participant.id))
+    if rows:
+        now = datetime.utcnow()
+        db.session.execute(insert(QuizAnswer), [{
+            'participant_id': participant.id,
+            'question_id': qid,
+            'competition_id': participant.competition_id,
+            'school_id': participant.school_id,
+            'answer': raw,
+            'normalized_answer': normalized,
+            'is_correct': correct,
+            'points_awarded': points,
+            'answered_at': now
+        } for qid, raw, normalized, correct, points in rows])
+    return sum(r[4] for r in rows)
+
+
+def _remark_answers(key):
+    # Normalized answers are stored, so re-marking is one UPDATE per question
+    for qid, correct_answer, points in zip(key.question_ids, key.answers, key.points):
+        is_correct = QuizAnswer.normalized_answer == correct_answer
+        db.session.execute(
+            update(QuizAnswer).where(
+                QuizAnswer.competition_id == key.competition_id,
+                QuizAnswer.question_id == qid
+            ).values(
+                is_correct=case((is_correct, True), else_=False),
+                points_awarded=case((is_correct, float(points)), else_=0.0)
+            )
+        )
+
+
+def regrade_competition(competition):
+    """
+    Re-score every stored quiz submission of a competition against the
+    current answer key in one pass. Only changed scores are written, then
+    the school totals are rebuilt from the new scores.
+    """
+    started = time.monotonic()
+    db.session.refresh(competition)
+    key = answer_keys.get(competition)
+
+    rows = db.session.query(
+        CompetitionParticipant.id,
+        CompetitionParticipant.quiz_answers,
+        CompetitionParticipant.quiz_score
+    ).filter(
+        CompetitionParticipant.competition_id == competition.id,
+        CompetitionParticipant.quiz_answers.isnot(None)
+    ).all()
+
+    submissions = []
+    for _, raw, _ in rows:
+        try:
+            submissions.append(json.loads(raw) or {})
+        except (TypeError, ValueError):
+            submissions.append({})
+
+    scores = key.grade_many(submissions)
+    changes = [
+        {'id': pid, 'quiz_score': float(score)}
+        for (pid, _, old), score in zip(rows, scores)
+        if old is None or float(old) != float(score)
+    ]
+
+    if changes:
+        db.session.execute(update(CompetitionParticipant), changes)
+    _remark_answers(key)
+    db.session.commit()
+    leaderboards.rebuild(competition.id)
+    leaderboard_stream.notify(competition.id)
+
+    return {
+        'competition_id': competition.id,
+        'answer_key_version': key.version,
+        'regraded': len(rows),
+        'changed': len(changes),
+        'total_possible': key.total_possible,
+        'duration_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+
+
+def backfill_answers(competition):
+    """Create answer rows for submissions stored before per-question rows existed"""
+    key = answer_keys.get(competition)
+    has_rows = db.session.query(QuizAnswer.participant_id).filter(
+        QuizAnswer.participant_id == CompetitionParticipant.id
+    ).exists()
+    participants = CompetitionParticipant.query.filter(
+        CompetitionParticipant.competition_id == competition.id,
+        CompetitionParticipant.quiz_answers.isnot(None),
+        ~has_rows
+    ).all()
+
+    for participant in participants:
+        try:
+            answers = json.loads(participant.quiz_answers) or {}
+        except (TypeError, ValueError):
+            answers = {}
+        store_answers(participant, key, answers)
+    db.session.commit()
+    return len(participants)
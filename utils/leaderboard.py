@@ -0,0 +1,486 @@
+"""
+Incrementally maintained competition leaderboards.
+
+School totals live in competition_school_scores and are adjusted by the
+score delta whenever a participant's quiz_score changes, so nothing ever
+re-aggregates competition_participants on the hot path. Each process keeps
+the boards it has served in memory, ordered by an indexable skip list, which
+gives O(log n) rank lookups, top-K slices and "my position" queries. Boards
+are re-read from the summary table after LEADERBOARD_CACHE_SECONDS so that
+writes made by other workers show up.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import CompetitionParticipant, CompetitionSchoolScore, School, User
+
+SCHOOL_BOARD = 'school'
+INDIVIDUAL_BOARD = 'individual'
+MAX_CACHED_BOARDS = 256
+
+# -----------------------------------------------------------
+# Ordered index
+# -----------------------------------------------------------
+
+class _Node:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+class RankedSet:
+    """
+    Sorted set of comparable keys backed by an indexable skip list.
+    insert, remove, bisect_left and locating a slice are all O(log n).
+    """
+    MAX_LEVEL = 32
+
+    def __init__(self):
+        self._head = _Node(None, self.MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < 0.25:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update_nodes = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update_nodes[i] = node
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update_nodes[i] = self._head
+                self._head.span[i] = self._size
+            self._level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update_nodes[i].forward[i]
+            update_nodes[i].forward[i] = new
+            new.span[i] = update_nodes[i].span[i] - (rank[0] - rank[i])
+            update_nodes[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update_nodes[i].span[i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        update_nodes = [None] * self.MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update_nodes[i] = node
+
+        target = node.forward[0]
+        if target is None or target.key != key:
+            return False
+
+        for i in range(self._level):
+            if update_nodes[i].forward[i] is target:
+                update_nodes[i].span[i] += target.span[i] - 1
+                update_nodes[i].forward[i] = target.forward[i]
+            else:
+                update_nodes[i].span[i] -= 1
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+        return True
+
+    def bisect_left(self, key):
+        """Number of keys strictly smaller than `key`"""
+        count = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                count += node.span[i]
+                node = node.forward[i]
+        return count
+
+    def _node_at(self, index):
+        # index is 0-based; spans count 1-based positions
+        target = index + 1
+        traversed = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and traversed + node.span[i] <= target:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if traversed == target:
+                return node
+        return None
+
+    def slice(self, start, stop):
+        """Keys in positions [start, stop), walking the bottom level"""
+        if start >= self._size or stop <= start:
+            return []
+        node = self._node_at(max(start, 0))
+        keys = []
+        while node is not None and len(keys) < stop - max(start, 0):
+            keys.append(node.key)
+            node = node.forward[0]
+        return keys
+
+
+class Board:
+    """One ranking: members ordered by score descending, ties share a rank"""
+
+    def __init__(self):
+        self._index = RankedSet()
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._index)
+
+    @staticmethod
+    def _key(member_id, score):
+        return (-score, member_id)
+
+    def upsert(self, member_id, score, **fields):
+        score = float(score or 0)
+        with self._lock:
+            existing = self._entries.get(member_id)
+            if existing is not None:
+                self._index.remove(self._key(member_id, existing['score']))
+            self._entries[member_id] = {**fields, 'score': score}
+            self._index.insert(self._key(member_id, score))
+
+    def remove(self, member_id):
+        with self._lock:
+            existing = self._entries.pop(member_id, None)
+            if existing is not None:
+                self._index.remove(self._key(member_id, existing['score']))
+
+    def rank_of_score(self, score):
+        # Competition ranking: 1 + number of members with a strictly higher score
+        return self._index.bisect_left((-float(score), float('-inf'))) + 1
+
+    def rank(self, member_id):
+        with self._lock:
+            entry = self._entries.get(member_id)
+            if entry is None:
+                return None
+            return self.rank_of_score(entry['score'])
+
+    def top(self, limit=None, offset=0):
+        with self._lock:
+            stop = len(self) if limit is None else offset + limit
+            rows = []
+            previous = None
+            for _, member_id in self._index.slice(offset, stop):
+                entry = self._entries[member_id]
+                if previous is None or entry['score'] != previous['score']:
+                    rank = self.rank_of_score(entry['score'])
+                else:
+                    rank = previous['rank']
+                previous = {**entry, 'rank': rank}
+                rows.append(previous)
+            return rows
+
+    def position(self, member_id, radius=2):
+        """A member's entry and rank plus the members just above and below"""
+        with self._lock:
+            entry = self._entries.get(member_id)
+            if entry is None:
+                return None
+            index = self._index.bisect_left(self._key(member_id, entry['score']))
+            start = max(index - radius, 0)
+            return {
+                **entry,
+                'rank': self.rank_of_score(entry['score']),
+                'total': len(self),
+                'neighbours': self.top(limit=index + radius + 1 - start, offset=start)
+            }
+
+# -----------------------------------------------------------
+# Store
+# -----------------------------------------------------------
+
+class LeaderboardStore:
+    def __init__(self):
+        self._boards = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _ttl(self):
+        return current_app.config.get('LEADERBOARD_CACHE_SECONDS', 5)
+
+    def board(self, competition_id, kind=SCHOOL_BOARD):
+        key = (competition_id, kind)
+        with self._lock:
+            cached = self._boards.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self._ttl():
+                self._boards.move_to_end(key)
+                return cached[0]
+
+        board = self._load(competition_id, kind)
+        with self._lock:
+            self._boards[key] = (board, time.monotonic())
+            self._boards.move_to_end(key)
+            while len(self._boards) > MAX_CACHED_BOARDS:
+                self._boards.popitem(last=False)
+        return board
+
+    def _cached(self, competition_id, kind):
+        with self._lock:
+            cached = self._boards.get((competition_id, kind))
+        return cached[0] if cached else None
+
+    def invalidate(self, competition_id):
+        with self._lock:
+            for kind in (SCHOOL_BOARD, INDIVIDUAL_BOARD):
+                self._boards.pop((competition_id, kind), None)
+
+    def _load(self, competition_id, kind):
+        board = Board()
+        if kind == SCHOOL_BOARD:
+            rows = db.session.query(
+                CompetitionSchoolScore.school_id,
+                School.name,
+                CompetitionSchoolScore.total_score,
+                CompetitionSchoolScore.participant_count
+            ).join(
+                School, School.id == CompetitionSchoolScore.school_id
+            ).filter(
+                CompetitionSchoolScore.competition_id == competition_id,
+                CompetitionSchoolScore.participant_count > 0
+            ).all()
+            for school_id, name, total, count in rows:
+                board.upsert(school_id, total, school_id=school_id, school_name=name, participant_count=count)
+        else:
+            rows = db.session.query(
+                CompetitionParticipant.teacher_id,
+                User.first_name,
+                User.last_name,
+                CompetitionParticipant.school_id,
+                School.name,
+                CompetitionParticipant.quiz_score
+            ).join(
+                User, User.id == CompetitionParticipant.teacher_id
+            ).join(
+                School, School.id == CompetitionParticipant.school_id
+            ).filter(
+                CompetitionParticipant.competition_id == competition_id,
+                CompetitionParticipant.quiz_score.isnot(None)
+            ).all()
+            for user_id, first_name, last_name, school_id, school_name, score in rows:
+                board.upsert(user_id, score, user_id=user_id, user_name=f"{first_name} {last_name}",
+                             school_id=school_id, school_name=school_name)
+        return board
+
+    # ---------------- writes ----------------
+
+    def record_score(self, participant, old_score, new_score):
+        """
+        Apply a quiz_score change to the summary table inside the caller's
+        transaction. Call refresh() once the transaction has committed.
+        """
+        if old_score == new_score:
+            return
+        delta = (new_score or 0) - (old_score or 0)
+        joined = 0
+        if old_score is None and new_score is not None:
+            joined = 1
+        elif old_score is not None and new_score is None:
+            joined = -1
+
+        apply = update(CompetitionSchoolScore).where(
+            CompetitionSchoolScore.competition_id == participant.competition_id,
+            CompetitionSchoolScore.school_id == participant.school_id
+        ).values(
+            total_score=CompetitionSchoolScore.total_score + delta,
+            participant_count=CompetitionSchoolScore.participant_count + joined,
+            updated_at=datetime.utcnow()
+        )
+        if db.session.execute(apply).rowcount or new_score is None:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(CompetitionSchoolScore(
+                    competition_id=participant.competition_id,
+                    school_id=participant.school_id,
+                    total_score=new_score,
+                    participant_count=1
+                ))
+        except IntegrityError:
+            # The school's first score raced with another submission; add to its row
+            db.session.execute(apply)
+
+    def refresh(self, participant):
+        """Copy a committed score change into the boards this process holds"""
+        school_board = self._cached(participant.competition_id, SCHOOL_BOARD)
+        if school_board is not None:
+            summary = CompetitionSchoolScore.query.get((participant.competition_id, participant.school_id))
+            if summary is None or not summary.participant_count:
+                school_board.remove(participant.school_id)
+            else:
+                school_board.upsert(participant.school_id, summary.total_score,
+                                    school_id=participant.school_id,
+                                    school_name=participant.school.name,
+                                    participant_count=summary.participant_count)
+
+        individual_board = self._cached(participant.competition_id, INDIVIDUAL_BOARD)
+        if individual_board is not None:
+            if participant.quiz_score is None:
+                individual_board.remove(participant.teacher_id)
+            else:
+                teacher = participant.teacher
+                individual_board.upsert(participant.teacher_id, participant.quiz_score,
+                                        user_id=participant.teacher_id,
+                                        user_name=f"{teacher.first_name} {teacher.last_name}",
+                                        school_id=participant.school_id,
+                                        school_name=participant.school.name)
+
+    def rebuild(self, competition_id=None):
+        """Recompute competition_school_scores from competition_participants"""
+        query = db.session.query(
+            CompetitionParticipant.competition_id,
+            CompetitionParticipant.school_id,
+            func.sum(CompetitionParticipant.quiz_score),
+            func.count(CompetitionParticipant.id)
+        ).filter(
+            CompetitionParticipant.quiz_score.isnot(None)
+        ).group_by(
+            CompetitionParticipant.competition_id,
+            CompetitionParticipant.school_id
+        )
+        existing = CompetitionSchoolScore.query
+        if competition_id is not None:
+            query = query.filter(CompetitionParticipant.competition_id == competition_id)
+            existing = existing.filter(CompetitionSchoolScore.competition_id == competition_id)
+
+        existing.delete(synchronize_session=False)
+        rows = query.all()
+        db.session.add_all([
+            CompetitionSchoolScore(competition_id=cid, school_id=sid, total_score=total or 0, participant_count=count)
+            for cid, sid, total, count in rows
+        ])
+        db.session.commit()
+
+        with self._lock:
+            if competition_id is None:
+                self._boards.clear()
+        if competition_id is not None:
+            self.invalidate(competition_id)
+        return len(rows)
+
+
+leaderboards = LeaderboardStore()
+
+# -----------------------------------------------------------
+# SQL rankings
+# -----------------------------------------------------------
+
+def _ranked_individuals(competition_id, school_id=None, county=None):
+    """
+    Subquery of scored participants with window-function ranks.
+    overall_rank/overall_dense_rank cover the whole competition; rank and
+    dense_rank are recomputed inside the school/county filter.
+    """
+    score = CompetitionParticipant.quiz_score
+    overall = db.session.query(
+        CompetitionParticipant.id.label('participant_id'),
+        CompetitionParticipant.teacher_id.label('user_id'),
+        CompetitionParticipant.school_id.label('school_id'),
+        score.label('score'),
+        CompetitionParticipant.quiz_submitted_at.label('submitted_at'),
+        School.name.label('school_name'),
+        School.county.label('county'),
+        func.rank().over(order_by=score.desc()).label('overall_rank'),
+        func.dense_rank().over(order_by=score.desc()).label('overall_dense_rank')
+    ).join(
+        School, School.id == CompetitionParticipant.school_id
+    ).filter(
+        CompetitionParticipant.competition_id == competition_id,
+        score.isnot(None)
+    ).subquery('overall')
+
+    filtered = db.session.query(
+        overall,
+        func.rank().over(order_by=overall.c.score.desc()).label('rank'),
+        func.dense_rank().over(order_by=overall.c.score.desc()).label('dense_rank')
+    )
+    if school_id is not None:
+        filtered = filtered.filter(overall.c.school_id == school_id)
+    if county:
+        filtered = filtered.filter(overall.c.county == county)
+    return filtered.subquery('ranked')
+
+
+def _ranked_row(row, first_name, last_name):
+    return {
+        'rank': row.rank,
+        'dense_rank': row.dense_rank,
+        'overall_rank': row.overall_rank,
+        'overall_dense_rank': row.overall_dense_rank,
+        'participant_id': row.participant_id,
+        'user_id': row.user_id,
+        'user_name': f"{first_name} {last_name}",
+        'school_id': row.school_id,
+        'school_name': row.school_name,
+        'county': row.county,
+        'score': row.score
+    }
+
+
+def ranked_individual_page(competition_id, limit=50, after=None, school_id=None, county=None):
+    """
+    One page of the individual ranking, ordered by (score desc, participant_id).
+    `after` is the (score, participant_id) key of the previous page's last
+    row. Returns (rows, next_key, total).
+    """
+    ranked = _ranked_individuals(competition_id, school_id, county)
+    query = db.session.query(ranked, User.first_name, User.last_name).join(
+        User, User.id == ranked.c.user_id
+    )
+    if after:
+        last_score, last_id = after
+        query = query.filter(db.or_(
+            ranked.c.score < last_score,
+            db.and_(ranked.c.score == last_score, ranked.c.participant_id > last_id)
+        ))
+    rows = query.order_by(ranked.c.score.desc(), ranked.c.participant_id).limit(limit + 1).all()
+
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = (rows[-1].score, rows[-1].participant_id)
+
+    total = db.session.query(func.count()).select_from(ranked).scalar()
+    return [_ranked_row(r, r.first_name, r.last_name) for r in rows], next_key, total
+
+
+def individual_rank_of(competition_id, user_id, school_id=None, county=None):
+    """Rank lookup for one user; None if they have no score in the (filtered) ranking"""
+    ranked = _ranked_individuals(competition_id, school_id, county)
+    row = db.session.query(ranked, User.first_name, User.last_name).join(
+        User, User.id == ranked.c.user_id
+    ).filter(
+        ranked.c.user_id == user_id
+    ).order_by(ranked.c.rank).first()
+    return _ranked_row(row, row.first_name, row.last_name) if row else None
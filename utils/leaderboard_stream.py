@@ -0,0 +1,259 @@
+"""
+Server-Sent Events fan-out for live competition leaderboards.
+
+Every competition with at least one viewer gets exactly one publisher
+thread. Score changes only mark the channel dirty; the publisher wakes up,
+waits until LEADERBOARD_STREAM_MIN_INTERVAL has passed since its last
+broadcast (so a burst of submissions becomes one update), computes the
+standings once and pushes the difference to every viewer's queue. Between
+changes it re-reads the board every LEADERBOARD_STREAM_HEARTBEAT_SECONDS,
+which also picks up submissions handled by other worker processes.
+
+Each viewer occupies a server thread for as long as it watches, so a
+process takes at most LEADERBOARD_STREAM_MAX_VIEWERS of them (kept below
+gunicorn's --threads); the rest are turned away and fall back to polling,
+leaving threads for ordinary API requests such as quiz submissions.
+
+Viewers pass their (non-expiring) token as ?jwt=, so RedactQueryToken is
+installed on the request loggers to keep it out of access logs.
+"""
+import json
+import logging
+import queue
+import re
+import threading
+import time
+
+from extensions import db
+from utils.leaderboard import leaderboards, SCHOOL_BOARD, INDIVIDUAL_BOARD
+
+STREAM_TOP = 20
+SUBSCRIBER_QUEUE_SIZE = 32
+
+BOARD_KEYS = {SCHOOL_BOARD: 'school_id', INDIVIDUAL_BOARD: 'user_id'}
+
+
+class RedactQueryToken(logging.Filter):
+    """Replace the value of a token query parameter in log lines"""
+
+    def __init__(self, param='jwt'):
+        super().__init__()
+        self._pattern = re.compile(r'([?&]' + re.escape(param) + r'=)[^&\s"\']+')
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = self._pattern.sub(r'\1[redacted]', message)
+        if redacted != message:
+            record.msg, record.args = redacted, ()
+        return True
+
+
+def install_log_redaction(param='jwt', loggers=('werkzeug', 'gunicorn.access')):
+    for name in loggers:
+        logging.getLogger(name).addFilter(RedactQueryToken(param))
+
+
+def format_sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def diff_rows(previous, current, key):
+    """Rows that are new or moved/changed score, plus ids that left the top list"""
+    before = {row[key]: row for row in previous}
+    after = {row[key]: row for row in current}
+    changed = [row for member, row in after.items() if before.get(member) != row]
+    removed = [member for member in before if member not in after]
+    return {'upsert': changed, 'remove': removed}
+
+
+class Subscription:
+    def __init__(self, channel):
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.needs_snapshot = True
+
+    def push(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # A viewer that stopped reading gets a fresh snapshot instead of a backlog
+            self._drain()
+            self.needs_snapshot = True
+
+    def _drain(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def get(self, timeout):
+        """Next (event, data, id) tuple, or None when nothing arrived in time"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _Channel:
+    def __init__(self, competition_id, boards):
+        self.competition_id = competition_id
+        self.boards = boards
+        self.subscribers = set()
+        self.cond = threading.Condition()
+        self.dirty = True
+        self.version = 0
+        self.snapshot = None
+        self.thread = None
+
+
+class LeaderboardBroadcaster:
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._viewers = 0
+
+    def subscribe(self, app, competition_id, include_individual=True, max_viewers=None):
+        """A new Subscription, or None when this process already serves max_viewers viewers"""
+        boards = (SCHOOL_BOARD, INDIVIDUAL_BOARD) if include_individual else (SCHOOL_BOARD,)
+        with self._lock:
+            if max_viewers is not None and self._viewers >= max_viewers:
+                return None
+            self._viewers += 1
+            channel = self._channels.get(competition_id)
+            if channel is None:
+                channel = self._channels[competition_id] = _Channel(competition_id, boards)
+            subscription = Subscription(channel)
+            with channel.cond:
+                channel.subscribers.add(subscription)
+                channel.dirty = True
+                channel.cond.notify()
+            if channel.thread is None:
+                channel.thread = threading.Thread(
+                    target=self._publish_loop, args=(app, channel),
+                    name=f'leaderboard-stream-{competition_id}', daemon=True
+                )
+                channel.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Drop a viewer; safe to call more than once"""
+        channel = subscription.channel
+        with channel.cond:
+            if subscription not in channel.subscribers:
+                return
+            channel.subscribers.discard(subscription)
+            channel.cond.notify()
+        with self._lock:
+            self._viewers -= 1
+
+    def notify(self, competition_id):
+        """Mark a competition's standings as changed; cheap when nobody is watching"""
+        channel = self._channels.get(competition_id)
+        if channel is None:
+            return
+        with channel.cond:
+            channel.dirty = True
+            channel.cond.notify()
+
+    def viewers(self, competition_id=None):
+        """Viewers of one competition, or of every competition in this process"""
+        if competition_id is None:
+            return self._viewers
+        channel = self._channels.get(competition_id)
+        return len(channel.subscribers) if channel else 0
+
+    # ---------------- publisher ----------------
+
+    def _wait_for_change(self, channel, min_interval, heartbeat, last_publish):
+        """Block until there is something to publish; False once the last viewer left"""
+        with channel.cond:
+            deadline = time.monotonic() + heartbeat
+            while channel.subscribers and not channel.dirty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    channel.dirty = True  # periodic re-read for other processes' writes
+                    break
+                channel.cond.wait(remaining)
+
+            # Coalesce: everything that arrives during the quiet period is one update
+            while channel.subscribers:
+                remaining = last_publish + min_interval - time.monotonic()
+                if remaining <= 0:
+                    break
+                channel.cond.wait(remaining)
+
+            if not channel.subscribers:
+                return False
+            channel.dirty = False
+            return True
+
+    def _retire(self, channel):
+        # Same lock order as subscribe(), so a viewer arriving now is never lost
+        with self._lock:
+            with channel.cond:
+                if channel.subscribers:
+                    return False
+                if self._channels.get(channel.competition_id) is channel:
+                    del self._channels[channel.competition_id]
+                return True
+
+    def _standings(self, channel):
+        standings = {}
+        for kind in channel.boards:
+            standings[kind] = leaderboards.board(channel.competition_id, kind).top(STREAM_TOP)
+        return standings
+
+    def _publish_loop(self, app, channel):
+        min_interval = app.config.get('LEADERBOARD_STREAM_MIN_INTERVAL', 0.5)
+        heartbeat = app.config.get('LEADERBOARD_STREAM_HEARTBEAT_SECONDS', 15)
+        last_publish = 0.0
+
+        with app.app_context():
+            while True:
+                if not self._wait_for_change(channel, min_interval, heartbeat, last_publish):
+                    if self._retire(channel):
+                        return
+                    continue
+                try:
+                    standings = self._standings(channel)
+                except Exception as e:
+                    app.logger.error(f"Leaderboard stream error for competition {channel.competition_id}: {e}")
+                    standings = None
+                finally:
+                    db.session.remove()
+                last_publish = time.monotonic()
+                if standings is not None:
+                    self._broadcast(channel, standings)
+
+    def _broadcast(self, channel, standings):
+        with channel.cond:
+            previous = channel.snapshot
+            delta = None
+            if previous is not None:
+                delta = {kind: diff_rows(previous.get(kind, []), rows, BOARD_KEYS[kind])
+                         for kind, rows in standings.items()}
+                if not any(d['upsert'] or d['remove'] for d in delta.values()):
+                    delta = None
+
+            if delta is not None or previous is None:
+                channel.version += 1
+                channel.snapshot = standings
+
+            snapshot_event = ('snapshot', {'version': channel.version, **channel.snapshot}, channel.version)
+            for subscription in list(channel.subscribers):
+                if subscription.needs_snapshot:
+                    subscription.needs_snapshot = False
+                    subscription.push(snapshot_event)
+                elif delta is not None:
+                    subscription.push(('delta', {'version': channel.version, **delta}, channel.version))
+                else:
+                    subscription.push(None)  # nothing new; lets the viewer send a keep-alive
+
+
+leaderboard_stream = LeaderboardBroadcaster()
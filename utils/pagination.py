@@ -0,0 +1,25 @@
+import base64
+import json
+
+
+def encode_cursor(values):
+    """Pack the sort key of the last row on a page into an opaque cursor"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Unpack a cursor produced by encode_cursor.
+    Returns None for a missing cursor and raises ValueError for a bad one.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
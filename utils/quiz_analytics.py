@@ -0,0 +1,123 @@
+"""
+Item analysis for competition quizzes, computed in SQL over
+quiz_question_answers (one row per participant and question).
+"""
+from sqlalchemy import Integer, cast, func
+
+from extensions import db
+from models import QuizAnswer, QuizQuestion, School
+
+
+def _accuracy(correct, attempts):
+    return round(correct / attempts, 4) if attempts else None
+
+
+def question_difficulty(competition_id):
+    """
+    Per question: how many submissions saw it, answered it and got it right.
+    p_value is the share of correct answers (classical item difficulty).
+    """
+    correct = func.sum(cast(QuizAnswer.is_correct, Integer))
+    rows = db.session.query(
+        QuizQuestion.id,
+        QuizQuestion.sequence,
+        QuizQuestion.question_text,
+        QuizQuestion.question_type,
+        QuizQuestion.points,
+        func.count(QuizAnswer.participant_id),
+        func.count(QuizAnswer.answer),
+        func.coalesce(correct, 0),
+        func.avg(QuizAnswer.points_awarded)
+    ).outerjoin(
+        QuizAnswer, QuizAnswer.question_id == QuizQuestion.id
+    ).filter(
+        QuizQuestion.competition_id == competition_id
+    ).group_by(
+        QuizQuestion.id
+    ).order_by(
+        QuizQuestion.sequence, QuizQuestion.id
+    ).all()
+
+    return [{
+        'question_id': qid,
+        'sequence': sequence,
+        'question_text': text,
+        'question_type': question_type,
+        'points': points,
+        'attempts': attempts,
+        'answered': answered,
+        'skipped': attempts - answered,
+        'correct': int(correct),
+        'p_value': _accuracy(int(correct), attempts),
+        'difficulty': None if not attempts else round(1 - int(correct) / attempts, 4),
+        'average_points': round(float(avg_points), 4) if avg_points is not None else None
+    } for qid, sequence, text, question_type, points, attempts, answered, correct, avg_points in rows]
+
+
+def common_wrong_answers(competition_id, question_id=None, limit=5):
+    """Most frequent incorrect (normalized) answers, per question"""
+    count = func.count().label('count')
+    query = db.session.query(
+        QuizAnswer.question_id,
+        QuizAnswer.normalized_answer,
+        count,
+        func.min(QuizAnswer.answer)
+    ).filter(
+        QuizAnswer.competition_id == competition_id,
+        QuizAnswer.is_correct.is_(False),
+        QuizAnswer.normalized_answer.isnot(None)
+    )
+    if question_id is not None:
+        query = query.filter(QuizAnswer.question_id == question_id)
+    grouped = query.group_by(QuizAnswer.question_id, QuizAnswer.normalized_answer).subquery()
+
+    # Keep the top `limit` answers of every question in the database
+    ranked = db.session.query(
+        grouped,
+        func.row_number().over(
+            partition_by=grouped.c.question_id,
+            order_by=(grouped.c.count.desc(), grouped.c.normalized_answer)
+        ).label('position')
+    ).subquery()
+    rows = db.session.query(ranked).filter(ranked.c.position <= limit).order_by(
+        ranked.c.question_id, ranked.c.position
+    ).all()
+
+    result = {}
+    for row in rows:
+        result.setdefault(row.question_id, []).append({
+            'answer': row[3],
+            'normalized_answer': row.normalized_answer,
+            'count': row.count
+        })
+    return result
+
+
+def county_accuracy(competition_id, question_id=None):
+    """Accuracy and score share grouped by the participating schools' county"""
+    correct = func.sum(cast(QuizAnswer.is_correct, Integer))
+    query = db.session.query(
+        School.county,
+        func.count(func.distinct(QuizAnswer.school_id)),
+        func.count(func.distinct(QuizAnswer.participant_id)),
+        func.count(QuizAnswer.participant_id),
+        func.coalesce(correct, 0),
+        func.coalesce(func.sum(QuizAnswer.points_awarded), 0)
+    ).join(
+        School, School.id == QuizAnswer.school_id
+    ).filter(
+        QuizAnswer.competition_id == competition_id
+    )
+    if question_id is not None:
+        query = query.filter(QuizAnswer.question_id == question_id)
+    rows = query.group_by(School.county).order_by(School.county).all()
+
+    return [{
+        'county': county,
+        'schools': schools,
+        'participants': participants,
+        'answers': answers,
+        'correct': int(correct),
+        'accuracy': _accuracy(int(correct), answers),
+        'total_points': float(points)
+    } for county, schools, participants, answers, correct, points in rows]
@@ -0,0 +1,126 @@
+"""
+On-demand expansion of recurring live classes.
+
+A recurring LiveClass row is the first occurrence plus a pattern; nothing
+is materialized. occurrences() jumps straight to the first occurrence that
+can touch the requested window and then yields lazily, and
+expand_classes() merges any number of these streams (and one-off classes)
+into a single start-time ordered stream with heapq.merge, so a caller that
+stops after `limit` items never expands the rest.
+"""
+import calendar
+import heapq
+import itertools
+from collections import namedtuple
+from datetime import timedelta
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import LiveClass, User
+
+Occurrence = namedtuple('Occurrence', 'start end index live_class')
+
+FIXED_STEPS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+    'biweekly': timedelta(weeks=2),
+}
+PATTERNS = set(FIXED_STEPS) | {'weekdays', 'monthly'}
+
+
+def _add_months(value, months):
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def _starts(first, pattern, window_start):
+    """Occurrence start times (with their index) from the first one that may overlap window_start"""
+    if pattern in FIXED_STEPS:
+        step = FIXED_STEPS[pattern]
+        skip = max((window_start - first) // step, 0)
+        for index in itertools.count(skip):
+            yield index, first + step * index
+
+    elif pattern == 'weekdays':
+        # Count whole weeks arithmetically, then walk the remaining days
+        # (any 7 consecutive days hold exactly 5 weekdays)
+        weeks = max((window_start - first).days // 7 - 1, 0)
+        index = weeks * 5
+        current = first + timedelta(weeks=weeks)
+        while True:
+            if current.weekday() < 5:
+                yield index, current
+                index += 1
+            current += timedelta(days=1)
+
+    elif pattern == 'monthly':
+        months = max((window_start.year - first.year) * 12 + window_start.month - first.month - 1, 0)
+        for index in itertools.count(months):
+            yield index, _add_months(first, index)
+
+
+def occurrences(live_class, window_start, window_end):
+    """Lazily yield the occurrences of one class that overlap [window_start, window_end)"""
+    duration = live_class.end_time - live_class.start_time
+    pattern = (live_class.recurrence_pattern or '').lower()
+    until = live_class.recurrence_until
+
+    if not live_class.is_recurring or pattern not in PATTERNS:
+        if live_class.start_time < window_end and live_class.end_time > window_start:
+            yield Occurrence(live_class.start_time, live_class.end_time, 0, live_class)
+        return
+
+    for index, start in _starts(live_class.start_time, pattern, window_start - duration):
+        if start >= window_end or (until is not None and start > until):
+            return
+        if start < live_class.start_time:
+            continue
+        end = start + duration
+        if end > window_start:
+            yield Occurrence(start, end, index, live_class)
+
+
+def expand_classes(classes, window_start, window_end):
+    """All occurrences of `classes` inside the window, merged in start-time order"""
+    streams = [occurrences(c, window_start, window_end) for c in classes]
+    return heapq.merge(*streams, key=lambda o: (o.start, o.live_class.id))
+
+
+def overlaps(start_col, end_col, start, end):
+    """[start_col, end_col) intersects [start, end); tsrange && on Postgres so GiST indexes apply"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.tsrange(start_col, end_col).op('&&')(func.tsrange(start, end))
+    return and_(start_col < end, end_col > start)
+
+
+def classes_in_window(window_start, window_end, teacher_id=None, subject=None):
+    """
+    LiveClass rows that can have an occurrence in the window: one-off classes
+    overlapping it, and recurring ones that started before it ends and have
+    not finished before it starts.
+    """
+    query = LiveClass.query.options(
+        joinedload(LiveClass.teacher).joinedload(User.school)
+    ).filter(
+        or_(
+            and_(
+                or_(LiveClass.is_recurring.is_(False), LiveClass.is_recurring.is_(None)),
+                overlaps(LiveClass.start_time, LiveClass.end_time, window_start, window_end)
+            ),
+            and_(
+                LiveClass.is_recurring.is_(True),
+                LiveClass.start_time < window_end,
+                or_(LiveClass.recurrence_until.is_(None), LiveClass.recurrence_until >= window_start)
+            )
+        )
+    )
+    if teacher_id is not None:
+        query = query.filter(LiveClass.teacher_id == teacher_id)
+    if subject:
+        query = query.filter(LiveClass.subject == subject)
+    return query.all()
@@ -0,0 +1,86 @@
+"""
+Capacity-safe seat reservation shared by every join path.
+
+A seat is taken with one conditional UPDATE on the parent row:
+
+    UPDATE tutoring_sessions
+       SET enrollment_count = enrollment_count + 1
+     WHERE id = :id AND (max_students IS NULL OR enrollment_count + 1 <= max_students)
+    RETURNING enrollment_count, max_students
+
+Postgres re-checks the WHERE clause after waiting on a concurrent writer's
+row lock, and SQLite serializes writers, so two joins can never both take
+the last seat. The reservation belongs to the caller's transaction: if the
+enrollment insert that follows fails, rolling back frees the seat again.
+"""
+from collections import namedtuple
+
+from sqlalchemy import case, func, or_, select, update
+
+from extensions import db
+from models import Competition, LiveClass, TutoringSession
+
+Reservation = namedtuple('Reservation', 'reserved taken capacity remaining')
+
+# Counter and capacity columns per reservable model
+CAPACITY_COLUMNS = {
+    TutoringSession: ('enrollment_count', 'max_students'),
+    LiveClass: ('registered_count', 'max_participants'),
+    Competition: ('participant_count', 'max_participants'),
+}
+
+
+class CapacityError(Exception):
+    def __init__(self, reservation):
+        super().__init__('No seats left')
+        self.reservation = reservation
+
+
+def _columns(model):
+    counter_name, capacity_name = CAPACITY_COLUMNS[model]
+    table = model.__table__
+    return table, table.c[counter_name], table.c[capacity_name]
+
+
+def _reservation(reserved, taken, capacity):
+    taken = taken or 0
+    remaining = None if capacity is None else max(capacity - taken, 0)
+    return Reservation(reserved, taken, capacity, remaining)
+
+
+def reserve_seat(model, object_id, seats=1):
+    """
+    Atomically take `seats` places on a TutoringSession, LiveClass or
+    Competition. Raises CapacityError (carrying the current counts) when
+    it is full; returns a Reservation otherwise.
+    """
+    table, counter, capacity = _columns(model)
+    current = func.coalesce(counter, 0)
+    row = db.session.execute(
+        update(table).where(
+            table.c.id == object_id,
+            or_(capacity.is_(None), current + seats <= capacity)
+        ).values(
+            {counter: current + seats}
+        ).returning(counter, capacity)
+    ).first()
+    if row is not None:
+        return _reservation(True, row[0], row[1])
+
+    row = db.session.execute(select(counter, capacity).where(table.c.id == object_id)).first()
+    if row is None:
+        raise LookupError(f'{model.__name__} {object_id} not found')
+    raise CapacityError(_reservation(False, row[0], row[1]))
+
+
+def release_seat(model, object_id, seats=1):
+    """Give places back, never dropping the counter below zero"""
+    table, counter, capacity = _columns(model)
+    row = db.session.execute(
+        update(table).where(
+            table.c.id == object_id
+        ).values(
+            {counter: case((counter > seats, counter - seats), else_=0)}
+        ).returning(counter, capacity)
+    ).first()
+    return _reservation(False, row[0], row[1]) if row else None
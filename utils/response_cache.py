@@ -0,0 +1,257 @@
+"""
+Stale-while-revalidate cache for dashboard payloads.
+
+Dashboards are opened by most of a school's staff within the same few
+minutes and are identical for everyone with the same role, so their
+payloads are cached under (endpoint, school_id, role), plus a variant for
+views that differ per user (the teacher's own dashboard) or per widget set:
+
+* fresh for DASHBOARD_CACHE_TTL seconds - served as is
+* then stale for up to DASHBOARD_CACHE_STALE more seconds - served as is
+  while one background refresh recomputes it
+* then gone - the next request recomputes it
+
+Concurrent misses for the same key are coalesced ("singleflight"): one
+request computes, the others in this process wait for its result.
+
+Entries live in a backend chosen by DASHBOARD_CACHE_URL: memory:// (an LRU
+per process, the default) or redis://... shared by every worker (needs the
+`redis` package). Each school has a generation number that is part of its
+keys; the write paths that change what a dashboard shows call
+invalidate(school_id), which bumps it, so every cached dashboard of that
+school is missed from then on. The memory backend keeps generations per
+process too, so it only suits a single worker: check_config() refuses it
+when WEB_CONCURRENCY says there are more.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from extensions import db
+
+MAX_MEMORY_ENTRIES = 10_000
+
+
+class MemoryBackend:
+    """Entries in an LRU dict; generations in a plain dict"""
+
+    def __init__(self, max_entries=MAX_MEMORY_ENTRIES):
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, expires_in):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self, school_id):
+        return self._generations.get(school_id, 0)
+
+    def bump(self, school_id):
+        with self._lock:
+            self._generations[school_id] = self._generations.get(school_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+class RedisBackend:
+    """Entries as JSON strings with an expiry; generations as counters"""
+
+    def __init__(self, url, prefix='dashboard-cache:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('DASHBOARD_CACHE_URL points at redis but the redis package is not installed')
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, entry, expires_in):
+        self._redis.set(self.prefix + key, json.dumps(entry, default=str), ex=max(int(expires_in) + 1, 1))
+
+    def generation(self, school_id):
+        return int(self._redis.get(f'{self.prefix}gen:{school_id}') or 0)
+
+    def bump(self, school_id):
+        self._redis.incr(f'{self.prefix}gen:{school_id}')
+
+    def clear(self):
+        for key in self._redis.scan_iter(self.prefix + '*'):
+            self._redis.delete(key)
+
+
+def _is_memory(url):
+    return not url or url.startswith('memory://')
+
+
+def make_backend(url):
+    if _is_memory(url):
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f'Unsupported DASHBOARD_CACHE_URL: {url}')
+
+
+def check_config(config):
+    """Raise at startup when the cache could not be invalidated across workers"""
+    if not config.get('DASHBOARD_CACHE_ENABLED', True):
+        return
+    workers = config.get('WEB_CONCURRENCY', 1)
+    if workers > 1 and _is_memory(config.get('DASHBOARD_CACHE_URL')):
+        raise RuntimeError(
+            f'DASHBOARD_CACHE_URL is memory:// but WEB_CONCURRENCY is {workers}; a write would only '
+            'invalidate the dashboards cached by one worker. Point DASHBOARD_CACHE_URL at redis or '
+            'set DASHBOARD_CACHE_ENABLED=false.'
+        )
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.failed = False
+
+
+class ResponseCache:
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._refresher = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = make_backend(current_app.config.get('DASHBOARD_CACHE_URL'))
+        return self._backend
+
+    def _enabled(self):
+        return current_app.config.get('DASHBOARD_CACHE_ENABLED', True)
+
+    def key(self, endpoint, school_id, role, variant=None):
+        generation = self.backend.generation(school_id)
+        return f'{endpoint}:{school_id}:{generation}:{role}:{variant if variant is not None else ""}'
+
+    def get_or_compute(self, endpoint, school_id, role, compute, variant=None, cacheable=None):
+        """
+        The cached payload for (endpoint, school_id, role, variant), calling
+        compute() on a miss. compute must not rely on the request: it may run
+        on a background thread when a stale entry is refreshed. A computed
+        value for which cacheable(value) is false is returned but not stored.
+        """
+        if not self._enabled():
+            return compute()
+
+        config = current_app.config
+        ttl = config.get('DASHBOARD_CACHE_TTL', 60)
+        stale = config.get('DASHBOARD_CACHE_STALE', 300)
+        key = self.key(endpoint, school_id, role, variant)
+
+        entry = self.backend.get(key)
+        now = time.time()
+        if entry is not None:
+            if now < entry['fresh_until']:
+                return entry['value']
+            if now < entry['stale_until']:
+                self._refresh_in_background(key, compute, ttl, stale, cacheable)
+                return entry['value']
+        return self._compute_once(key, compute, ttl, stale, cacheable)
+
+    def _store(self, key, value, ttl, stale, cacheable=None):
+        if cacheable is not None and not cacheable(value):
+            return
+        now = time.time()
+        self.backend.set(key, {
+            'value': value,
+            'fresh_until': now + ttl,
+            'stale_until': now + ttl + stale
+        }, ttl + stale)
+
+    def _compute_once(self, key, compute, ttl, stale, cacheable=None):
+        """Singleflight: the first caller for `key` computes, concurrent callers wait for it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait(current_app.config.get('DASHBOARD_CACHE_WAIT_SECONDS', 30))
+            if flight.done.is_set() and not flight.failed:
+                return flight.value
+            return compute()
+
+        try:
+            flight.value = compute()
+            self._store(key, flight.value, ttl, stale, cacheable)
+            return flight.value
+        except Exception:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _refresh_in_background(self, key, compute, ttl, stale, cacheable=None):
+        with self._lock:
+            if key in self._flights:
+                return
+            self._flights[key] = _Flight()
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='dashboard-cache')
+        app = current_app._get_current_object()
+        self._refresher.submit(self._refresh, app, key, compute, ttl, stale, cacheable)
+
+    def _refresh(self, app, key, compute, ttl, stale, cacheable=None):
+        with app.app_context():
+            flight = self._flights.get(key)
+            try:
+                value = compute()
+                self._store(key, value, ttl, stale, cacheable)
+                if flight is not None:
+                    flight.value = value
+            except Exception as e:
+                if flight is not None:
+                    flight.failed = True
+                app.logger.error(f"Dashboard cache refresh of {key} failed: {str(e)}")
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._flights.pop(key, None)
+                if flight is not None:
+                    flight.done.set()
+
+    def invalidate(self, school_id):
+        """Drop every cached dashboard of a school (call after committing a change it shows)"""
+        if school_id is not None:
+            self.backend.bump(school_id)
+
+    def clear(self):
+        self.backend.clear()
+
+
+dashboard_cache = ResponseCache()
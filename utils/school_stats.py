@@ -0,0 +1,156 @@
+"""
+Per-school headline statistics (school_stats), maintained incrementally.
+
+The dashboard reads students / teachers / classes from a single
+school_stats row by primary key. Every write path that changes one of
+those numbers calls a helper here inside its own transaction, so the
+counter moves (or rolls back) together with the data:
+
+    create_user / bulk import    record_users(school_id, students=+n, ...)
+    update_user (is_active)      record_user_activation(user, was_active)
+    add_class                    record_class(school_id)
+
+Counters are adjusted with relative UPDATEs, so concurrent writers never
+overwrite each other. Anything that bypasses these paths (manual SQL,
+imports from other tools) is repaired by
+
+    flask schools reconcile-stats [--school-id N]
+
+Attendance has its own per-day rollup (utils/attendance_rollup.py).
+"""
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Enrollment, School, SchoolClass, SchoolStats, User
+
+COUNTERS = ('students', 'teachers', 'classes', 'active_enrollments')
+
+
+def compute(school_id):
+    """Counter values derived from the source tables (what reconcile writes)"""
+    users = dict(db.session.query(User.role, func.count(User.id)).filter(
+        User.school_id == school_id,
+        User.role.in_(['student', 'teacher']),
+        User.is_active.is_(True)
+    ).group_by(User.role).all())
+
+    classes = db.session.query(func.count(SchoolClass.id)).filter(
+        SchoolClass.school_id == school_id
+    ).scalar()
+
+    active_enrollments = db.session.query(func.count(Enrollment.id)).filter(
+        Enrollment.school_id == school_id,
+        Enrollment.status == 'active'
+    ).scalar()
+
+    return {
+        'students': users.get('student', 0),
+        'teachers': users.get('teacher', 0),
+        'classes': classes or 0,
+        'active_enrollments': active_enrollments or 0,
+    }
+
+
+def reconcile(school_id):
+    """Recompute one school's row from scratch; returns the SchoolStats"""
+    values = compute(school_id)
+    values['reconciled_at'] = values['updated_at'] = datetime.utcnow()
+    stats = db.session.get(SchoolStats, school_id)
+    if stats is None:
+        stats = SchoolStats(school_id=school_id)
+        db.session.add(stats)
+    for column, value in values.items():
+        setattr(stats, column, value)
+    db.session.flush()
+    return stats
+
+
+def get_stats(school_id):
+    """The school's stats row, created from the source tables on first use"""
+    stats = db.session.get(SchoolStats, school_id)
+    if stats is None:
+        stats = reconcile(school_id)
+        db.session.commit()
+    return stats
+
+
+def ensure(school_id):
+    """Create an all-zero row for a newly registered school"""
+    db.session.add(SchoolStats(school_id=school_id))
+
+
+def _adjust(school_id, **values):
+    """
+    Apply one UPDATE to the school's row. A school without a row yet (one
+    that predates the table and was never reconciled) gets one computed
+    from the source tables, which already include the caller's change.
+    """
+    values['updated_at'] = datetime.utcnow()
+    result = db.session.execute(
+        update(SchoolStats).where(SchoolStats.school_id == school_id).values(**values)
+    )
+    if result.rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.flush()
+            reconcile(school_id)
+    except IntegrityError:
+        # Another transaction created the row first; apply our change to it
+        db.session.execute(
+            update(SchoolStats).where(SchoolStats.school_id == school_id).values(**values)
+        )
+
+
+def _delta(**deltas):
+    return {name: getattr(SchoolStats, name) + delta for name, delta in deltas.items() if delta}
+
+
+def record_users(school_id, students=0, teachers=0, active_enrollments=0):
+    values = _delta(students=students, teachers=teachers, active_enrollments=active_enrollments)
+    if values:
+        _adjust(school_id, **values)
+
+
+def record_user_activation(user, was_active):
+    """Count a change of User.is_active"""
+    now_active = bool(user.is_active)
+    if bool(was_active) == now_active or user.role not in ('student', 'teacher'):
+        return
+    step = 1 if now_active else -1
+    record_users(user.school_id, **{f'{user.role}s': step})
+
+
+def record_class(school_id, count=1):
+    _adjust(school_id, **_delta(classes=count))
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+
+schools_cli = AppGroup('schools', help='School maintenance commands')
+
+
+@schools_cli.command('reconcile-stats')
+@click.option('--school-id', type=int, default=None, help='Only reconcile this school.')
+def reconcile_stats_command(school_id):
+    """Recompute school_stats rows from users, classes and enrollments."""
+    query = db.session.query(School.id)
+    if school_id is not None:
+        query = query.filter(School.id == school_id)
+    school_ids = [row[0] for row in query.order_by(School.id)]
+
+    drifted = 0
+    for sid in school_ids:
+        before = db.session.get(SchoolStats, sid)
+        before = {c: getattr(before, c) for c in COUNTERS} if before else None
+        stats = reconcile(sid)
+        if before != {c: getattr(stats, c) for c in COUNTERS}:
+            drifted += 1
+        db.session.commit()
+    click.echo(f"Reconciled {len(school_ids)} school(s), {drifted} had drifted")
@@ -12,6 +12,18 @@ def generate_default_password(length=6):
         if any(c.isdigit() for c in password):
             return password
 
+def generate_secure_password(length=10):
+    """Temporary password for a newly created account (mixed case and a digit)"""
+    alphabet = string.ascii_letters + string.digits
+    while True:
+        password = ''.join(secrets.choice(alphabet) for _ in range(length))
+        if (
+            any(c.islower() for c in password)
+            and any(c.isupper() for c in password)
+            and any(c.isdigit() for c in password)
+        ):
+            return password
+
 def validate_password_complexity(password):
     """Check if password meets complexity requirements"""
     if len(password) < 8:
@@ -0,0 +1,250 @@
+"""
+Login brute-force throttling.
+
+Every password check is a deliberately slow hash, so the login endpoints
+consult this module before they touch the database:
+
+* per client IP (LOGIN_THROTTLE_IP_LIMIT per LOGIN_THROTTLE_IP_WINDOW
+  seconds)
+* per account - (kind, school_id, identifier) - (LOGIN_THROTTLE_ACCOUNT_LIMIT
+  per LOGIN_THROTTLE_ACCOUNT_WINDOW seconds), cleared by a successful login
+
+Only failures count against either. A whole school lab often shares one
+NAT address, so successful logins must never use up the IP allowance.
+
+Both are sliding windows over the timestamps of the last `limit` hits; a key
+is blocked while its oldest remembered hit is still inside the window.
+
+The counters live in a backend chosen by LOGIN_THROTTLE_STORAGE_URL:
+memory:// (per process, the default) or redis://... to share them across
+gunicorn workers and hosts (needs the `redis` package). The client IP is
+request.remote_addr; behind a reverse proxy set PROXY_FIX_X_FOR so it is
+the address the proxy saw rather than the proxy's own.
+
+login_misses remembers identifiers that matched no account for
+LOGIN_NEGATIVE_CACHE_SECONDS so repeated guesses skip the lookup. It lives
+in the shared (redis) backend only, so that the write paths that create or
+reactivate users can drop their keys for every worker; with memory:// it is
+off.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import current_app, jsonify, request
+
+MAX_MEMORY_KEYS = 100_000
+
+
+class MemoryBackend:
+    """Sliding-window logs in a dict of bounded deques, least recently used keys evicted first"""
+
+    shared = False
+
+    def __init__(self, max_keys=MAX_MEMORY_KEYS):
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+
+    def hit(self, key, now, window, limit):
+        with self._lock:
+            log = self._hits.get(key)
+            if log is None or log.maxlen != limit:
+                log = self._hits[key] = deque(log or (), maxlen=limit)
+            self._hits.move_to_end(key)
+            log.append(now)
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+
+    def retry_after(self, key, now, window, limit):
+        with self._lock:
+            log = self._hits.get(key)
+            if log is None:
+                return 0
+            while log and log[0] <= now - window:
+                log.popleft()
+            if not log:
+                del self._hits[key]
+                return 0
+            if len(log) < limit:
+                return 0
+            return log[0] + window - now
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class RedisBackend:
+    """The same sliding-window logs as sorted sets, shared by every worker"""
+
+    shared = True
+
+    def __init__(self, url, prefix='throttle:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('LOGIN_THROTTLE_STORAGE_URL points at redis but the redis package is not installed')
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def hit(self, key, now, window, limit):
+        key = self.prefix + key
+        pipe = self._redis.pipeline()
+        pipe.zadd(key, {repr(now): now})
+        pipe.zremrangebyrank(key, 0, -limit - 1)
+        pipe.expire(key, int(window) + 1)
+        pipe.execute()
+
+    def retry_after(self, key, now, window, limit):
+        key = self.prefix + key
+        pipe = self._redis.pipeline()
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.zrange(key, 0, 0, withscores=True)
+        pipe.zcard(key)
+        _, oldest, count = pipe.execute()
+        if count < limit or not oldest:
+            return 0
+        return oldest[0][1] + window - now
+
+    def reset(self, key):
+        self._redis.delete(self.prefix + key)
+
+    def mark(self, key, ttl):
+        self._redis.set(self.prefix + key, 1, ex=int(ttl))
+
+    def marked(self, key):
+        return bool(self._redis.exists(self.prefix + key))
+
+    def unmark(self, key):
+        self._redis.delete(self.prefix + key)
+
+
+def make_backend(url):
+    if not url or url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f'Unsupported LOGIN_THROTTLE_STORAGE_URL: {url}')
+
+# -----------------------------------------------------------
+# Login throttle
+# -----------------------------------------------------------
+
+def account_key(kind, school_id, identifier):
+    return f'login:{kind}:{school_id}:{(identifier or "").strip().upper()}'
+
+
+def client_ip():
+    # Behind a proxy, ProxyFix (PROXY_FIX_X_FOR) has already set this from the proxy's entry
+    return request.remote_addr or 'unknown'
+
+
+class LoginThrottle:
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = make_backend(current_app.config.get('LOGIN_THROTTLE_STORAGE_URL'))
+        return self._backend
+
+    def _limits(self):
+        config = current_app.config
+        return {
+            'ip': (config.get('LOGIN_THROTTLE_IP_LIMIT', 100), config.get('LOGIN_THROTTLE_IP_WINDOW', 300)),
+            'account': (config.get('LOGIN_THROTTLE_ACCOUNT_LIMIT', 5), config.get('LOGIN_THROTTLE_ACCOUNT_WINDOW', 900)),
+        }
+
+    def _enabled(self):
+        return current_app.config.get('LOGIN_THROTTLE_ENABLED', True)
+
+    def check(self, account=None):
+        """Seconds the caller must wait (0 when the attempt may go ahead)"""
+        if not self._enabled():
+            return 0
+        limits = self._limits()
+        now = time.time()
+        waits = [self.backend.retry_after(f'ip:{client_ip()}', now, limits['ip'][1], limits['ip'][0])]
+        if account:
+            waits.append(self.backend.retry_after(account, now, limits['account'][1], limits['account'][0]))
+        return max(waits)
+
+    def failure(self, account, per_ip=True):
+        """Count a failed attempt against the account and (unless per_ip is false) the client IP"""
+        if self._enabled():
+            limits = self._limits()
+            now = time.time()
+            if per_ip:
+                self.backend.hit(f'ip:{client_ip()}', now, limits['ip'][1], limits['ip'][0])
+            self.backend.hit(account, now, limits['account'][1], limits['account'][0])
+
+    def success(self, account):
+        if self._enabled():
+            self.backend.reset(account)
+
+
+def throttled_response(retry_after):
+    retry_after = max(int(retry_after + 0.999), 1)
+    response = jsonify({
+        'error': 'Too many login attempts',
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+# -----------------------------------------------------------
+# Negative cache for unknown identifiers
+# -----------------------------------------------------------
+
+class MissCache:
+    """
+    Identifiers that matched no account, kept in the shared throttle backend
+    so that creating the account clears them for every worker at once. With
+    the per-process memory backend nothing is cached: the workers that did
+    not create an account would go on rejecting it until their entry expired.
+    """
+
+    def _backend(self):
+        if current_app.config.get('LOGIN_NEGATIVE_CACHE_SECONDS', 60) <= 0:
+            return None
+        backend = login_throttle.backend
+        return backend if backend.shared else None
+
+    @staticmethod
+    def _key(key):
+        return 'miss:' + ':'.join(str(part) for part in key)
+
+    def __contains__(self, key):
+        backend = self._backend()
+        return backend is not None and backend.marked(self._key(key))
+
+    def add(self, key):
+        backend = self._backend()
+        if backend is not None:
+            backend.mark(self._key(key), current_app.config.get('LOGIN_NEGATIVE_CACHE_SECONDS', 60))
+
+    def discard(self, key):
+        backend = self._backend()
+        if backend is not None:
+            backend.unmark(self._key(key))
+
+    def discard_identifiers(self, school_id, admission_number=None, tsc_number=None, national_id=None):
+        """Forget misses that a new (or reactivated) account would now answer"""
+        if admission_number:
+            self.discard(('admission_number', school_id, admission_number))
+        if tsc_number:
+            self.discard(('tsc_number', school_id, tsc_number.upper()))
+        if national_id:
+            self.discard(('national_id', school_id, national_id))
+
+    def discard_user(self, user):
+        self.discard_identifiers(user.school_id, user.admission_number, user.tsc_number, user.national_id)
+
+
+login_throttle = LoginThrottle()
+login_misses = MissCache()
@@ -0,0 +1,168 @@
+"""
+Tutor calendar: overlap detection and free-slot search.
+
+A tutor is busy during their tutoring sessions [time_slot, ends_at) and the
+live classes they teach [start_time, end_time), including every occurrence
+of a recurring class (expanded by utils/recurrence.py). ends_at is stored
+(kept in sync by the mapper events below) so both tables can be searched
+by interval. On Postgres the overlap test is tsrange && tsrange, served by
+GiST indexes on (tutor, period); elsewhere it falls back to the equivalent
+start < other_end AND end > other_start comparison.
+
+Checking for conflicts and then inserting is not atomic, so writers call
+lock_calendar(tutor_id) first: it takes a row lock on the tutor's users
+row until the transaction ends, which serializes bookings per tutor across
+both tables (including recurring classes, which no constraint could cover).
+
+All datetimes are naive UTC, like the rest of the schema.
+"""
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone
+
+from sqlalchemy import event, select
+
+from extensions import db
+from models import TutoringSession, User
+from utils.recurrence import classes_in_window, expand_classes, overlaps
+
+Busy = namedtuple('Busy', 'kind id title start end')
+
+# -----------------------------------------------------------
+# ends_at maintenance
+# -----------------------------------------------------------
+
+def as_utc_naive(value):
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def session_end(time_slot, duration_minutes):
+    # Columns set from request JSON may still hold a numeric string until flushed
+    return time_slot + timedelta(minutes=int(duration_minutes or 60))
+
+
+@event.listens_for(TutoringSession, 'before_insert')
+@event.listens_for(TutoringSession, 'before_update')
+def _set_session_end(mapper, connection, target):
+    target.time_slot = as_utc_naive(target.time_slot)
+    target.ends_at = session_end(target.time_slot, target.duration_minutes)
+
+
+def lock_calendar(tutor_id):
+    """Hold the tutor's calendar until commit/rollback (no-op on SQLite)"""
+    db.session.execute(select(User.id).where(User.id == tutor_id).with_for_update())
+
+# -----------------------------------------------------------
+# Overlap queries
+# -----------------------------------------------------------
+
+def busy_intervals(tutor_id, start, end, exclude_session_id=None, exclude_class_id=None):
+    """Everything the tutor teaches that overlaps [start, end), ordered by start"""
+    start, end = as_utc_naive(start), as_utc_naive(end)
+
+    sessions = db.session.query(
+        TutoringSession.id, TutoringSession.subject, TutoringSession.time_slot, TutoringSession.ends_at
+    ).filter(
+        TutoringSession.tutor_id == tutor_id,
+        TutoringSession.status != 'cancelled',
+        overlaps(TutoringSession.time_slot, TutoringSession.ends_at, start, end)
+    )
+    if exclude_session_id is not None:
+        sessions = sessions.filter(TutoringSession.id != exclude_session_id)
+
+    classes = [c for c in classes_in_window(start, end, teacher_id=tutor_id) if c.id != exclude_class_id]
+
+    busy = [Busy('tutoring_session', *row) for row in sessions.all()]
+    busy += [Busy('live_class', o.live_class.id, o.live_class.title, o.start, o.end)
+             for o in expand_classes(classes, start, end)]
+    return sorted(busy, key=lambda b: (b.start, b.end))
+
+
+def _conflict_dict(b):
+    return {
+        'kind': b.kind,
+        'id': b.id,
+        'title': b.title,
+        'start': b.start.isoformat(),
+        'end': b.end.isoformat()
+    }
+
+
+def find_conflicts(tutor_id, start, end, **exclude):
+    return [_conflict_dict(b) for b in busy_intervals(tutor_id, start, end, **exclude)]
+
+
+def find_series_conflicts(tutor_id, intervals, **exclude):
+    """
+    Conflicts for many (start, end) intervals - e.g. the occurrences of a new
+    recurring class - with one busy lookup over their whole span.
+    """
+    intervals = sorted(intervals)
+    if not intervals:
+        return []
+    busy = busy_intervals(tutor_id, intervals[0][0], max(end for _, end in intervals), **exclude)
+
+    conflicts = []
+    first_open = 0
+    for start, end in intervals:
+        while first_open < len(busy) and busy[first_open].end <= start:
+            first_open += 1
+        for b in busy[first_open:]:
+            if b.start >= end:
+                break
+            if b.end > start:
+                conflicts.append(_conflict_dict(b))
+    return conflicts
+
+# -----------------------------------------------------------
+# Free slots
+# -----------------------------------------------------------
+
+def merge_intervals(intervals):
+    """Sorted, non-overlapping (start, end) pairs covering the input"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slots(tutor_id, first_day, days=7, day_start=time(8), day_end=time(17), min_minutes=30):
+    """
+    Gaps of at least `min_minutes` inside the working window of each day,
+    from one interval query per calendar table for the whole range.
+    """
+    window_start = datetime.combine(first_day, day_start)
+    window_end = datetime.combine(first_day + timedelta(days=days - 1), day_end)
+    busy = merge_intervals((b.start, b.end) for b in busy_intervals(tutor_id, window_start, window_end))
+    min_gap = timedelta(minutes=min_minutes)
+
+    result = []
+    i = 0
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        cursor = datetime.combine(day, day_start)
+        close = datetime.combine(day, day_end)
+        slots = []
+
+        # skip busy blocks that ended before today's window
+        while i < len(busy) and busy[i][1] <= cursor:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < close:
+            block_start, block_end = busy[j]
+            if block_start - cursor >= min_gap:
+                slots.append((cursor, block_start))
+            cursor = max(cursor, block_end)
+            j += 1
+        if close - cursor >= min_gap:
+            slots.append((cursor, close))
+
+        result.append({
+            'date': day.isoformat(),
+            'slots': [{'start': s.isoformat(), 'end': e.isoformat()} for s, e in slots]
+        })
+    return result
@@ -0,0 +1,213 @@
+"""
+Token revocation and cached /api/auth/verify results.
+
+Access tokens never expire (JWT_ACCESS_TOKEN_EXPIRES = False), so the only
+way to kill a leaked one is to revoke it. Revocations are rows in
+revoked_tokens - either one token (jti) or every token of a user issued up
+to a moment (jti NULL) - and each process mirrors them in memory: a set of
+jtis plus a user_id -> cutoff map. The mirror is topped up incrementally
+(rows revoked since the last refresh) at most every
+TOKEN_REVOCATION_REFRESH_SECONDS, so checking a token is a set lookup and
+the table is read by one small indexed query per interval rather than once
+per request. Revocations made
+by this process apply immediately; other processes see them on their next
+refresh.
+
+Each refresh re-reads every row revoked since REREAD_SECONDS before the
+newest one already seen, not just rows with a higher id: ids are handed
+out at INSERT but become visible at COMMIT, so a lower id can show up
+after a higher one. Applying a row twice is harmless. As a backstop the
+whole table is re-read every TOKEN_REVOCATION_RELOAD_SECONDS, so a row
+that even the overlap missed (a very long transaction, clock skew between
+hosts) still takes effect within that bound.
+
+verify_cache keeps the user summary /api/auth/verify returns, keyed by jti,
+for TOKEN_VERIFY_CACHE_SECONDS. Revocation and user updates drop the
+affected entries.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from extensions import db
+from models import RevokedToken
+
+# How far before the newest revocation already seen each refresh re-reads
+REREAD_SECONDS = 60
+
+
+def _epoch(value):
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+class RevocationStore:
+    def __init__(self):
+        self._jtis = set()
+        self._cutoffs = {}
+        self._seen_until = None
+        self._loaded_at = None
+        self._reloaded_at = None
+        self._lock = threading.Lock()
+
+    def _refresh_seconds(self):
+        return current_app.config.get('TOKEN_REVOCATION_REFRESH_SECONDS', 5)
+
+    def _reload_seconds(self):
+        return current_app.config.get('TOKEN_REVOCATION_RELOAD_SECONDS', 600)
+
+    def _apply(self, jti, user_id, revoked_at):
+        if jti:
+            self._jtis.add(jti)
+        elif user_id is not None:
+            # iat has one-second resolution, so a cutoff covers its whole second
+            cutoff = int(_epoch(revoked_at))
+            self._cutoffs[user_id] = max(self._cutoffs.get(user_id, 0), cutoff)
+
+    def refresh(self, force=False):
+        """Pull revocations added since the last refresh"""
+        now = time.monotonic()
+        if not force and self._loaded_at is not None and now - self._loaded_at < self._refresh_seconds():
+            return
+        with self._lock:
+            if not force and self._loaded_at is not None and now - self._loaded_at < self._refresh_seconds():
+                return
+            query = db.session.query(RevokedToken.jti, RevokedToken.user_id, RevokedToken.revoked_at)
+            full = self._seen_until is None or now - self._reloaded_at >= self._reload_seconds()
+            if not full:
+                query = query.filter(RevokedToken.revoked_at >= self._seen_until - timedelta(seconds=REREAD_SECONDS))
+            for jti, user_id, revoked_at in query.all():
+                self._apply(jti, user_id, revoked_at)
+                if self._seen_until is None or revoked_at > self._seen_until:
+                    self._seen_until = revoked_at
+            if full:
+                self._reloaded_at = now
+                if self._seen_until is None:
+                    self._seen_until = datetime.utcnow()
+            self._loaded_at = now
+
+    def is_revoked(self, payload):
+        self.refresh()
+        if payload.get('jti') in self._jtis:
+            return True
+        try:
+            user_id = int(payload.get('sub'))
+        except (TypeError, ValueError):
+            return False
+        cutoff = self._cutoffs.get(user_id)
+        return cutoff is not None and payload.get('iat', 0) <= cutoff
+
+    def revoke_token(self, payload, revoked_by=None, reason=None):
+        """Revoke one decoded token"""
+        try:
+            user_id = int(payload.get('sub'))
+        except (TypeError, ValueError):
+            user_id = None
+        return self._record(RevokedToken(
+            jti=payload['jti'],
+            user_id=user_id,
+            token_type=payload.get('type'),
+            revoked_by=revoked_by,
+            reason=reason
+        ), user_id)
+
+    def revoke_user(self, user_id, revoked_by=None, reason=None):
+        """Revoke every token issued to a user so far; they have to log in again"""
+        return self._record(RevokedToken(
+            user_id=user_id,
+            revoked_by=revoked_by,
+            reason=reason
+        ), user_id)
+
+    def _record(self, revocation, user_id):
+        if revocation.jti and revocation.jti in self._jtis:
+            return None
+        db.session.add(revocation)
+        db.session.commit()
+        with self._lock:
+            self._apply(revocation.jti, revocation.user_id, revocation.revoked_at)
+        if revocation.jti:
+            verify_cache.discard(revocation.jti)
+        elif user_id is not None:
+            verify_cache.discard_user(user_id)
+        return revocation
+
+    def clear(self):
+        with self._lock:
+            self._jtis.clear()
+            self._cutoffs.clear()
+            self._seen_until = None
+            self._loaded_at = None
+            self._reloaded_at = None
+
+
+class VerifyCache:
+    """LRU of jti -> (expires, user summary) with a user_id -> jtis index for invalidation"""
+
+    def __init__(self, max_size=20_000):
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self.max_size = max_size
+
+    def _ttl(self):
+        return current_app.config.get('TOKEN_VERIFY_CACHE_SECONDS', 30)
+
+    def get(self, jti):
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires <= time.monotonic():
+                self._remove(jti)
+                return None
+            self._entries.move_to_end(jti)
+            return user
+
+    def put(self, jti, user):
+        ttl = self._ttl()
+        if not jti or ttl <= 0:
+            return
+        with self._lock:
+            self._remove(jti)
+            self._entries[jti] = (time.monotonic() + ttl, user)
+            self._by_user.setdefault(user['id'], set()).add(jti)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, jti):
+        entry = self._entries.pop(jti, None)
+        if entry is not None:
+            jtis = self._by_user.get(entry[1]['id'])
+            if jtis is not None:
+                jtis.discard(jti)
+                if not jtis:
+                    del self._by_user[entry[1]['id']]
+
+    def discard(self, jti):
+        with self._lock:
+            self._remove(jti)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for jti in list(self._by_user.get(user_id, ())):
+                self._remove(jti)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+
+revocations = RevocationStore()
+verify_cache = VerifyCache()
+
+
+def register_jwt_callbacks(jwt):
+    """Make every @jwt_required endpoint reject revoked tokens"""
+    @jwt.token_in_blocklist_loader
+    def _token_revoked(jwt_header, jwt_payload):
+        return revocations.is_revoked(jwt_payload)
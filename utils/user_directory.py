@@ -0,0 +1,115 @@
+"""
+School user directory: keyset-paginated listing with sparse fieldsets.
+
+Pages are ordered by (last_name, first_name, id) and continue from the last
+row's key, so page N costs the same as page 1. ?fields= narrows both the
+JSON and the columns loaded. Teacher subjects - a dynamic relationship that
+would otherwise be one query per teacher - are fetched for the whole page in
+one query over teacher_subject.
+"""
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
+
+from extensions import db
+from models import Subject, User, teacher_subject
+
+# Public field name -> User column (None for computed fields)
+DIRECTORY_FIELDS = {
+    'id': User.id,
+    'email': User.email,
+    'first_name': User.first_name,
+    'last_name': User.last_name,
+    'phone': User.phone,
+    'role': User.role,
+    'school_id': User.school_id,
+    'admission_number': User.admission_number,
+    'tsc_number': User.tsc_number,
+    'national_id': User.national_id,
+    'grade_level': User.grade_level,
+    'is_active': User.is_active,
+    'created_at': User.created_at,
+    'updated_at': User.updated_at,
+    'must_change_password': User.must_change_password,
+    'subjects': None,
+}
+
+# Always loaded: the sort key, and role to know who has subjects
+KEY_COLUMNS = (User.id, User.last_name, User.first_name, User.role)
+
+
+def parse_fields(raw):
+    """Requested field names (all of them when `raw` is empty); ValueError on unknown ones"""
+    if not raw:
+        return list(DIRECTORY_FIELDS)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in DIRECTORY_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return fields or list(DIRECTORY_FIELDS)
+
+
+def subjects_by_teacher(teacher_ids):
+    """{teacher_id: [{'id', 'name'}, ...]} for many teachers in one query"""
+    result = {teacher_id: [] for teacher_id in teacher_ids}
+    if not teacher_ids:
+        return result
+    rows = db.session.query(
+        teacher_subject.c.teacher_id, Subject.id, Subject.name
+    ).join(
+        Subject, Subject.id == teacher_subject.c.subject_id
+    ).filter(
+        teacher_subject.c.teacher_id.in_(teacher_ids)
+    ).order_by(Subject.name)
+    for teacher_id, subject_id, name in rows:
+        result[teacher_id].append({'id': subject_id, 'name': name})
+    return result
+
+
+def directory_query(school_id, role=None, active_only=True, fields=None):
+    columns = {DIRECTORY_FIELDS[f] for f in (fields or DIRECTORY_FIELDS) if DIRECTORY_FIELDS[f] is not None}
+    query = User.query.options(load_only(*KEY_COLUMNS, *columns)).filter(User.school_id == school_id)
+    if role:
+        query = query.filter(User.role == role)
+    if active_only:
+        query = query.filter(User.is_active == True)
+    return query
+
+
+def _after(key):
+    return tuple_(User.last_name, User.first_name, User.id) > tuple_(*key)
+
+
+def serialize(user, fields, subjects=None):
+    row = {}
+    for field in fields:
+        if field == 'subjects':
+            row['subjects'] = subjects.get(user.id, []) if user.role == 'teacher' and subjects is not None else None
+        else:
+            value = getattr(user, field)
+            row[field] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return row
+
+
+def directory_page(school_id, role=None, active_only=True, limit=50, after=None, fields=None):
+    """
+    One page of a school's users. Returns (rows, next_key, total); next_key
+    is None on the last page.
+    """
+    fields = fields or list(DIRECTORY_FIELDS)
+    query = directory_query(school_id, role, active_only, fields)
+    total = query.order_by(None).with_entities(db.func.count(User.id)).scalar()
+
+    if after is not None:
+        query = query.filter(_after(after))
+    users = query.order_by(User.last_name, User.first_name, User.id).limit(limit + 1).all()
+
+    next_key = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        next_key = (last.last_name, last.first_name, last.id)
+
+    subjects = None
+    if 'subjects' in fields:
+        subjects = subjects_by_teacher([u.id for u in users if u.role == 'teacher'])
+    return [serialize(u, fields, subjects) for u in users], next_key, total